@@ -0,0 +1,4 @@
+"""
+效能基準測試（python -m benchmarks.run）
+外部資料來源由 benchmarks.fake_provider 以行程內的決定性假資料取代，結果可在不同版本間比較
+"""
@@ -0,0 +1,422 @@
+"""
+行程內的假市場資料來源
+以「股票代號 + 資料種類」的 CRC32 為亂數種子產生決定性的日 K、5 分鐘 K、新聞、RSS 與基本面，
+同一個 as_of 日期下每次執行的資料完全相同
+
+install() 期間 yfinance、FinMind / TWSE / SEC EDGAR / Alpha Vantage 查詢與翻譯都改用假資料，
+Google RSS 請求回傳假的 RSS XML（仍經由 feedparser 解析），其他 HTTP 請求一律拒絕，基準測試不會連到外部網路
+"""
+import contextlib
+import time as time_module
+import zlib
+from collections import Counter
+from datetime import date, datetime, time, timedelta
+from email.utils import format_datetime
+from types import SimpleNamespace
+from unittest import mock
+from urllib.parse import parse_qs, quote, urlsplit
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pandas as pd
+import pytz
+
+# yfinance period 參數對應的交易日數
+PERIOD_DAYS = {'1d': 1, '5d': 5, '1mo': 21, '3mo': 63, '6mo': 126, '1y': 252, '2y': 504, '5y': 1260, 'max': 2520}
+# 各市場的時區、開盤時間與每日 5 分鐘 K 棒數
+SESSIONS = {
+    'US': ('America/New_York', time(9, 30), 78),
+    'TW': ('Asia/Taipei', time(9, 0), 54),
+}
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+
+# 新聞標題樣板：語意明確（詞典可直接判定）與不明確（需模型）的中英文標題混合
+HEADLINES = [
+    "{name} shares surge after quarterly results beat estimates",
+    "{name} stock plunges as guidance disappoints investors",
+    "{name} announces new product lineup at annual event",
+    "Analysts weigh {name} valuation ahead of earnings",
+    "{name} downgraded by major broker on margin concerns",
+    "{name} rallies to record high on strong demand",
+    "What to watch for {name} this week",
+    "{name} 營收創高 法人看好後市",
+    "{name} 股價大跌 外資連續賣超",
+    "{name} 召開法說會 說明未來展望",
+    "{name} 調升評等 目標價上修",
+    "{name} 董事會通過年度預算",
+]
+PUBLISHERS = ['Reuters', 'Bloomberg', 'CNBC', '經濟日報', '工商時報', 'MarketWatch']
+
+
+def _seed(*parts):
+    return zlib.crc32(':'.join(str(p) for p in parts).encode('utf-8'))
+
+
+def _rng(*parts):
+    return np.random.default_rng(_seed(*parts))
+
+
+def _market(ticker):
+    return 'TW' if ticker.upper().endswith(('.TW', '.TWO')) else 'US'
+
+
+class FakeMarketData:
+    """
+    決定性的假資料產生器
+
+    Args:
+        as_of (date): 資料的最後一個交易日（預設為今天；新聞與 K 棒都以此日期往回產生）
+        news_per_source (int): Yahoo 新聞與 Google RSS 各回傳的則數
+    """
+
+    def __init__(self, as_of=None, news_per_source=20):
+        self.as_of = as_of or date.today()
+        self.news_per_source = news_per_source
+        # 各上游端點的呼叫次數（可用來比較不同版本每個操作打幾次上游）
+        self.calls = Counter()
+
+    def _business_days(self, count):
+        return pd.bdate_range(end=self.as_of, periods=count)
+
+    def base_price(self, ticker):
+        return float(_rng(ticker, 'base').uniform(20, 600))
+
+    def name(self, ticker):
+        return f"{ticker.split('.')[0]} Holdings Inc."
+
+    def daily_bars(self, ticker, days):
+        """最近 days 個交易日的日 K（幾何隨機漫步）"""
+        index = self._business_days(days)
+        rng = _rng(ticker, 'daily')
+        # 以完整 5 年序列為準再截尾，不同 period 取得的重疊區間價格一致
+        total = max(days, PERIOD_DAYS['max'])
+        returns = rng.normal(0.0003, 0.018, total)
+        close = self.base_price(ticker) * np.exp(np.cumsum(returns))[-days:]
+        spread = np.abs(rng.normal(0, 0.01, total))[-days:]
+        open_ = close * (1 + rng.normal(0, 0.005, total)[-days:])
+        high = np.maximum(open_, close) * (1 + spread)
+        low = np.minimum(open_, close) * (1 - spread)
+        volume = rng.integers(200_000, 20_000_000, total)[-days:]
+        frame = pd.DataFrame(
+            {'Open': open_, 'High': high, 'Low': low, 'Close': close, 'Adj Close': close, 'Volume': volume},
+            index=index,
+        )
+        frame.index.name = 'Date'
+        return frame.round(4)
+
+    def intraday_bars(self, ticker, days=5, start=None):
+        """最近 days 個交易日的 5 分鐘 K（市場時區的 aware index）；start 之前的 K 棒不回傳"""
+        tz_name, open_at, count = SESSIONS[_market(ticker)]
+        tz = pytz.timezone(tz_name)
+        last_close = self.daily_bars(ticker, 1)['Close'].iloc[-1]
+        stamps, closes = [], []
+        rng = _rng(ticker, 'intraday')
+        price = last_close
+        for day in self._business_days(days):
+            session_start = tz.localize(datetime.combine(day.date(), open_at))
+            for i in range(count):
+                price *= 1 + rng.normal(0, 0.0015)
+                stamps.append(session_start + timedelta(minutes=5 * i))
+                closes.append(price)
+        closes = np.array(closes)
+        frame = pd.DataFrame(
+            {'Open': closes * 0.9995, 'High': closes * 1.001, 'Low': closes * 0.999, 'Close': closes,
+             'Volume': rng.integers(1_000, 200_000, len(closes)), 'Dividends': 0.0, 'Stock Splits': 0.0},
+            index=pd.DatetimeIndex(stamps, name='Datetime'),
+        ).round(4)
+        if start is not None:
+            frame = frame[frame.index >= pd.Timestamp(start)]
+        return frame
+
+    def info(self, ticker):
+        rng = _rng(ticker, 'info')
+        bars = self.daily_bars(ticker, 2)
+        return {
+            'symbol': ticker,
+            'longName': self.name(ticker),
+            'shortName': ticker.split('.')[0],
+            'sector': ['Technology', 'Financial Services', 'Healthcare', 'Industrials'][_seed(ticker) % 4],
+            'longBusinessSummary': (
+                f"{self.name(ticker)} designs, manufactures and sells products worldwide.\n"
+                f"The company was founded in {1950 + _seed(ticker) % 70} and is headquartered in Springfield."
+            ),
+            'currentPrice': float(bars['Close'].iloc[-1]),
+            'regularMarketPrice': float(bars['Close'].iloc[-1]),
+            'regularMarketPreviousClose': float(bars['Close'].iloc[-2]),
+            'trailingPE': float(rng.uniform(5, 80)),
+            'forwardPE': float(rng.uniform(5, 60)),
+            'trailingEps': float(rng.uniform(-2, 15)),
+            'beta': float(rng.uniform(0.3, 2.5)),
+            'marketCap': int(rng.integers(10**9, 3 * 10**12)),
+            'dividendYield': float(rng.uniform(0, 0.06)),
+            'returnOnEquity': float(rng.uniform(-0.2, 0.5)),
+            'returnOnAssets': float(rng.uniform(-0.1, 0.2)),
+            'grossMargins': float(rng.uniform(0.1, 0.8)),
+            'operatingMargins': float(rng.uniform(-0.1, 0.4)),
+            'profitMargins': float(rng.uniform(-0.1, 0.3)),
+            'debtToEquity': float(rng.uniform(10, 300)),
+            'quickRatio': float(rng.uniform(0.3, 3)),
+            'priceToBook': float(rng.uniform(0.5, 20)),
+            'freeCashflow': int(rng.integers(-5 * 10**9, 5 * 10**10)),
+            'totalRevenue': int(rng.integers(10**9, 4 * 10**11)),
+            'revenueGrowth': float(rng.uniform(-0.2, 0.5)),
+            'earningsGrowth': float(rng.uniform(-0.5, 1)),
+            'targetMeanPrice': float(bars['Close'].iloc[-1] * rng.uniform(0.8, 1.4)),
+            'recommendationMean': float(rng.uniform(1, 5)),
+            'earningsTimestamp': int(time_module.mktime((self.as_of + timedelta(days=30)).timetuple())),
+        }
+
+    def _statement(self, ticker, kind, rows):
+        rng = _rng(ticker, kind)
+        columns = pd.to_datetime([date(self.as_of.year - i - 1, 12, 31) for i in range(4)])
+        data = {row: rng.uniform(low, high, len(columns)) for row, (low, high) in rows.items()}
+        return pd.DataFrame(data, index=columns).T
+
+    def financials(self, ticker):
+        return self._statement(ticker, 'financials', {
+            'Total Revenue': (1e9, 4e11), 'Net Income': (-1e9, 1e11), 'Operating Income': (-1e9, 1.2e11),
+        })
+
+    def balance_sheet(self, ticker):
+        return self._statement(ticker, 'balance_sheet', {
+            'Total Assets': (5e9, 5e11), 'Stockholders Equity': (1e9, 2e11), 'Total Debt': (1e8, 1e11),
+        })
+
+    def _headline(self, ticker, i):
+        name = ticker.split('.')[0]
+        return f"{HEADLINES[(_seed(ticker) + i) % len(HEADLINES)].format(name=name)} ({i + 1})"
+
+    def _pub_time(self, ticker, i):
+        # 全部落在最近 20 天內（fetch_news_and_analyze 只保留 30 天內的新聞）
+        end = datetime.combine(self.as_of, time(16, 0))
+        return end - timedelta(hours=int(_seed(ticker, 'news', i) % (20 * 24)))
+
+    def news(self, ticker):
+        """yfinance 新版 .news 格式"""
+        items = []
+        for i in range(self.news_per_source):
+            items.append({'content': {
+                'title': self._headline(ticker, i),
+                'clickThroughUrl': {'url': f"https://finance.example.com/{ticker}/{i}"},
+                'provider': {'displayName': PUBLISHERS[(_seed(ticker) + i) % len(PUBLISHERS)]},
+                'pubDate': self._pub_time(ticker, i).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            }})
+        return items
+
+    def rss(self, query):
+        """Google News RSS 搜尋結果（RSS 2.0 XML）"""
+        key = query.split()[0] if query.strip() else 'news'
+        items = []
+        for i in range(self.news_per_source):
+            publisher = PUBLISHERS[i % len(PUBLISHERS)]
+            title = f"{self._headline(key, i + self.news_per_source)} - {publisher}"
+            items.append(
+                f"<item><title>{escape(title)}</title>"
+                f"<link>https://news.example.com/{quote(key)}/{i}</link>"
+                f"<pubDate>{format_datetime(self._pub_time(key, i + self.news_per_source))}</pubDate>"
+                f"<source url=\"https://news.example.com\">{escape(publisher)}</source></item>"
+            )
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel>'
+            f"<title>{escape(query)}</title>{''.join(items)}</channel></rss>"
+        ).encode('utf-8')
+
+    def headlines(self, count, salt='titles'):
+        """基準測試用的不重複新聞標題"""
+        return [self._headline(f"{salt}{i // len(HEADLINES)}", i) for i in range(count)]
+
+    # --- 台股（FinMind / TWSE）---
+
+    def _recent_days(self, days):
+        return [d.strftime('%Y-%m-%d') for d in self._business_days(max(int(days * 5 / 7), 1))]
+
+    def tw_institutional_investors(self, ticker, days=60):
+        rng = _rng(ticker, 'institutional')
+        return [
+            {'date': d, 'foreign_net': int(rng.integers(-5_000_000, 5_000_000)),
+             'trust_net': int(rng.integers(-500_000, 500_000)), 'dealer_net': int(rng.integers(-300_000, 300_000))}
+            for d in self._recent_days(days)
+        ]
+
+    def tw_per_pbr(self, ticker, days=365, source='finmind'):
+        rng = _rng(ticker, 'per_pbr', source)
+        return [
+            {'date': d, 'pe': round(float(rng.uniform(8, 30)), 2), 'pb': round(float(rng.uniform(0.8, 6)), 2),
+             'dividend_yield': round(float(rng.uniform(0, 6)), 2), 'source': source}
+            for d in self._recent_days(days)
+        ]
+
+    def tw_monthly_revenue(self, ticker, months=12):
+        rng = _rng(ticker, 'monthly_revenue')
+        result = []
+        year, month = self.as_of.year, self.as_of.month
+        for _ in range(months):
+            month -= 1
+            if month == 0:
+                year, month = year - 1, 12
+            result.append({'date': f"{year}-{month:02d}-10", 'year': year, 'month': month,
+                           'revenue': int(rng.integers(10**9, 3 * 10**11)), 'source': 'finmind'})
+        return result[::-1]
+
+    def tw_margin_trading(self, ticker, days=90):
+        rng = _rng(ticker, 'margin')
+        return [
+            {'date': d, 'margin_balance': int(rng.integers(1_000, 100_000)),
+             'short_balance': int(rng.integers(100, 20_000)), 'source': 'finmind'}
+            for d in self._recent_days(days)
+        ]
+
+    # --- 美股備援來源（SEC EDGAR / Alpha Vantage）---
+
+    def sec_financials(self, ticker):
+        rng = _rng(ticker, 'sec')
+        return {
+            'revenue': float(rng.uniform(1e9, 4e11)), 'net_income': float(rng.uniform(-1e9, 1e11)),
+            'eps': float(rng.uniform(-2, 15)), 'assets': float(rng.uniform(5e9, 5e11)),
+            'liabilities': float(rng.uniform(1e9, 3e11)), 'stockholders_equity': float(rng.uniform(1e9, 2e11)),
+            'source': 'sec_edgar',
+        }
+
+    def alpha_vantage_metrics(self, ticker):
+        info = self.info(ticker)
+        return {
+            'pe_ratio': info['trailingPE'] * 1.01, 'peg_ratio': None, 'price_to_book': info['priceToBook'],
+            'roe': info['returnOnEquity'], 'roa': info['returnOnAssets'], 'profit_margin': info['profitMargins'],
+            'operating_margin': info['operatingMargins'], 'gross_margin': info['grossMargins'],
+            'eps': info['trailingEps'], 'beta': info['beta'], 'analyst_target': info['targetMeanPrice'],
+            'source': 'alpha_vantage',
+        }
+
+
+class FakeTicker:
+    """yfinance.Ticker 的替身（只實作本專案用到的屬性）"""
+
+    def __init__(self, provider, ticker):
+        self._provider = provider
+        self.ticker = ticker
+
+    def _call(self, endpoint):
+        self._provider.calls[f'yfinance.{endpoint}'] += 1
+
+    @property
+    def info(self):
+        self._call('info')
+        return self._provider.info(self.ticker)
+
+    @property
+    def fast_info(self):
+        self._call('fast_info')
+        bars = self._provider.daily_bars(self.ticker, 2)
+        return SimpleNamespace(last_price=float(bars['Close'].iloc[-1]), previous_close=float(bars['Close'].iloc[-2]))
+
+    @property
+    def news(self):
+        self._call('news')
+        return self._provider.news(self.ticker)
+
+    @property
+    def financials(self):
+        self._call('financials')
+        return self._provider.financials(self.ticker)
+
+    @property
+    def balance_sheet(self):
+        self._call('balance_sheet')
+        return self._provider.balance_sheet(self.ticker)
+
+    @property
+    def calendar(self):
+        self._call('calendar')
+        return {'Earnings Date': [self._provider.as_of + timedelta(days=30)]}
+
+    def history(self, period='1mo', interval='1d', start=None, end=None, **kwargs):
+        self._call('history')
+        if interval == '1d':
+            return self._provider.daily_bars(self.ticker, PERIOD_DAYS.get(period, 21))
+        days = int(period[:-1]) if start is None and period.endswith('d') else 5
+        return self._provider.intraday_bars(self.ticker, days=min(days, 5), start=start)
+
+
+class FakeTranslator:
+    """deep_translator.GoogleTranslator 的替身：中文原樣回傳，其他語言加上固定前綴"""
+
+    def __init__(self, provider, source='auto', target='zh-TW'):
+        self._provider = provider
+
+    def translate(self, text):
+        self._provider.calls['translate'] += 1
+        if not text or any('一' <= ch <= '鿿' for ch in text):
+            return text
+        return f"（譯）{text}"
+
+
+def _download(provider, tickers, period='1mo', interval='1d', group_by='column', **kwargs):
+    """yfinance.download 的替身；欄位結構與新版 yfinance 相同（MultiIndex）"""
+    provider.calls['yfinance.download'] += 1
+    days = PERIOD_DAYS.get(period, 21)
+    if isinstance(tickers, str):
+        frame = provider.daily_bars(tickers, days)
+        frame.columns = pd.MultiIndex.from_product([frame.columns, [tickers]], names=['Price', 'Ticker'])
+        return frame
+    frames = {ticker: provider.daily_bars(ticker, days) for ticker in tickers}
+    if group_by == 'ticker':
+        return pd.concat(frames, axis=1, names=['Ticker', 'Price'])
+    return pd.concat(frames, axis=1, names=['Ticker', 'Price']).swaplevel(axis=1).sort_index(axis=1)
+
+
+def _route_http(provider):
+    """requests 的替身：Google News RSS 回傳假資料，其餘請求一律拒絕"""
+    import requests
+
+    def request(session, method, url, *args, **kwargs):
+        parts = urlsplit(url)
+        if parts.netloc == 'news.google.com' and parts.path.startswith('/rss'):
+            provider.calls['rss'] += 1
+            response = requests.Response()
+            response.status_code = 200
+            response.url = url
+            response.headers['Content-Type'] = 'application/rss+xml; charset=utf-8'
+            response._content = provider.rss(parse_qs(parts.query).get('q', [''])[0])
+            return response
+        raise requests.exceptions.ConnectionError(f'benchmarks: outbound HTTP is disabled ({url})')
+
+    return request
+
+
+def _counted(provider, name, func):
+    def wrapper(*args, **kwargs):
+        provider.calls[name] += 1
+        return func(*args, **kwargs)
+    return wrapper
+
+
+@contextlib.contextmanager
+def install(provider=None):
+    """
+    以假資料取代所有外部資料來源
+
+    Yields:
+        FakeMarketData: 使用中的假資料產生器（calls 可查詢各端點呼叫次數）
+    """
+    provider = provider or FakeMarketData()
+    data_sources = {
+        'get_tw_stock_name': lambda ticker: f"測試{ticker.split('.')[0]}",
+        'get_tw_revenue_finmind': lambda ticker: provider.tw_monthly_revenue(ticker, 1)[-1]['revenue'],
+        'get_tw_institutional_investors': provider.tw_institutional_investors,
+        'get_tw_per_pbr_finmind': provider.tw_per_pbr,
+        'get_tw_per_pbr_twse': lambda ticker: provider.tw_per_pbr(ticker, days=7, source='twse'),
+        'get_tw_monthly_revenue_finmind': provider.tw_monthly_revenue,
+        'get_tw_margin_trading_finmind': provider.tw_margin_trading,
+        'get_us_financials_sec_edgar': provider.sec_financials,
+        'get_us_metrics_alpha_vantage': provider.alpha_vantage_metrics,
+    }
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(mock.patch('yfinance.Ticker', lambda ticker, *a, **kw: FakeTicker(provider, ticker)))
+        stack.enter_context(mock.patch('yfinance.download', lambda *a, **kw: _download(provider, *a, **kw)))
+        for name, func in data_sources.items():
+            stack.enter_context(mock.patch(f'stocks.data_sources.{name}', _counted(provider, name, func)))
+        stack.enter_context(mock.patch(
+            'deep_translator.GoogleTranslator', lambda *a, **kw: FakeTranslator(provider, *a, **kw)
+        ))
+        stack.enter_context(mock.patch('requests.Session.request', _route_http(provider)))
+        yield provider
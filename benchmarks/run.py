@@ -0,0 +1,450 @@
+"""
+效能基準測試
+
+    python -m benchmarks.run                       # 完整規模
+    python -m benchmarks.run --quick               # 小規模（開發時快速確認）
+    python -m benchmarks.run --compare benchmarks/results/baseline.json
+
+在獨立的測試資料庫（與 manage.py test 相同的建立方式）上，以 benchmarks.fake_provider 的決定性假資料量測：
+  - ingestion: fetch_stock_data_sync 的寫入速度（rows/s），以及資料未變動時的重新抓取
+  - dashboard: 不同追蹤清單大小下的儀表板渲染時間與 SQL 查詢數
+  - stock_detail_api: 美股 / 台股詳細資料 API 的延遲（median / p95）
+  - sentiment: analyze_batch 的標題吞吐量（冷快取與熱快取；未安裝 torch 時只量測詞典分類器）
+
+--cassette 改以 stocks.http_cassette 重播真實上游回應（--record-cassette 先錄製），需以 --tickers 指定錄製時的股票
+
+結果寫成 JSON（預設 benchmarks/results/<時間>-<commit>.json）；metrics 為扁平的 {名稱: {value, unit, better}}，
+--compare 會與基準檔逐項比較，超過 --threshold 的退步以非零結束碼回報
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date, datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / 'results'
+
+PROFILES = {
+    'quick': {'tickers': 6, 'watchlist_sizes': [10, 50, 200], 'requests': 10, 'titles': 500},
+    'full': {'tickers': 40, 'watchlist_sizes': [10, 100, 500, 2000], 'requests': 50, 'titles': 5000},
+}
+BENCH_CACHES = {
+    name: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': f'bench-{name}'}
+    for name in ('default', 'quotes', 'events')
+}
+
+
+def setup_django():
+    sys.path.insert(0, str(ROOT))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'stock_dashboard.settings')
+    # 情緒模型只從本機快取載入，不下載
+    os.environ.setdefault('HF_HUB_OFFLINE', '1')
+    os.environ.setdefault('TRANSFORMERS_OFFLINE', '1')
+    import django
+    django.setup()
+
+
+def summarize(samples):
+    """毫秒統計（median / p95 / min）"""
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    return {
+        'median_ms': round(statistics.median(ordered) * 1000, 3),
+        'p95_ms': round(p95 * 1000, 3),
+        'min_ms': round(ordered[0] * 1000, 3),
+        'n': len(ordered),
+    }
+
+
+@contextlib.contextmanager
+def quiet(enabled=True):
+    """擷取各模組的 print 與警告 log，避免干擾計時與結果顯示"""
+    if not enabled:
+        yield
+        return
+    logging.disable(logging.WARNING)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        logging.disable(logging.NOTSET)
+
+
+def synthetic_tickers(count):
+    """一半美股、一半台股的合成代號（不會與真實股票混淆）"""
+    us = [f"BMK{i:03d}" for i in range((count + 1) // 2)]
+    tw = [f"{9000 + i}.TW" for i in range(count // 2)]
+    return us + tw
+
+
+@contextlib.contextmanager
+def cassette_source(path, mode, latency):
+    """以 HTTP cassette 錄製或重播真實上游回應"""
+    import tempfile
+
+    import yfinance as yf
+
+    from stocks.http_cassette import use_cassette
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # yfinance 的時區 / cookie 快取會省略部分請求；錄製與重播都從空快取開始，發出的請求才會相同
+        yf.set_tz_cache_location(cache_dir)
+        with use_cassette(path, mode=mode, latency=latency) as cassette:
+            yield cassette
+
+
+class Benchmarks:
+    """
+    Args:
+        provider: FakeMarketData（產生儀表板用的填充資料；未使用 cassette 時也是上游資料來源）
+        calls: 上游呼叫計數（假資料為各端點、cassette 為各主機）
+    """
+
+    def __init__(self, provider, profile, calls, verbose=False):
+        self.provider = provider
+        self.profile = profile
+        self.calls = calls
+        self.verbose = verbose
+        self.metrics = {}
+        self.details = {}
+
+    def metric(self, name, value, unit, better):
+        self.metrics[name] = {'value': round(value, 3), 'unit': unit, 'better': better}
+
+    def ingestion(self, tickers):
+        from stocks.models import IntradayBar, Stock, StockNews, StockPrice
+        from stocks.tasks import fetch_stock_data_sync
+
+        Stock.objects.bulk_create([
+            Stock(ticker=t, market='TW' if t.endswith('.TW') else 'US') for t in tickers
+        ])
+
+        def run_all():
+            per_ticker = []
+            started = time.perf_counter()
+            for ticker in tickers:
+                t0 = time.perf_counter()
+                with quiet(not self.verbose):
+                    fetch_stock_data_sync(ticker)
+                per_ticker.append(time.perf_counter() - t0)
+            return time.perf_counter() - started, per_ticker
+
+        calls_before = self.calls.copy()
+        elapsed, per_ticker = run_all()
+        rows = {
+            'prices': StockPrice.objects.count(),
+            'intraday': IntradayBar.objects.count(),
+            'news': StockNews.objects.count(),
+        }
+        upstream = self.calls - calls_before
+        # 再抓一次：K 棒與基本面皆未變動，量測 upsert 與變動偵測的成本
+        refresh_elapsed, refresh_per_ticker = run_all()
+
+        self.metric('ingestion.rows_per_s', rows['prices'] / elapsed, 'rows/s', 'higher')
+        self.metric('ingestion.ticker_ms', statistics.median(per_ticker) * 1000, 'ms', 'lower')
+        self.metric('ingestion.refresh_ticker_ms', statistics.median(refresh_per_ticker) * 1000, 'ms', 'lower')
+        self.details['ingestion'] = {
+            'tickers': len(tickers),
+            'rows': rows,
+            'seconds': round(elapsed, 3),
+            'refresh_seconds': round(refresh_elapsed, 3),
+            'per_ticker': summarize(per_ticker),
+            'refresh_per_ticker': summarize(refresh_per_ticker),
+            'upstream_calls_per_ticker': {k: round(v / len(tickers), 2) for k, v in sorted(upstream.items())},
+        }
+
+    def _filler_stocks(self, count):
+        """儀表板用的追蹤標的：每支 30 個交易日的日 K 與摘要"""
+        from stocks.models import Stock, StockPrice
+        from stocks.utils import update_stock_summary
+
+        stocks = list(Stock.objects.order_by('id')[:count])
+        needed = count - len(stocks)
+        if needed <= 0:
+            return stocks
+        start = Stock.objects.count()
+        created = Stock.objects.bulk_create([
+            Stock(ticker=f"FILL{start + i:05d}", name=f"Filler {start + i}", market='US',
+                  last_price=100, change=1, change_percent=1)
+            for i in range(needed)
+        ])
+        created = list(Stock.objects.filter(ticker__in=[s.ticker for s in created]))
+        prices = []
+        for stock in created:
+            bars = self.provider.daily_bars(stock.ticker, 30)
+            prices.extend(
+                StockPrice(stock=stock, date=index.date(), open=round(row.Open, 2), high=round(row.High, 2),
+                           low=round(row.Low, 2), close=round(row.Close, 2), volume=int(row.Volume))
+                for index, row in zip(bars.index, bars.itertuples())
+            )
+        StockPrice.objects.bulk_create(prices, batch_size=2000)
+        for stock in created:
+            update_stock_summary(stock)
+        return stocks + created
+
+    def dashboard(self):
+        from django.contrib.auth import get_user_model
+        from django.db import connection
+        from django.test import Client
+        from django.test.utils import CaptureQueriesContext
+        from django.urls import reverse
+        from stocks.models import Watchlist
+
+        User = get_user_model()
+        url = reverse('dashboard')
+        results = {}
+        for size in self.profile['watchlist_sizes']:
+            stocks = self._filler_stocks(size)
+            user = User.objects.create_user(username=f'bench_{size}', password='bench-password')
+            Watchlist.objects.bulk_create([Watchlist(user=user, stock=stock) for stock in stocks[:size]])
+            client = Client()
+            client.force_login(user)
+
+            for variant, query in (('default', '?per_page=50'), ('sorted', '?per_page=50&sort_by=change_percent')):
+                with quiet(not self.verbose):
+                    client.get(url + query)  # 暖機（模板編譯、連線）
+                    samples = []
+                    for _ in range(self.profile['requests']):
+                        started = time.perf_counter()
+                        response = client.get(url + query)
+                        samples.append(time.perf_counter() - started)
+                    with CaptureQueriesContext(connection) as queries:
+                        client.get(url + query)
+                if response.status_code != 200:
+                    raise RuntimeError(f'dashboard returned {response.status_code}')
+                stats = summarize(samples)
+                stats['queries'] = len(queries)
+                results[f'{size}.{variant}'] = stats
+                self.metric(f'dashboard.{variant}.{size}.median_ms', stats['median_ms'], 'ms', 'lower')
+                self.metric(f'dashboard.{variant}.{size}.queries', stats['queries'], 'queries', 'lower')
+        self.details['dashboard'] = results
+
+    def stock_detail_api(self, tickers):
+        from django.contrib.auth import get_user_model
+        from django.db import connection
+        from django.test import Client
+        from django.test.utils import CaptureQueriesContext
+        from django.urls import reverse
+
+        user = get_user_model().objects.create_user(username='bench_detail', password='bench-password')
+        client = Client()
+        client.force_login(user)
+        results = {}
+        for market, sample in (('US', [t for t in tickers if not t.endswith('.TW')]),
+                               ('TW', [t for t in tickers if t.endswith('.TW')])):
+            if not sample:
+                continue
+            samples = []
+            with quiet(not self.verbose):
+                for i in range(self.profile['requests']):
+                    url = reverse('stock_detail_api', args=[sample[i % len(sample)]])
+                    started = time.perf_counter()
+                    response = client.get(url)
+                    samples.append(time.perf_counter() - started)
+                    if response.status_code != 200:
+                        raise RuntimeError(f'stock_detail_api returned {response.status_code} for {url}')
+                with CaptureQueriesContext(connection) as queries:
+                    client.get(reverse('stock_detail_api', args=[sample[0]]))
+            stats = summarize(samples)
+            stats['queries'] = len(queries)
+            results[market] = stats
+            self.metric(f'stock_detail_api.{market}.median_ms', stats['median_ms'], 'ms', 'lower')
+            self.metric(f'stock_detail_api.{market}.p95_ms', stats['p95_ms'], 'ms', 'lower')
+            self.metric(f'stock_detail_api.{market}.queries', stats['queries'], 'queries', 'lower')
+        self.details['stock_detail_api'] = results
+
+    def sentiment(self):
+        titles = self.provider.headlines(self.profile['titles'])
+        from stocks import sentiment
+
+        batch = 32
+        sentiment.clear_cache()
+        loads_before = sentiment._model_state['loads']
+
+        def run():
+            started = time.perf_counter()
+            with quiet(not self.verbose):
+                for i in range(0, len(titles), batch):
+                    sentiment.analyze_batch(titles[i:i + batch])
+            return time.perf_counter() - started
+
+        cold = run()
+        warm = run()
+        self.metric('sentiment.cold_titles_per_s', len(titles) / cold, 'titles/s', 'higher')
+        self.metric('sentiment.warm_titles_per_s', len(titles) / warm, 'titles/s', 'higher')
+        self.details['sentiment'] = {
+            'titles': len(titles),
+            'batch': batch,
+            # 模型無法載入（未安裝 torch 或無本機快取）時 analyze_batch 只走詞典備援，兩種結果不可直接比較
+            'model_available': sentiment.torch is not None,
+            'model_loaded': sentiment._model_state['loads'] > loads_before,
+            'lexicon': sentiment.get_lexicon_stats(),
+            'cache': sentiment.get_cache_stats(),
+        }
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                                    capture_output=True, text=True).stdout.strip())
+        return {'commit': commit, 'dirty': dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+
+
+def environment():
+    import django
+    from django.conf import settings
+    from django.db import connection
+    from stocks import partitioning
+
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'platform': platform.platform(),
+        'database': connection.vendor,
+        'stockprice_partitioning': partitioning.current_scheme(),
+        'settings': {
+            name: getattr(settings, name, None)
+            for name in ('TIMESERIES_BACKEND', 'SENTIMENT_LEXICON_ENABLED')
+        },
+    }
+
+
+def compare(current, baseline, threshold):
+    """
+    逐項比較 metrics，回傳退步的項目名稱
+    better='lower' 的指標增加超過 threshold（比例）、'higher' 的指標減少超過 threshold 即視為退步
+    """
+    regressions = []
+    print(f"\n{'metric':<45} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name, entry in sorted(current['metrics'].items()):
+        old = baseline.get('metrics', {}).get(name)
+        if old is None or not old['value']:
+            continue
+        change = (entry['value'] - old['value']) / old['value']
+        worse = change > threshold if entry['better'] == 'lower' else change < -threshold
+        flag = '  REGRESSION' if worse else ''
+        print(f"{name:<45} {old['value']:>12,.3f} {entry['value']:>12,.3f} {change:>+8.1%}{flag}")
+        if worse:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the stock dashboard benchmark suite against a fake provider.')
+    parser.add_argument('--quick', action='store_true', help='Small sizes for a fast local check.')
+    parser.add_argument('--only', nargs='+', choices=['ingestion', 'dashboard', 'stock_detail_api', 'sentiment'],
+                        help='Run only these benchmarks (stock_detail_api also runs ingestion).')
+    parser.add_argument('--as-of', type=date.fromisoformat, help='Last trading day of the synthetic data.')
+    parser.add_argument('--output', help='Result JSON path (default benchmarks/results/<time>-<commit>.json).')
+    parser.add_argument('--compare', help='Baseline result JSON to compare against.')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Relative change that counts as a regression (default 0.2 = 20%%).')
+    parser.add_argument('--cassette', help='Replay upstream HTTP from this cassette instead of the fake provider.')
+    parser.add_argument('--record-cassette', help='Run against the live upstreams and record them to this cassette.')
+    parser.add_argument('--latency', default=None,
+                        help="Latency injected on replay: 'recorded' or milliseconds (default none).")
+    parser.add_argument('--tickers', nargs='+', help='Tickers to ingest (required with a cassette).')
+    parser.add_argument('--verbose', action='store_true', help='Show output printed by the application code.')
+    args = parser.parse_args(argv)
+    if (args.cassette or args.record_cassette) and not args.tickers:
+        parser.error('--tickers is required with --cassette / --record-cassette')
+
+    setup_django()
+    from django.test.runner import DiscoverRunner
+    from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+    from benchmarks.fake_provider import FakeMarketData, install
+    from stocks.http_cassette import parse_latency
+
+    profile_name = 'quick' if args.quick else 'full'
+    profile = PROFILES[profile_name]
+    selected = set(args.only or ['ingestion', 'dashboard', 'stock_detail_api', 'sentiment'])
+    provider = FakeMarketData(as_of=args.as_of)
+    tickers = args.tickers or synthetic_tickers(profile['tickers'])
+    if args.cassette or args.record_cassette:
+        mode, path = ('replay', args.cassette) if args.cassette else ('record', args.record_cassette)
+        source_name = f'cassette-{mode}'
+        source = cassette_source(path, mode, parse_latency(args.latency))
+    else:
+        source_name = 'fake'
+        source = install(provider)
+
+    setup_test_environment()
+    runner = DiscoverRunner(verbosity=0, interactive=False)
+    old_config = runner.setup_databases()
+    try:
+        with override_settings(CACHES=BENCH_CACHES), source as upstream:
+            calls = upstream.calls if source_name == 'fake' else upstream.stats
+            bench = Benchmarks(provider, profile, calls, verbose=args.verbose)
+            if selected & {'ingestion', 'stock_detail_api'}:
+                print(f"[Bench] ingestion ({len(tickers)} tickers)...")
+                bench.ingestion(tickers)
+            if 'dashboard' in selected:
+                print(f"[Bench] dashboard (watchlists {profile['watchlist_sizes']})...")
+                bench.dashboard()
+            if 'stock_detail_api' in selected:
+                print(f"[Bench] stock_detail_api ({profile['requests']} requests per market)...")
+                bench.stock_detail_api(tickers)
+            if 'sentiment' in selected:
+                print(f"[Bench] sentiment ({profile['titles']} titles)...")
+                bench.sentiment()
+            env = environment()
+            env['upstream'] = {'source': source_name}
+            if source_name != 'fake':
+                env['upstream'].update({'cassette': str(upstream.path), 'latency': args.latency,
+                                        'misses': dict(upstream.misses)})
+                if upstream.misses:
+                    print(f"[Bench] warning: requests missing from the cassette: {dict(upstream.misses)}")
+    finally:
+        runner.teardown_databases(old_config)
+        teardown_test_environment()
+
+    revision = git_revision()
+    result = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'profile': profile_name,
+        'as_of': provider.as_of.isoformat(),
+        'git': revision,
+        'environment': env,
+        'metrics': bench.metrics,
+        'details': bench.details,
+    }
+
+    for name, entry in sorted(bench.metrics.items()):
+        print(f"{name:<45} {entry['value']:>12,.3f} {entry['unit']}")
+
+    output = Path(args.output) if args.output else (
+        RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}-{revision['commit'] or 'nogit'}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2, ensure_ascii=False, default=str), encoding='utf-8')
+    print(f"[Bench] results written to {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('profile') != profile_name:
+            print(f"[Bench] warning: baseline profile {baseline.get('profile')!r} differs from {profile_name!r}")
+        regressions = compare(result, baseline, args.threshold)
+        if regressions:
+            print(f"[Bench] {len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}")
+            return 1
+        print('[Bench] no regressions')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
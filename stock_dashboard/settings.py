@@ -36,12 +36,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "stocks.middleware.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "stocks.middleware.ProfilerMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -105,4 +107,119 @@ EMAIL_FILE_PATH = BASE_DIR / 'sent_emails'
 
 # Login/Logout redirect settings
 LOGIN_REDIRECT_URL = '/stocks/dashboard/'
-LOGOUT_REDIRECT_URL = '/users/login/'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = '/users/login/'
+
+# Sentiment analysis
+# 記憶體快取層可保留的標題數量（超過時以 LRU 淘汰，資料庫層不受影響）
+SENTIMENT_CACHE_SIZE = int(os.environ.get('SENTIMENT_CACHE_SIZE', '5000'))
+# 模型閒置超過此秒數即自動卸載釋放記憶體（0 表示常駐不卸載）
+SENTIMENT_MODEL_IDLE_TTL = int(os.environ.get('SENTIMENT_MODEL_IDLE_TTL', '600'))
+# 預熱任務排在下一輪每小時資料抓取（含新聞）之前的秒數
+SENTIMENT_WARMUP_LEAD = int(os.environ.get('SENTIMENT_WARMUP_LEAD', '120'))
+# 詞典快速路徑：語意明確的標題（如「創新高」、"plunges"）不經模型直接判定
+SENTIMENT_LEXICON_ENABLED = os.environ.get('SENTIMENT_LEXICON_ENABLED', 'True').lower() in ('true', '1', 'yes')
+# 自訂詞典 JSON（格式同 stocks/sentiment_lexicon.DEFAULT_LEXICON），未設定則使用內建詞典
+SENTIMENT_LEXICON_PATH = os.environ.get('SENTIMENT_LEXICON_PATH') or None
+# 詞典已判定的標題中，抽樣送進模型比對一致率的比例
+SENTIMENT_LEXICON_AUDIT_RATE = float(os.environ.get('SENTIMENT_LEXICON_AUDIT_RATE', '0.05'))
+
+# Columnar price store
+# 啟用後日 K 另存為 mmap 欄位檔，圖表與技術指標直接讀取陣列切片（需由資料抓取流程同步）
+COLUMNAR_STORE_ENABLED = os.environ.get('COLUMNAR_STORE_ENABLED', 'False').lower() in ('true', '1', 'yes')
+COLUMNAR_STORE_DIR = Path(os.environ.get('COLUMNAR_STORE_DIR', BASE_DIR / 'columnar_store'))
+
+# StockPrice partitioning (PostgreSQL only)
+# 以 manage.py partition_prices --convert year|hash 轉換（維護時段執行），依年份分區時定期執行 partition_prices 建立新年份分區
+STOCKPRICE_HASH_PARTITIONS = int(os.environ.get('STOCKPRICE_HASH_PARTITIONS', '16'))
+STOCKPRICE_PARTITION_YEARS_AHEAD = int(os.environ.get('STOCKPRICE_PARTITION_YEARS_AHEAD', '1'))
+
+# Time-series backend
+# 'relational'：只使用 StockPrice / TechnicalIndicator；'influxdb'：另鏡像寫入 InfluxDB，聚合查詢改由 InfluxDB 處理
+TIMESERIES_BACKEND = os.environ.get('TIMESERIES_BACKEND', 'relational')
+INFLUXDB_URL = os.environ.get('INFLUXDB_URL', 'http://localhost:8086')
+INFLUXDB_TOKEN = os.environ.get('INFLUXDB_TOKEN', '')
+INFLUXDB_ORG = os.environ.get('INFLUXDB_ORG', 'finance_dashboard')
+INFLUXDB_BUCKET = os.environ.get('INFLUXDB_BUCKET', 'stocks')
+INFLUXDB_BATCH_SIZE = int(os.environ.get('INFLUXDB_BATCH_SIZE', '5000'))
+
+# Intraday bars
+# 盤中 5 分鐘 K 棒的保留天數與背景更新間隔（秒）；收盤後的緩衝時間內仍會再抓一次以補齊最後一根 K 棒
+INTRADAY_RETENTION_DAYS = int(os.environ.get('INTRADAY_RETENTION_DAYS', '5'))
+INTRADAY_UPDATE_INTERVAL = int(os.environ.get('INTRADAY_UPDATE_INTERVAL', '300'))
+INTRADAY_CLOSE_GRACE_MINUTES = int(os.environ.get('INTRADAY_CLOSE_GRACE_MINUTES', '10'))
+
+# Financial alerts
+# 自訂警示規則 JSON（規則陣列，格式同 stocks/alerts.DEFAULT_RULES），會取代內建規則；變更後執行 manage.py rebuild_alerts
+FINANCIAL_ALERT_RULES_PATH = os.environ.get('FINANCIAL_ALERT_RULES_PATH') or None
+
+# Exchange calendar
+# 自訂假日檔 JSON（格式同 stocks/data/market_holidays.json），會覆蓋預設檔中對應市場的假日與提前收盤
+MARKET_HOLIDAYS_PATH = os.environ.get('MARKET_HOLIDAYS_PATH') or None
+
+# Upstream HTTP cassettes
+# 'record'：照常連線並把所有上游回應寫入 HTTP_CASSETTE_PATH（gzip JSON Lines）；'replay'：不連線，改由錄製檔回放
+# HTTP_CASSETTE_LATENCY：重播時注入的延遲，'recorded' 為錄製時的實際耗時，數字為固定毫秒數
+HTTP_CASSETTE_MODE = os.environ.get('HTTP_CASSETTE_MODE', '')
+HTTP_CASSETTE_PATH = Path(os.environ.get('HTTP_CASSETTE_PATH', BASE_DIR / 'cassettes' / 'upstream.jsonl.gz'))
+HTTP_CASSETTE_LATENCY = os.environ.get('HTTP_CASSETTE_LATENCY', '')
+
+# Fetch run history
+# 每次資料抓取的各階段耗時、寫入筆數與上游請求寫入 FetchRun（/stocks/admin/fetch-runs/ 可查看最慢的股票與階段）
+FETCH_RUNS_ENABLED = os.environ.get('FETCH_RUNS_ENABLED', 'True').lower() in ('true', '1', 'yes')
+FETCH_RUN_RETENTION_DAYS = int(os.environ.get('FETCH_RUN_RETENTION_DAYS', '7'))
+
+# Metrics
+# /metrics（Prometheus 格式）；web 與 process_tasks 各行程每 METRICS_FLUSH_INTERVAL 秒把累計值寫入 METRICS_DIR，讀取時合併
+# METRICS_DIR 需為所有行程共用的目錄（例如 /run 下、部署時清空）；留空（預設）則只回報處理該請求的行程
+# 預設拒絕存取：需以 Bearer METRICS_TOKEN、staff 帳號，或來自 METRICS_ALLOWED_IPS（逗號分隔）的位址
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True').lower() in ('true', '1', 'yes')
+METRICS_DIR = os.environ.get('METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', '10'))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.environ.get('METRICS_ALLOWED_IPS', '').split(',') if ip.strip()]
+
+# Request profiler
+# 開啟後 staff 帳號的請求帶 X-Profile: 1 標頭或 ?_profile=1 即剖析該請求：回應加上 X-Profile / Server-Timing 摘要，
+# 取樣堆疊（collapsed stack，可直接產生火焰圖）與 SQL / 上游請求明細寫入 PROFILER_DIR，只保留最近 PROFILER_MAX_ARTIFACTS 次
+PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED', 'False').lower() in ('true', '1', 'yes')
+PROFILER_DIR = Path(os.environ.get('PROFILER_DIR', BASE_DIR / 'profiles'))
+PROFILER_INTERVAL_MS = float(os.environ.get('PROFILER_INTERVAL_MS', '5'))
+PROFILER_MAX_ARTIFACTS = int(os.environ.get('PROFILER_MAX_ARTIFACTS', '200'))
+
+# Caches
+# 'quotes'（即時報價）與 'events'（資料抓取完成通知）需跨 gunicorn worker 與背景任務行程共用：
+# 預設使用檔案快取，設定 REDIS_URL 時改用 Redis
+# 報價的「每支股票只有一個上游輪詢者」依賴 cache.add 的原子性：檔案快取的 add 是先檢查再寫入，
+# 多個 web worker 可能同時取得鎖，只適用單一 web worker（本地開發）；多 worker 部署請設定 REDIS_URL
+# 檔案快取預設 MAX_ENTRIES=300，超過時會隨機剔除報價與鎖，因此依股票數明確設定上限
+SHARED_CACHE_MAX_ENTRIES = int(os.environ.get('SHARED_CACHE_MAX_ENTRIES', '10000'))
+
+def _shared_cache(name):
+    if os.environ.get('REDIS_URL'):
+        return {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': os.environ['REDIS_URL'],
+                'KEY_PREFIX': name}
+    return {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': BASE_DIR / f'.{name}_cache',
+            'OPTIONS': {'MAX_ENTRIES': SHARED_CACHE_MAX_ENTRIES}}
+
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'quotes': _shared_cache('quote'),
+    'events': _shared_cache('event'),
+}
+# 報價在此秒數內視為新鮮，直接由快取回傳
+QUOTE_CACHE_TTL = int(os.environ.get('QUOTE_CACHE_TTL', '5'))
+# 輪詢鎖的最長持有時間（上游卡住時避免永遠無人更新）
+QUOTE_POLL_LOCK_TIMEOUT = int(os.environ.get('QUOTE_POLL_LOCK_TIMEOUT', '10'))
+# 批次報價 API 單次可查詢的股票數
+QUOTE_BATCH_MAX_TICKERS = int(os.environ.get('QUOTE_BATCH_MAX_TICKERS', '50'))
+
+# Quote streaming (SSE, ASGI only)
+# 每支股票的上游輪詢間隔（秒，經由報價快取）、閒置時的心跳間隔與單一連線可訂閱的股票數
+QUOTE_STREAM_POLL_INTERVAL = float(os.environ.get('QUOTE_STREAM_POLL_INTERVAL', '2'))
+QUOTE_STREAM_HEARTBEAT = int(os.environ.get('QUOTE_STREAM_HEARTBEAT', '15'))
+QUOTE_STREAM_MAX_TICKERS = int(os.environ.get('QUOTE_STREAM_MAX_TICKERS', '50'))
+
+# Loading status long-poll
+# 儀表板等待新股票載入完成時，單次請求最長阻塞秒數與檢查完成通知的間隔
+LOADING_WAIT_TIMEOUT = int(os.environ.get('LOADING_WAIT_TIMEOUT', '25'))
+LOADING_WAIT_INTERVAL = float(os.environ.get('LOADING_WAIT_INTERVAL', '0.5'))
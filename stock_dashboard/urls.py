@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.urls import path, include
 from django.views.generic import RedirectView
 from django.contrib.auth.decorators import login_required
-from stocks.views import dashboard
+from stocks.views import dashboard, metrics_endpoint
 
 # A simple view to redirect authenticated users to the dashboard
 def home_redirect(request):
@@ -18,5 +18,6 @@ urlpatterns = [
     path('users/', include('users.urls')),
     path('users/', include('django.contrib.auth.urls')),
     path('stocks/', include('stocks.urls')),
+    path('metrics', metrics_endpoint, name='metrics'),
     path('', home_redirect, name='home'),
 ]
\ No newline at end of file
@@ -1,3 +1,12 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import FetchRun
+
+
+@admin.register(FetchRun)
+class FetchRunAdmin(admin.ModelAdmin):
+    list_display = ('ticker', 'started_at', 'duration_ms', 'ok')
+    list_filter = ('ok',)
+    search_fields = ('ticker',)
+    date_hierarchy = 'started_at'
+    ordering = ('-started_at',)
@@ -0,0 +1,149 @@
+"""
+財務警示規則引擎
+規則以資料定義（欄位、比較方式、門檻、訊息），可由 FINANCIAL_ALERT_RULES_PATH 的 JSON 取代；
+以單一 values_list 查詢取出所有股票的基本面欄位，轉成 numpy 陣列後每條規則一次比較整個股票池，
+只有警示內容實際改變的股票才以 bulk_update 寫回
+"""
+import json
+import operator
+
+import numpy as np
+from django.conf import settings
+
+DEFAULT_RULES = [
+    {
+        'field': 'debt_to_equity', 'op': '>', 'threshold': 200,
+        'message': "⚠️ 高財務槓桿：負債權益比達 {value:.1f}%，顯示公司債務壓力較大",
+    },
+    {
+        'field': 'quick_ratio', 'op': '<', 'threshold': 0.5,
+        'message': "⚠️ 流動性風險：速動比率僅 {value:.2f}，短期償債能力可能不足",
+    },
+    {
+        'field': 'roe', 'op': '<', 'threshold': 0, 'scale': 100,
+        'message': "⚠️ 獲利警訊：ROE 為 {value:.2f}%，公司股東權益報酬呈現虧損",
+    },
+    {
+        'field': 'free_cash_flow', 'op': '<', 'threshold': 0, 'scale': 1e-9,
+        'message': "⚠️ 現金流警訊：自由現金流為負 ({value:.2f}B)，可能影響股利發放或再投資能力",
+    },
+    {
+        'field': 'pe_ratio', 'op': '>', 'threshold': 50,
+        'message': "⚠️ 估值偏高：本益比達 {value:.1f}，回本年限較長，需確認成長性是否支撐",
+    },
+    {
+        'field': 'operating_margin', 'op': '<', 'threshold': 0, 'scale': 100,
+        'message': "⚠️ 本業虧損：營業利益率為 {value:.2f}%，本業經營處於虧損狀態",
+    },
+    {
+        'field': 'beta', 'op': '>', 'threshold': 2,
+        'message': "⚠️ 高波動風險：Beta 值達 {value:.2f}，股價波動遠大於大盤",
+    },
+]
+
+OPERATORS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+}
+
+
+def load_rules(path=None) -> list:
+    """
+    讀取警示規則；FINANCIAL_ALERT_RULES_PATH 指向的 JSON（規則陣列，格式同 DEFAULT_RULES）會取代預設規則
+    """
+    path = path or getattr(settings, 'FINANCIAL_ALERT_RULES_PATH', None)
+    if path:
+        try:
+            with open(path, encoding='utf-8') as f:
+                rules = json.load(f)
+            for rule in rules:
+                if rule['op'] not in OPERATORS:
+                    raise ValueError(f"unsupported operator {rule['op']!r}")
+            return rules
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"[Alert] 規則載入失敗，使用預設規則: {e}")
+    return DEFAULT_RULES
+
+
+def _column(values):
+    # 0 與空值一樣視為無資料（資料來源以 0 表示未提供）
+    return np.array([float(v) if v else np.nan for v in values], dtype=float)
+
+
+def _display_value(raw, scale):
+    """
+    訊息中顯示的數值，以原始欄位值計算（Decimal 欄位維持 Decimal）：
+    與逐筆比對時相同的算術，剛好落在四捨五入邊界的數值（如 201.35）格式化結果才會一致
+    """
+    if scale == 1:
+        return raw
+    if scale < 1:
+        return raw / round(1 / scale)
+    if float(scale).is_integer():
+        return raw * int(scale)
+    return float(raw) * scale
+
+
+def evaluate(columns, rules, size, raw=None):
+    """
+    對整個股票池評估所有規則
+
+    Args:
+        columns (dict): {field: np.ndarray}，同一索引對應同一支股票，NaN 表示無資料
+        rules (list): 規則定義
+        size (int): 股票數
+        raw (dict): {field: 原始欄位值序列}，用於格式化訊息（省略時使用 columns 的浮點數）
+
+    Returns:
+        list: 每支股票的警示訊息（多項以換行分隔，無警示為空字串）
+    """
+    lines = [[] for _ in range(size)]
+    for rule in rules:
+        values = columns[rule['field']]
+        originals = raw[rule['field']] if raw is not None else values
+        # NaN 的比較結果一律為 False，無資料的股票不會觸發
+        with np.errstate(invalid='ignore'):
+            hits = np.flatnonzero(OPERATORS[rule['op']](values, rule['threshold']))
+        scale = rule.get('scale', 1)
+        for i in hits:
+            lines[i].append(rule['message'].format(value=_display_value(originals[i], scale)))
+    return ["\n".join(parts) for parts in lines]
+
+
+def refresh_alerts(queryset=None, rules=None):
+    """
+    重新計算警示並寫回有變動的股票
+
+    Args:
+        queryset: 要評估的 Stock 查詢（預設為全部股票）
+        rules: 規則（預設為 load_rules()）
+
+    Returns:
+        int: 警示內容有變動而寫回的股票數
+    """
+    from .models import Stock
+
+    rules = rules if rules is not None else load_rules()
+    fields = sorted({rule['field'] for rule in rules})
+    queryset = Stock.objects.all() if queryset is None else queryset
+    rows = list(queryset.values_list('pk', 'ticker', 'alert_message', *fields))
+    if not rows:
+        return 0
+
+    pks, tickers, current, *values = zip(*rows)
+    raw = dict(zip(fields, values))
+    messages = evaluate({field: _column(col) for field, col in raw.items()}, rules, len(rows), raw=raw)
+
+    changed = [
+        Stock(pk=pk, alert_message=message)
+        for pk, old, message in zip(pks, current, messages)
+        if message != old
+    ]
+    Stock.objects.bulk_update(changed, ['alert_message'], batch_size=500)
+    if len(rows) == 1 and messages[0]:
+        print(f"[Alert] {tickers[0]} 有 {len(messages[0].splitlines())} 項財務警示")
+    elif len(rows) > 1:
+        print(f"[Alert] 評估 {len(rows)} 支股票，{len(changed)} 支警示有變動")
+    return len(changed)
@@ -4,3 +4,26 @@ from django.apps import AppConfig
 class StocksConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "stocks"
+
+    def ready(self):
+        # FinMind 匯入時會全域套用 nest_asyncio（使 async_to_sync 卡住），先由 data_sources 以略過套用的方式載入，
+        # 之後任何地方再匯入 FinMind 都不會重新執行
+        from . import data_sources  # noqa: F401
+
+        # 上游 HTTP 傳輸層包裝：依資料來源統計耗時與錯誤（stocks/upstream.py）
+        from . import upstream
+        upstream.install()
+
+        # /metrics：請求、上游、背景任務等指標（stocks/metrics.py）
+        from . import metrics
+        metrics.install()
+
+        # 管理員的單一請求剖析（PROFILER_ENABLED，stocks/profiling.py）
+        from django.conf import settings
+        if getattr(settings, 'PROFILER_ENABLED', False):
+            from . import profiling
+            profiling.install()
+
+        # HTTP_CASSETTE_MODE 設定時，上游 HTTP 改為錄製或重播（stocks/http_cassette.py）
+        from .http_cassette import install_from_settings
+        install_from_settings()
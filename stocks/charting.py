@@ -0,0 +1,242 @@
+"""
+圖表資料降採樣
+以 NumPy 在伺服器端將歷史 K 線壓縮到指定點數，無論資料庫保存多少歷史，回傳的資料量都有上限
+- 折線圖：LTTB (Largest-Triangle-Three-Buckets)，保留走勢形狀
+- K 線圖：依時間桶聚合 OHLCV（開=首筆、高=最大、低=最小、收=末筆、量=加總）
+  超過點數上限時改用較粗的固定日曆桶（週、月、年），同一張圖中的每根 K 棒都代表相同長度的週期
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.utils import timezone
+
+RANGE_DAYS = {
+    '1m': 31,
+    '3m': 92,
+    '6m': 183,
+    '1y': 366,
+    '2y': 731,
+    '5y': 1827,
+    'max': None,
+}
+RESOLUTIONS = ('D', 'W', 'M')
+# K 線超過點數上限時依序嘗試的日曆桶（年 K 為最粗的一級，不再另外限制點數）
+AGGREGATE_RESOLUTIONS = ('D', 'W', 'M', 'Y')
+CHART_TYPES = ('candle', 'line')
+DEFAULT_MAX_POINTS = 800
+MAX_POINTS_LIMIT = 5000
+
+
+def load_price_arrays(stock, start=None, use_columnar=None):
+    """
+    讀取股票日 K 為欄位陣列（依日期由舊到新）
+    啟用欄位式儲存時直接回傳 mmap 切片，否則經 ORM 讀取
+
+    Args:
+        use_columnar (bool): 是否優先讀取欄位檔（預設依 COLUMNAR_STORE_ENABLED）
+
+    Returns:
+        dict: date (datetime64[D]), open/high/low/close (float64), volume (int64)
+    """
+    from . import columnar
+    from .models import StockPrice
+
+    if use_columnar is None:
+        use_columnar = columnar.is_enabled()
+    if use_columnar:
+        arrays = columnar.read_range(stock.ticker, start=start)
+        if arrays is not None:
+            return arrays
+
+    qs = StockPrice.objects.filter(stock=stock).between(start=start)
+    rows = list(qs.order_by('date').values_list('date', 'open', 'high', 'low', 'close', 'volume'))
+
+    if not rows:
+        return empty_arrays()
+
+    dates, opens, highs, lows, closes, volumes = zip(*rows)
+    return {
+        'date': np.array(dates, dtype='datetime64[D]'),
+        'open': np.array(opens, dtype=np.float64),
+        'high': np.array(highs, dtype=np.float64),
+        'low': np.array(lows, dtype=np.float64),
+        'close': np.array(closes, dtype=np.float64),
+        'volume': np.array(volumes, dtype=np.int64),
+    }
+
+
+def empty_arrays():
+    return {
+        'date': np.array([], dtype='datetime64[D]'),
+        'open': np.array([], dtype=np.float64),
+        'high': np.array([], dtype=np.float64),
+        'low': np.array([], dtype=np.float64),
+        'close': np.array([], dtype=np.float64),
+        'volume': np.array([], dtype=np.int64),
+    }
+
+
+def _reduce_buckets(arrays, starts):
+    """依桶起點索引聚合 OHLCV"""
+    n = len(arrays['close'])
+    ends = np.append(starts[1:], n) - 1
+    return {
+        'date': arrays['date'][starts],
+        # 桶內最後一根日 K 的日期，用於對齊當日計算的技術指標
+        'end_date': arrays.get('end_date', arrays['date'])[ends],
+        'open': arrays['open'][starts],
+        'high': np.maximum.reduceat(arrays['high'], starts),
+        'low': np.minimum.reduceat(arrays['low'], starts),
+        'close': arrays['close'][ends],
+        'volume': np.add.reduceat(arrays['volume'], starts),
+    }
+
+
+def resample_ohlc(arrays, resolution):
+    """將日 K 轉為週 K ('W')、月 K ('M') 或年 K ('Y')"""
+    if resolution == 'D' or len(arrays['date']) == 0:
+        return arrays
+    if resolution == 'W':
+        # datetime64[W] 以週四為界，先平移讓每週從週一開始
+        keys = (arrays['date'] + np.timedelta64(3, 'D')).astype('datetime64[W]')
+    elif resolution == 'M':
+        keys = arrays['date'].astype('datetime64[M]')
+    else:
+        keys = arrays['date'].astype('datetime64[Y]')
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return _reduce_buckets(arrays, starts)
+
+
+def aggregate_ohlc(arrays, max_points, resolution='D'):
+    """
+    將 K 棒轉為 resolution 週期；超過 max_points 時改用下一級日曆桶（日 → 週 → 月 → 年），直到不超過上限
+    每一級都由傳入的 K 棒重新聚合（傳入日 K 時月 K 以日期而非週 K 的起日分月）
+    不以固定筆數分桶：那樣同一張圖會混雜涵蓋 1 天與 2 天的 K 棒
+
+    Returns:
+        tuple: (聚合後的欄位陣列, 實際使用的 resolution)
+    """
+    level = AGGREGATE_RESOLUTIONS.index(resolution)
+    result = resample_ohlc(arrays, resolution)
+    while len(result['close']) > max_points and level + 1 < len(AGGREGATE_RESOLUTIONS):
+        level += 1
+        result = resample_ohlc(arrays, AGGREGATE_RESOLUTIONS[level])
+    return result, AGGREGATE_RESOLUTIONS[level]
+
+
+def lttb_indices(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets 降採樣
+
+    Args:
+        x, y: 等長的一維數值陣列（x 需遞增）
+        threshold: 目標點數
+
+    Returns:
+        np.ndarray: 保留的索引（含首尾兩點）
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+
+    # 中間 n-2 個點切成 threshold-2 個桶
+    edges = np.floor(np.linspace(1, n - 1, threshold - 1)).astype(np.int64)
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], edges[i + 2]
+        else:
+            next_start, next_end = n - 1, n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        bx = x[start:end]
+        by = y[start:end]
+        areas = np.abs((x[a] - avg_x) * (by - y[a]) - (x[a] - bx) * (avg_y - y[a]))
+        a = start + int(np.argmax(areas))
+        indices[i + 1] = a
+
+    return indices
+
+
+def get_chart_data(stock, range_key='1y', resolution='D', max_points=DEFAULT_MAX_POINTS, chart_type='candle',
+                   arrays=None, indicators=None):
+    """
+    取得降採樣後的圖表資料
+
+    Args:
+        stock (Stock): 股票
+        range_key (str): RANGE_DAYS 中的區間
+        resolution (str): 'D', 'W', 'M'
+        max_points (int): 回傳點數上限
+        chart_type (str): 'candle' 回傳 [date, O, C, L, H, V]；'line' 回傳 [date, close]
+        arrays (dict): 已讀取的欄位陣列（省略時由資料庫讀取）
+        indicators (list): 一併回傳的技術指標欄位（見 indicators.INDICATOR_FIELDS）；
+            日 K 讀取已儲存的 TechnicalIndicator（尚無資料時為 None），週 / 月 / 年 K 以聚合後的 K 棒計算
+
+    Returns:
+        dict: {'data': [...], 'total_points': 原始筆數, 'points': 回傳筆數, 'resolution': 實際週期,
+               'indicators': {...}}
+    """
+    total = None
+    if arrays is None:
+        from .timeseries import get_backend, RelationalBackend
+
+        days = RANGE_DAYS.get(range_key)
+        start = (timezone.now() - timedelta(days=days)).date() if days else None
+        backend = get_backend()
+        if resolution != 'D' and not isinstance(backend, RelationalBackend):
+            # 週/月 K 交由時間序列資料庫聚合，不在 OLTP 資料庫掃描整段歷史
+            arrays = backend.aggregate_prices(stock, resolution, start=start)
+            total = len(arrays['close'])
+        else:
+            arrays = load_price_arrays(stock, start=start)
+
+    if total is None:
+        total = len(arrays['close'])
+
+    if chart_type == 'line':
+        arrays = resample_ohlc(arrays, resolution)
+        idx = lttb_indices(arrays['date'].astype(np.int64), arrays['close'], max_points)
+        end_dates = arrays.get('end_date', arrays['date'])[idx]
+        dates = np.datetime_as_string(arrays['date'][idx], unit='D')
+        closes = np.round(arrays['close'][idx], 2)
+        selected = idx
+        data = [[d, c] for d, c in zip(dates.tolist(), closes.tolist())]
+    else:
+        arrays, resolution = aggregate_ohlc(arrays, max_points, resolution)
+        end_dates = arrays.get('end_date', arrays['date'])
+        selected = slice(None)
+        dates = np.datetime_as_string(arrays['date'], unit='D')
+        data = [
+            list(row) for row in zip(
+                dates.tolist(),
+                np.round(arrays['open'], 2).tolist(),
+                np.round(arrays['close'], 2).tolist(),
+                np.round(arrays['low'], 2).tolist(),
+                np.round(arrays['high'], 2).tolist(),
+                arrays['volume'].tolist(),
+            )
+        ]
+
+    result = {'data': data, 'total_points': total, 'points': len(data), 'resolution': resolution}
+    if indicators:
+        from .indicators import compute_indicators, get_indicator_series, INDICATOR_FIELDS
+
+        if resolution == 'D' or not data:
+            result['indicators'] = get_indicator_series(stock, end_dates, indicators)
+        else:
+            # 日 K 的指標（例如 20 日均線）不能代表週 / 月 K 的 MA20，改以顯示中的 K 棒計算
+            values, _ = compute_indicators(arrays)
+            result['indicators'] = {
+                f: [None if np.isnan(v) else round(v, 6) for v in values[f][selected].tolist()]
+                for f in indicators if f in INDICATOR_FIELDS
+            }
+    return result
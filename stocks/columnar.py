@@ -0,0 +1,100 @@
+"""
+欄位式價格儲存（選用）
+每支股票的日 K 以連續的 NumPy 陣列存成 .npy 檔（date/open/high/low/close/volume 各一檔），
+讀取時以 mmap 開啟，區間查詢直接回傳陣列切片（零複製），不必經 ORM 建立上千個 Decimal 物件
+
+由資料抓取流程在寫入 StockPrice 後同步；timeseries.write_prices 寫入時先刪除舊檔，
+同步完成前（或同步失敗時）讀取端改用 ORM。COLUMNAR_STORE_ENABLED 關閉時完全不使用
+"""
+import os
+import re
+import shutil
+import uuid
+
+import numpy as np
+from django.conf import settings
+
+COLUMNS = {
+    'date': 'datetime64[D]',
+    'open': np.float64,
+    'high': np.float64,
+    'low': np.float64,
+    'close': np.float64,
+    'volume': np.int64,
+}
+
+_SAFE_NAME_RE = re.compile(r'[^A-Za-z0-9._-]')
+
+
+def is_enabled() -> bool:
+    return getattr(settings, 'COLUMNAR_STORE_ENABLED', False)
+
+
+def _root(root=None):
+    return str(root or getattr(settings, 'COLUMNAR_STORE_DIR', settings.BASE_DIR / 'columnar_store'))
+
+
+def _ticker_dir(ticker, root=None):
+    return os.path.join(_root(root), _SAFE_NAME_RE.sub('_', ticker))
+
+
+def write_ticker(ticker, arrays, root=None):
+    """
+    以新目錄整批寫入後再替換舊目錄，讀取端不會看到欄位長度不一致的中間狀態
+    （替換瞬間讀不到時會回傳 None，呼叫端改用 ORM）
+    """
+    target = _ticker_dir(ticker, root)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp = f"{target}.{uuid.uuid4().hex}.tmp"
+    os.makedirs(tmp)
+    try:
+        for name, dtype in COLUMNS.items():
+            np.save(os.path.join(tmp, f"{name}.npy"), np.ascontiguousarray(arrays[name], dtype=dtype))
+        trash = None
+        if os.path.isdir(target):
+            trash = f"{target}.{uuid.uuid4().hex}.old"
+            os.rename(target, trash)
+        os.rename(tmp, target)
+        if trash:
+            shutil.rmtree(trash, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+def read_ticker(ticker, root=None):
+    """以 mmap 開啟整支股票的欄位陣列；檔案不存在時回傳 None"""
+    directory = _ticker_dir(ticker, root)
+    try:
+        return {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r') for name in COLUMNS}
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def read_range(ticker, start=None, end=None, root=None):
+    """
+    讀取日期區間 [start, end] 的欄位陣列（mmap 切片，零複製）
+
+    Returns:
+        dict 或 None（尚未建立欄位檔）
+    """
+    arrays = read_ticker(ticker, root)
+    if arrays is None:
+        return None
+    dates = arrays['date']
+    lo = int(np.searchsorted(dates, np.datetime64(start, 'D'), side='left')) if start is not None else 0
+    hi = int(np.searchsorted(dates, np.datetime64(end, 'D'), side='right')) if end is not None else len(dates)
+    return {name: arr[lo:hi] for name, arr in arrays.items()}
+
+
+def sync_ticker(stock, root=None):
+    """由資料庫重建單一股票的欄位檔（資料抓取流程寫入 StockPrice 後呼叫）"""
+    from .charting import load_price_arrays
+
+    arrays = load_price_arrays(stock, use_columnar=False)
+    write_ticker(stock.ticker, arrays, root)
+    return len(arrays['date'])
+
+
+def delete_ticker(ticker, root=None):
+    shutil.rmtree(_ticker_dir(ticker, root), ignore_errors=True)
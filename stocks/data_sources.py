@@ -1,5 +1,15 @@
-from FinMind.data import DataLoader
+import nest_asyncio
 import yfinance as yf
+
+# FinMind 匯入時會呼叫 nest_asyncio.apply()，全域修改 asyncio：asyncio.run 不再關閉事件迴圈，
+# asgiref 在同一執行緒下次 async_to_sync 時會把工作排到這個已停止的迴圈而永遠等待（WSGI 下的 async view 如長輪詢）
+# 這裡只以同步方式呼叫單一股票的 FinMind API，不需要巢狀事件迴圈，因此匯入期間略過 apply()（由 StocksConfig.ready 提前匯入）
+_nest_asyncio_apply = nest_asyncio.apply
+nest_asyncio.apply = lambda *args, **kwargs: None
+try:
+    from FinMind.data import DataLoader
+finally:
+    nest_asyncio.apply = _nest_asyncio_apply
 from datetime import datetime, timedelta
 import pandas as pd
 from django.utils import timezone
@@ -0,0 +1,76 @@
+"""
+公司簡介正規化
+資料抓取時一次完成語言判斷、中英段落去重與翻譯，原文存於 Stock.description、繁體中文存於 Stock.description_zh；
+詳細頁與 API 只讀取這兩個欄位，不再於瀏覽時分類段落、翻譯或寫回資料庫
+"""
+import re
+
+CJK_RE = re.compile(r'[\u4e00-\u9fff]')
+# GoogleTranslator 單次請求的字數上限
+TRANSLATE_LIMIT = 4999
+
+
+def is_chinese(text):
+    return bool(CJK_RE.search(text))
+
+
+def split_description(raw):
+    """
+    拆分可能混雜中英段落的簡介（舊資料曾把譯文附加在原文後）
+
+    Returns:
+        (original, lang, localized): 原文、原文語言（'en' / 'zh'）、已存在的中文段落（沒有則為空字串）
+    """
+    paragraphs = []
+    for paragraph in (p.strip() for p in (raw or '').split('\n')):
+        if paragraph and paragraph not in paragraphs:
+            paragraphs.append(paragraph)
+
+    chinese = [p for p in paragraphs if is_chinese(p)]
+    other = [p for p in paragraphs if not is_chinese(p)]
+    if other:
+        return "\n\n".join(other), 'en', "\n\n".join(chinese)
+    if chinese:
+        text = "\n\n".join(chinese)
+        return text, 'zh', text
+    return '', '', ''
+
+
+def translate(text):
+    """翻譯成繁體中文；失敗時回傳空字串"""
+    from deep_translator import GoogleTranslator
+
+    try:
+        return GoogleTranslator(source='auto', target='zh-TW').translate(text[:TRANSLATE_LIMIT]) or ''
+    except Exception as e:
+        print(f"[Description] 翻譯失敗: {e}")
+        return ''
+
+
+def normalize_description(stock, raw=None, translate_missing=True):
+    """
+    將簡介正規化寫入 stock 的 description / description_lang / description_zh（不儲存）
+
+    Args:
+        stock: Stock
+        raw: 新的簡介原文（預設為目前的 stock.description）
+        translate_missing: 沒有中文段落時是否呼叫翻譯
+
+    Returns:
+        bool: 欄位是否有變動
+
+    翻譯失敗（或未翻譯）時 description_lang 保持空字串，代表尚待處理，下次抓取或 normalize_descriptions 會重試
+    """
+    before = (stock.description, stock.description_lang, stock.description_zh)
+    original, lang, localized = split_description(stock.description if raw is None else raw)
+    if not localized and original:
+        # 原文未變且已有譯文時沿用，不重新翻譯
+        if original == stock.description and stock.description_zh:
+            localized = stock.description_zh
+        elif translate_missing:
+            localized = translate(original)
+        if not localized:
+            lang = ''
+
+    stock.description, stock.description_lang, stock.description_zh = original, lang, localized
+    return (original, lang, localized) != before
@@ -0,0 +1,251 @@
+"""
+資料抓取流程的分階段計時與執行紀錄（FetchRun）
+
+    with start_run(ticker) as run:
+        with span('download'):
+            ...
+        add_rows('prices', written)
+
+start_run() 以 contextvar 保存目前的執行紀錄，流程中任何位置（包含 fetch_news_and_analyze 等下游函式）
+都可以用 span() / add_rows() / record_error() 累加到同一筆紀錄；沒有進行中的紀錄時這些函式不做任何事
+上游 HTTP 請求由 stocks.upstream 的觀察者依資料來源累計次數、錯誤與耗時
+結束時寫入一列 FetchRun，並定期清除超過 FETCH_RUN_RETENTION_DAYS 天的紀錄
+"""
+import contextlib
+import contextvars
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import upstream
+
+# 每次執行最多保留的錯誤數與單一訊息長度
+MAX_ERRORS = 20
+MAX_ERROR_LENGTH = 300
+# 過期紀錄的清除間隔（秒，同一行程內）
+PURGE_INTERVAL = 3600
+
+_current = contextvars.ContextVar('fetch_run', default=None)
+_last_purge = 0.0
+
+
+class RunTrace:
+    """單次抓取的計時資料（毫秒）"""
+
+    def __init__(self, ticker):
+        self.ticker = ticker
+        self.started_at = timezone.now()
+        self._started = time.perf_counter()
+        self.duration_ms = 0
+        self.ok = True
+        self.stages = defaultdict(float)
+        self.rows = defaultdict(int)
+        self.upstream = defaultdict(lambda: {'calls': 0, 'errors': 0, 'ms': 0.0})
+        self.errors = []
+
+    def add_stage(self, stage, ms):
+        self.stages[stage] += ms
+
+    def add_upstream(self, source, ms, ok):
+        entry = self.upstream[source]
+        entry['calls'] += 1
+        entry['ms'] += ms
+        if not ok:
+            entry['errors'] += 1
+
+    def add_error(self, stage, error):
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append([stage, str(error)[:MAX_ERROR_LENGTH]])
+
+    def fail(self, stage=None, error=None):
+        self.ok = False
+        if error is not None:
+            self.add_error(stage or 'run', error)
+
+    def finish(self):
+        self.duration_ms = round((time.perf_counter() - self._started) * 1000)
+
+    def to_model(self):
+        from .models import FetchRun
+
+        return FetchRun(
+            ticker=self.ticker,
+            started_at=self.started_at,
+            duration_ms=self.duration_ms,
+            ok=self.ok,
+            stages={stage: round(ms, 1) for stage, ms in self.stages.items()},
+            rows=dict(self.rows),
+            upstream={source: {**entry, 'ms': round(entry['ms'], 1)} for source, entry in self.upstream.items()},
+            errors=self.errors,
+        )
+
+
+def current():
+    """目前進行中的執行紀錄（沒有時為 None）"""
+    return _current.get()
+
+
+def _observe_upstream(source, host, elapsed, ok):
+    run = _current.get()
+    if run is not None:
+        run.add_upstream(source, elapsed * 1000, ok)
+
+
+@contextlib.contextmanager
+def start_run(ticker):
+    """
+    記錄一次抓取；區塊內未捕捉的例外會記為失敗後繼續拋出
+    FETCH_RUNS_ENABLED 關閉時仍會計時（供呼叫端使用），但不寫入資料庫
+    """
+    upstream.install()
+    upstream.add_observer(_observe_upstream)
+    run = RunTrace(ticker)
+    token = _current.set(run)
+    try:
+        yield run
+    except Exception as e:
+        run.fail('run', e)
+        raise
+    finally:
+        _current.reset(token)
+        run.finish()
+        if getattr(settings, 'FETCH_RUNS_ENABLED', True):
+            _save(run)
+
+
+def _save(run):
+    global _last_purge
+    try:
+        run.to_model().save()
+        if time.monotonic() - _last_purge > PURGE_INTERVAL:
+            _last_purge = time.monotonic()
+            purge_expired()
+    except Exception as e:
+        print(f"[FetchRun] Error saving run for {run.ticker}: {e}")
+
+
+@contextlib.contextmanager
+def span(stage):
+    """累加區塊耗時到目前執行紀錄的 stage（同名階段多次進入時加總）"""
+    run = _current.get()
+    if run is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        run.add_stage(stage, (time.perf_counter() - started) * 1000)
+
+
+def add_rows(table, count):
+    run = _current.get()
+    if run is not None and count:
+        run.rows[table] += int(count)
+
+
+def record_error(stage, error):
+    """記錄已處理（不中斷流程）的錯誤"""
+    run = _current.get()
+    if run is not None:
+        run.add_error(stage, error)
+
+
+def purge_expired(days=None):
+    """刪除超過保留天數的抓取紀錄，回傳刪除筆數"""
+    from .models import FetchRun
+
+    days = getattr(settings, 'FETCH_RUN_RETENTION_DAYS', 7) if days is None else days
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = FetchRun.objects.filter(started_at__lt=cutoff).delete()
+    return deleted
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return 0
+    index = min(len(values) - 1, int(round(q * (len(values) - 1))))
+    return values[index]
+
+
+def report(hours=24, limit=20):
+    """
+    最近 hours 小時內的彙整：最慢的股票、最慢的階段（平均 / p95 / 總計毫秒）、上游來源與最近的失敗
+    JSON 欄位在 SQLite / PostgreSQL 間的聚合語法不同，因此在 Python 端彙整（資料量受保留天數限制）
+    """
+    from .models import FetchRun
+
+    since = timezone.now() - timedelta(hours=hours)
+    runs = list(
+        FetchRun.objects.filter(started_at__gte=since)
+        .values('ticker', 'started_at', 'duration_ms', 'ok', 'stages', 'upstream', 'errors')
+    )
+
+    by_ticker = defaultdict(list)
+    by_stage = defaultdict(list)
+    by_source = defaultdict(lambda: {'calls': 0, 'errors': 0, 'ms': 0.0})
+    for run in runs:
+        by_ticker[run['ticker']].append(run)
+        for stage, ms in (run['stages'] or {}).items():
+            by_stage[stage].append(ms)
+        for source, entry in (run['upstream'] or {}).items():
+            for field in ('calls', 'errors', 'ms'):
+                by_source[source][field] += entry.get(field, 0)
+
+    tickers = []
+    for ticker, items in by_ticker.items():
+        durations = [item['duration_ms'] for item in items]
+        slowest = max(items, key=lambda item: item['duration_ms'])
+        stages = slowest['stages'] or {}
+        tickers.append({
+            'ticker': ticker,
+            'runs': len(items),
+            'failures': sum(1 for item in items if not item['ok']),
+            'avg_ms': round(sum(durations) / len(durations)),
+            'max_ms': max(durations),
+            'slowest_stage': max(stages, key=stages.get) if stages else '',
+        })
+    tickers.sort(key=lambda row: row['max_ms'], reverse=True)
+
+    stages = [
+        {
+            'stage': stage,
+            'count': len(values),
+            'avg_ms': round(sum(values) / len(values), 1),
+            'p95_ms': round(_percentile(values, 0.95), 1),
+            'total_ms': round(sum(values)),
+        }
+        for stage, values in by_stage.items()
+    ]
+    stages.sort(key=lambda row: row['total_ms'], reverse=True)
+
+    sources = [
+        {
+            'source': source,
+            'calls': entry['calls'],
+            'errors': entry['errors'],
+            'error_rate': round(entry['errors'] / entry['calls'] * 100, 1) if entry['calls'] else 0,
+            'avg_ms': round(entry['ms'] / entry['calls'], 1) if entry['calls'] else 0,
+        }
+        for source, entry in by_source.items()
+    ]
+    sources.sort(key=lambda row: row['calls'], reverse=True)
+
+    failures = sorted(
+        (run for run in runs if not run['ok'] or run['errors']),
+        key=lambda run: run['started_at'], reverse=True,
+    )[:limit]
+
+    return {
+        'hours': hours,
+        'runs': len(runs),
+        'failed_runs': sum(1 for run in runs if not run['ok']),
+        'tickers': tickers[:limit],
+        'stages': stages,
+        'sources': sources,
+        'failures': failures,
+    }
@@ -0,0 +1,291 @@
+"""
+上游 HTTP 錄製 / 重播（cassette）
+所有資料來源（yfinance 使用的 curl_cffi、FinMind / TWSE / SEC / Alpha Vantage / Google RSS / 翻譯使用的 requests）
+都在傳輸層（stocks/upstream.py）替換實際送出請求的函式：
+
+- record：照常連線，並把每個回應（狀態碼、必要標頭、內容、耗時）附加到 gzip 壓縮的 JSON Lines 檔
+- replay：完全不連線，依請求（method + 正規化 URL + body 雜湊）回放錄製的回應，可選擇注入延遲
+  （'recorded' 為錄製時的實際耗時，數字為固定毫秒數）；找不到對應錄製時拋出 CassetteMiss
+
+URL 中的 crumb / token / apikey 等參數不列入比對也不寫入檔案；請求標頭（含授權資訊）不會被錄製
+同一請求錄製多次時依序回放，用完後重複最後一筆；
+含時間窗參數（yfinance 的 period1 / period2 由當下時間計算）的請求找不到完全相同的錄製時，改以忽略時間窗的方式比對
+"""
+import base64
+import contextlib
+import gzip
+import hashlib
+import json
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from django.conf import settings
+
+from . import upstream
+
+MODES = ('record', 'replay')
+# 不列入比對、不寫入檔案的查詢參數（每次不同或屬於機密）
+VOLATILE_PARAMS = {'crumb', 'token', 'api_token', 'apikey', 'api_key'}
+# 重播時完全比對失敗才忽略的時間窗參數
+WINDOW_PARAMS = {'period1', 'period2'}
+# 回放時需要的回應標頭（內容已解壓縮，不保留 content-encoding / content-length）
+KEPT_HEADERS = ('content-type', 'location')
+
+
+class CassetteMiss(requests.exceptions.ConnectionError):
+    """重播模式下沒有對應的錄製回應"""
+
+
+def normalize_url(url, params=None, drop=VOLATILE_PARAMS):
+    """排序查詢參數並移除 drop 中的參數；params 會併入 URL"""
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    if params:
+        query.extend(params.items() if isinstance(params, dict) else params)
+    query = sorted((str(k), str(v)) for k, v in query if str(k).lower() not in drop)
+    return urlunsplit((parts.scheme, parts.netloc.lower(), parts.path or '/', urlencode(query), ''))
+
+
+def _body_bytes(body):
+    if body is None:
+        return b''
+    if isinstance(body, str):
+        return body.encode('utf-8')
+    if isinstance(body, (bytes, bytearray)):
+        return bytes(body)
+    if isinstance(body, (dict, list, tuple)):
+        return json.dumps(body, sort_keys=True, default=str).encode('utf-8')
+    return b''  # 串流或檔案上傳不列入比對
+
+
+def request_key(method, url, body=None, params=None):
+    digest = hashlib.sha1(_body_bytes(body)).hexdigest()[:16]
+    return f"{method.upper()} {normalize_url(url, params)} {digest}"
+
+
+def window_key(key):
+    """去掉時間窗參數後的比對鍵"""
+    method, url, digest = key.split(' ')
+    return f"{method} {normalize_url(url, drop=VOLATILE_PARAMS | WINDOW_PARAMS)} {digest}"
+
+
+def _host(key):
+    return urlsplit(key.split(' ')[1]).netloc
+
+
+def _encode_body(content):
+    try:
+        return {'text': content.decode('utf-8')}
+    except UnicodeDecodeError:
+        return {'base64': base64.b64encode(content).decode('ascii')}
+
+
+def _decode_body(entry):
+    if 'base64' in entry:
+        return base64.b64decode(entry['base64'])
+    return entry.get('text', '').encode('utf-8')
+
+
+class Cassette:
+    """
+    單一錄製檔
+
+    Args:
+        path: 檔案路徑（.jsonl.gz）
+        mode: 'record' 或 'replay'
+        latency: 重播時注入的延遲；None / 0 不延遲、'recorded' 使用錄製耗時、數字為固定毫秒數
+    """
+
+    def __init__(self, path, mode='replay', latency=None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode {mode!r} (expected one of {MODES})")
+        self.path = Path(path)
+        self.mode = mode
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._entries = defaultdict(list)
+        self._windowed = defaultdict(list)
+        self._cursor = Counter()
+        # 依主機統計：錄製 / 回放次數與重播未命中次數
+        self.stats = Counter()
+        self.misses = Counter()
+        if mode == 'replay':
+            self._load()
+        else:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def _load(self):
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    self._add(json.loads(line))
+
+    def _add(self, entry):
+        self._entries[entry['key']].append(entry)
+        self._windowed[window_key(entry['key'])].append(entry)
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._entries.values())
+
+    def record(self, key, status, headers, content, elapsed):
+        entry = {
+            'key': key,
+            'status': status,
+            'headers': {name: headers[name] for name in KEPT_HEADERS if headers.get(name)},
+            'elapsed': round(elapsed, 4),
+            **_encode_body(content),
+        }
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with self._lock:
+            # 每筆各自成為一個 gzip member，中途中斷也不會損毀已錄製的內容
+            with gzip.open(self.path, 'at', encoding='utf-8') as f:
+                f.write(line)
+            self._add(entry)
+            self.stats[_host(key)] += 1
+
+    def play(self, key):
+        host = _host(key)
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                key = window_key(key)
+                entries = self._windowed.get(key)
+            if not entries:
+                self.misses[host] += 1
+                raise CassetteMiss(f"No recorded response for {key} in {self.path}")
+            index = min(self._cursor[key], len(entries) - 1)
+            self._cursor[key] += 1
+            self.stats[host] += 1
+        entry = entries[index]
+        delay = entry.get('elapsed', 0) if self.latency == 'recorded' else (self.latency or 0) / 1000
+        if delay:
+            time.sleep(delay)
+        return entry['status'], entry.get('headers', {}), _decode_body(entry), entry.get('elapsed', 0)
+
+
+_active = None
+
+
+def active_cassette():
+    return _active
+
+
+# --- requests（FinMind、TWSE、SEC、Alpha Vantage、RSS、翻譯）---
+
+def _requests_response(request, status, headers, content, elapsed):
+    from requests.structures import CaseInsensitiveDict
+    from requests.utils import get_encoding_from_headers
+
+    response = requests.Response()
+    response.status_code = status
+    response.headers = CaseInsensitiveDict(headers)
+    response._content = content
+    response.encoding = get_encoding_from_headers(response.headers)
+    response.url = request.url
+    response.request = request
+    response.reason = 'OK' if status < 400 else 'Error'
+    response.elapsed = timedelta(seconds=elapsed)
+    return response
+
+
+def _requests_send(adapter, request, **kwargs):
+    cassette = _active
+    send = upstream.original('requests')
+    if cassette is None:
+        return send(adapter, request, **kwargs)
+    key = request_key(request.method, request.url, request.body)
+    if cassette.mode == 'replay':
+        return _requests_response(request, *cassette.play(key))
+    started = time.perf_counter()
+    response = send(adapter, request, **kwargs)
+    cassette.record(key, response.status_code, response.headers, response.content, time.perf_counter() - started)
+    return response
+
+
+# --- curl_cffi（yfinance）---
+
+def _curl_request(session, method, url, params=None, data=None, json=None, content=None, **kwargs):
+    cassette = _active
+    send = upstream.original('curl')
+    if cassette is None:
+        return send(session, method, url, params=params, data=data, json=json, content=content, **kwargs)
+    key = request_key(method, url, json if json is not None else (data if data is not None else content), params)
+    if cassette.mode == 'replay':
+        from curl_cffi.requests.models import Response
+        from curl_cffi.requests.headers import Headers
+
+        status, headers, body, _ = cassette.play(key)
+        response = Response()
+        response.status_code = status
+        response.ok = status < 400
+        response.reason = 'OK' if response.ok else 'Error'
+        response.headers = Headers(headers)
+        response.content = body
+        response.url = url
+        return response
+    started = time.perf_counter()
+    response = send(session, method, url, params=params, data=data, json=json, content=content, **kwargs)
+    cassette.record(key, response.status_code, response.headers, response.content, time.perf_counter() - started)
+    return response
+
+
+def install(path, mode='replay', latency=None):
+    """啟用 cassette（整個行程）；回傳 Cassette"""
+    global _active
+    cassette = Cassette(path, mode=mode, latency=latency)
+    upstream.set_transport(requests=_requests_send, curl=_curl_request)
+    _active = cassette
+    print(f"[Cassette] {mode}: {cassette.path}" + (f"（{len(cassette)} 筆）" if mode == 'replay' else ''))
+    return cassette
+
+
+def uninstall():
+    global _active
+    _active = None
+    upstream.set_transport()
+
+
+@contextlib.contextmanager
+def use_cassette(path, mode='replay', latency=None):
+    """
+    在區塊內錄製或重播上游 HTTP
+
+        with use_cassette('cassettes/aapl.jsonl.gz', mode='record'):
+            fetch_stock_data_sync('AAPL')
+    """
+    global _active
+    previous = _active
+    cassette = install(path, mode=mode, latency=latency)
+    try:
+        yield cassette
+    finally:
+        if previous is None:
+            uninstall()
+        else:
+            _active = previous
+
+
+def parse_latency(value):
+    """HTTP_CASSETTE_LATENCY 設定值：''/'0' → None、'recorded'、其他為毫秒數"""
+    if value in (None, '', '0'):
+        return None
+    if value == 'recorded':
+        return value
+    return float(value)
+
+
+def install_from_settings():
+    """HTTP_CASSETTE_MODE 為 record / replay 時於啟動時啟用（StocksConfig.ready）"""
+    mode = getattr(settings, 'HTTP_CASSETTE_MODE', '')
+    if not mode:
+        return None
+    return install(
+        getattr(settings, 'HTTP_CASSETTE_PATH', 'cassettes/upstream.jsonl.gz'),
+        mode=mode,
+        latency=parse_latency(getattr(settings, 'HTTP_CASSETTE_LATENCY', '')),
+    )
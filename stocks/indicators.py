@@ -0,0 +1,325 @@
+"""
+技術指標計算引擎
+以 NumPy 計算 SMA/EMA、RSI、MACD、布林通道與 ATR，結果存入 TechnicalIndicator
+已有計算狀態 (IndicatorState) 時，新 K 棒只需接續遞迴計算，不重掃整段歷史
+"""
+import math
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+INDICATOR_FIELDS = [
+    'sma5', 'sma20', 'sma60', 'ema12', 'ema26', 'rsi14',
+    'macd', 'macd_signal', 'macd_hist', 'bb_upper', 'bb_middle', 'bb_lower', 'atr14',
+]
+
+RSI_PERIOD = 14
+ATR_PERIOD = 14
+MACD_FAST, MACD_SLOW, MACD_SIGNAL = 12, 26, 9
+BB_PERIOD, BB_WIDTH = 20, 2
+# 所有指標都已完成暖機所需的 K 棒數（SMA60 最長）；少於此數時一律完整重算
+WARMUP_BARS = 60
+
+
+# ============================================================
+# 向量化計算（完整歷史）
+# ============================================================
+
+def sma(values, window):
+    """簡單移動平均，前 window-1 筆為 NaN"""
+    out = np.full(len(values), np.nan)
+    if len(values) >= window:
+        out[window - 1:] = sliding_window_view(values, window).mean(axis=1)
+    return out
+
+
+def rolling_std(values, window):
+    """母體標準差 (ddof=0)，與布林通道慣例一致"""
+    out = np.full(len(values), np.nan)
+    if len(values) >= window:
+        out[window - 1:] = sliding_window_view(values, window).std(axis=1)
+    return out
+
+
+def _recursive_smooth(values, alpha, seed_index, seed_value):
+    """自 seed_index 起以 out[i] = alpha * x[i] + (1 - alpha) * out[i-1] 遞迴平滑"""
+    out = np.full(len(values), np.nan)
+    if seed_index >= len(values) or math.isnan(seed_value):
+        return out
+    out[seed_index] = seed_value
+    prev = seed_value
+    for i in range(seed_index + 1, len(values)):
+        prev = alpha * values[i] + (1 - alpha) * prev
+        out[i] = prev
+    return out
+
+
+def ema(values, span):
+    """指數移動平均，以前 span 筆的 SMA 作為起始值"""
+    if len(values) < span:
+        return np.full(len(values), np.nan)
+    return _recursive_smooth(values, 2 / (span + 1), span - 1, float(np.mean(values[:span])))
+
+
+def rsi(close, period=RSI_PERIOD):
+    """
+    RSI（Wilder 平滑）
+
+    Returns:
+        (rsi, avg_gain, avg_loss) 三個陣列，後兩者供增量計算延續
+    """
+    n = len(close)
+    nan = np.full(n, np.nan)
+    if n <= period:
+        return nan, nan.copy(), nan.copy()
+    delta = np.diff(close, prepend=close[0])
+    gains = np.where(delta > 0, delta, 0.0)
+    losses = np.where(delta < 0, -delta, 0.0)
+    alpha = 1 / period
+    avg_gain = _recursive_smooth(gains, alpha, period, float(gains[1:period + 1].mean()))
+    avg_loss = _recursive_smooth(losses, alpha, period, float(losses[1:period + 1].mean()))
+    return _rsi_from_averages(avg_gain, avg_loss), avg_gain, avg_loss
+
+
+def _rsi_from_averages(avg_gain, avg_loss):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = avg_gain / avg_loss
+        out = 100 - 100 / (1 + rs)
+    return np.where((avg_loss == 0) & ~np.isnan(avg_gain), 100.0, out)
+
+
+def true_range(high, low, close):
+    prev_close = np.r_[close[0], close[:-1]]
+    tr = np.maximum(high - low, np.maximum(np.abs(high - prev_close), np.abs(low - prev_close)))
+    tr[0] = high[0] - low[0]
+    return tr
+
+
+def atr(high, low, close, period=ATR_PERIOD):
+    """ATR（Wilder 平滑），以前 period 筆 TR 平均為起始值"""
+    tr = true_range(high, low, close)
+    if len(tr) < period:
+        return np.full(len(tr), np.nan)
+    return _recursive_smooth(tr, 1 / period, period - 1, float(tr[:period].mean()))
+
+
+def compute_indicators(arrays):
+    """
+    以完整歷史計算所有指標
+
+    Args:
+        arrays (dict): charting.load_price_arrays 的欄位陣列
+
+    Returns:
+        (values, state): values 為 {欄位: np.ndarray}；state 為可 JSON 序列化的遞迴狀態
+    """
+    close, high, low = arrays['close'], arrays['high'], arrays['low']
+    n = len(close)
+
+    ema_fast = ema(close, MACD_FAST)
+    ema_slow = ema(close, MACD_SLOW)
+    macd_line = ema_fast - ema_slow
+    signal = np.full(n, np.nan)
+    first_macd = MACD_SLOW - 1
+    if n >= first_macd + MACD_SIGNAL:
+        seed = float(np.mean(macd_line[first_macd:first_macd + MACD_SIGNAL]))
+        signal = _recursive_smooth(macd_line, 2 / (MACD_SIGNAL + 1), first_macd + MACD_SIGNAL - 1, seed)
+    rsi_values, avg_gain, avg_loss = rsi(close)
+    atr_values = atr(high, low, close)
+    bb_mid = sma(close, BB_PERIOD)
+    bb_std = rolling_std(close, BB_PERIOD)
+
+    values = {
+        'sma5': sma(close, 5),
+        'sma20': bb_mid,
+        'sma60': sma(close, 60),
+        'ema12': ema_fast,
+        'ema26': ema_slow,
+        'rsi14': rsi_values,
+        'macd': macd_line,
+        'macd_signal': signal,
+        'macd_hist': macd_line - signal,
+        'bb_upper': bb_mid + BB_WIDTH * bb_std,
+        'bb_middle': bb_mid,
+        'bb_lower': bb_mid - BB_WIDTH * bb_std,
+        'atr14': atr_values,
+    }
+
+    state = None
+    if n >= WARMUP_BARS:
+        state = {
+            'count': n,
+            'last_close': float(close[-1]),
+            'closes_tail': close[-(WARMUP_BARS - 1):].tolist(),
+            'ema12': float(ema_fast[-1]),
+            'ema26': float(ema_slow[-1]),
+            'macd_signal': float(signal[-1]),
+            'avg_gain': float(avg_gain[-1]),
+            'avg_loss': float(avg_loss[-1]),
+            'atr14': float(atr_values[-1]),
+        }
+    return values, state
+
+
+# ============================================================
+# 增量計算（只處理新 K 棒）
+# ============================================================
+
+def update_indicators_incremental(state, arrays):
+    """
+    由既有狀態接續計算新 K 棒的指標
+
+    Args:
+        state (dict): compute_indicators 產生的狀態
+        arrays (dict): 只包含新 K 棒的欄位陣列（依日期排序）
+
+    Returns:
+        (values, state): 與 compute_indicators 相同格式，只涵蓋新 K 棒
+    """
+    n = len(arrays['close'])
+    values = {field: np.full(n, np.nan) for field in INDICATOR_FIELDS}
+    state = dict(state)
+    tail = list(state['closes_tail'])
+    a_fast, a_slow, a_sig = 2 / (MACD_FAST + 1), 2 / (MACD_SLOW + 1), 2 / (MACD_SIGNAL + 1)
+
+    for i in range(n):
+        c = float(arrays['close'][i])
+        h = float(arrays['high'][i])
+        l = float(arrays['low'][i])
+        prev_close = state['last_close']
+
+        window = np.array(tail + [c])
+        ema_fast = a_fast * c + (1 - a_fast) * state['ema12']
+        ema_slow = a_slow * c + (1 - a_slow) * state['ema26']
+        macd_line = ema_fast - ema_slow
+        signal = a_sig * macd_line + (1 - a_sig) * state['macd_signal']
+
+        delta = c - prev_close
+        avg_gain = (state['avg_gain'] * (RSI_PERIOD - 1) + max(delta, 0.0)) / RSI_PERIOD
+        avg_loss = (state['avg_loss'] * (RSI_PERIOD - 1) + max(-delta, 0.0)) / RSI_PERIOD
+        tr = max(h - l, abs(h - prev_close), abs(l - prev_close))
+        atr_value = (state['atr14'] * (ATR_PERIOD - 1) + tr) / ATR_PERIOD
+
+        bb_window = window[-BB_PERIOD:]
+        bb_mid = float(bb_window.mean())
+        bb_std = float(bb_window.std())
+
+        values['sma5'][i] = window[-5:].mean()
+        values['sma20'][i] = bb_mid
+        values['sma60'][i] = window[-60:].mean()
+        values['ema12'][i] = ema_fast
+        values['ema26'][i] = ema_slow
+        values['rsi14'][i] = 100.0 if avg_loss == 0 else 100 - 100 / (1 + avg_gain / avg_loss)
+        values['macd'][i] = macd_line
+        values['macd_signal'][i] = signal
+        values['macd_hist'][i] = macd_line - signal
+        values['bb_upper'][i] = bb_mid + BB_WIDTH * bb_std
+        values['bb_middle'][i] = bb_mid
+        values['bb_lower'][i] = bb_mid - BB_WIDTH * bb_std
+        values['atr14'][i] = atr_value
+
+        tail = (tail + [c])[-(WARMUP_BARS - 1):]
+        state.update({
+            'count': state['count'] + 1,
+            'last_close': c,
+            'closes_tail': tail,
+            'ema12': ema_fast,
+            'ema26': ema_slow,
+            'macd_signal': signal,
+            'avg_gain': avg_gain,
+            'avg_loss': avg_loss,
+            'atr14': atr_value,
+        })
+
+    return values, state
+
+
+# ============================================================
+# 儲存與查詢
+# ============================================================
+
+def update_indicators(stock, force=False):
+    """
+    更新股票的技術指標
+
+    有有效狀態且歷史未被改寫（最後一根 K 棒收盤價一致）時只計算新 K 棒；
+    否則（首次計算、資料不足、還原權值改寫歷史）完整重算並取代既有資料
+
+    Returns:
+        int: 寫入的列數
+    """
+    from .charting import load_price_arrays
+    from .models import IndicatorState
+    from .timeseries import write_indicators
+
+    saved = IndicatorState.objects.filter(stock=stock).first()
+
+    if saved is not None and not force:
+        arrays = load_price_arrays(stock, start=saved.last_date)
+        dates = arrays['date']
+        consistent = (
+            len(dates) > 0
+            and dates[0] == np.datetime64(saved.last_date, 'D')
+            and float(arrays['close'][0]) == saved.state.get('last_close')
+        )
+        if consistent:
+            if len(dates) == 1:
+                return 0
+            new = {key: arr[1:] for key, arr in arrays.items()}
+            values, state = update_indicators_incremental(saved.state, new)
+            # 先寫指標再存狀態：中途失敗時下次會從舊狀態重算並覆寫相同日期
+            write_indicators(stock, new['date'], values)
+            saved.last_date = new['date'][-1].item()
+            saved.state = state
+            saved.save(update_fields=['last_date', 'state', 'updated_at'])
+            return len(new['date'])
+        print(f"[Indicators] {stock.ticker} 歷史資料已變動，改為完整重算")
+
+    arrays = load_price_arrays(stock)
+    if len(arrays['date']) == 0:
+        return 0
+    values, state = compute_indicators(arrays)
+    write_indicators(stock, arrays['date'], values, replace=True)
+    if state is not None:
+        IndicatorState.objects.update_or_create(
+            stock=stock,
+            defaults={'last_date': arrays['date'][-1].item(), 'state': state},
+        )
+    else:
+        IndicatorState.objects.filter(stock=stock).delete()
+    return len(arrays['date'])
+
+
+def get_indicator_series(stock, dates, fields):
+    """
+    取得與指定日期對齊的指標序列（日期缺漏處為 None）
+
+    Args:
+        stock (Stock): 股票
+        dates (np.ndarray): datetime64[D] 日期陣列
+        fields (list): INDICATOR_FIELDS 的子集合
+
+    Returns:
+        dict: {欄位: [值, ...]}；區間內沒有任何指標資料（尚未執行 rebuild_indicators）時為 None，
+            讓前端改用自己的計算
+    """
+    from .models import TechnicalIndicator
+
+    fields = [f for f in fields if f in INDICATOR_FIELDS]
+    if not fields or len(dates) == 0:
+        return {f: [] for f in fields}
+
+    date_list = dates.tolist()
+    rows = TechnicalIndicator.objects.filter(
+        stock=stock, date__gte=min(date_list), date__lte=max(date_list)
+    ).values_list('date', *fields)
+    by_date = {row[0]: row[1:] for row in rows}
+    if not by_date:
+        return None
+
+    series = {f: [] for f in fields}
+    for date in date_list:
+        row = by_date.get(date)
+        for j, f in enumerate(fields):
+            series[f].append(row[j] if row else None)
+    return series
@@ -0,0 +1,142 @@
+"""
+盤中 5 分鐘 K 棒
+背景任務於交易時段定期呼叫 update_intraday，只向 Yahoo 取上次儲存時間之後的 K 棒並 upsert；
+詳細頁以 get_intraday_series 直接讀取最近一個交易時段，不必每次瀏覽都呼叫外部 API
+"""
+from datetime import datetime, timedelta
+
+import pytz
+from django.conf import settings
+from django.utils import timezone
+
+from .market_calendar import MARKETS
+
+INTERVAL = '5m'
+# Yahoo 的 5 分鐘 K 只提供最近 60 天
+MAX_HISTORY_DAYS = 59
+
+
+def _retention_days():
+    return getattr(settings, 'INTRADAY_RETENTION_DAYS', 5)
+
+
+def _market_tz(market):
+    spec = MARKETS.get(market)
+    return pytz.timezone(spec['tz'] if spec else 'UTC')
+
+
+def _download(ticker, start=None):
+    import yfinance as yf
+
+    yf_ticker = yf.Ticker(ticker)
+    if start is None:
+        period = f"{min(_retention_days(), MAX_HISTORY_DAYS)}d"
+        return yf_ticker.history(period=period, interval=INTERVAL)
+    return yf_ticker.history(start=start, interval=INTERVAL)
+
+
+def _frame_to_rows(stock, df):
+    from .models import IntradayBar
+
+    df = df.dropna(subset=['Open', 'High', 'Low', 'Close'])
+    tz = _market_tz(stock.market)
+    rows = []
+    for ts, o, h, l, c, v in zip(
+        df.index.to_pydatetime(), df['Open'].round(2).tolist(), df['High'].round(2).tolist(),
+        df['Low'].round(2).tolist(), df['Close'].round(2).tolist(), df['Volume'].fillna(0).tolist(),
+    ):
+        if timezone.is_naive(ts):
+            ts = tz.localize(ts)
+        rows.append(IntradayBar(stock=stock, timestamp=ts, open=o, high=h, low=l, close=c, volume=int(v)))
+    return rows
+
+
+def update_intraday(stock):
+    """
+    追加新的 5 分鐘 K 棒
+
+    從最後一根已儲存的 K 棒開始重抓（該根可能在上次抓取時尚未收完），
+    首次抓取則回溯 INTRADAY_RETENTION_DAYS 天
+
+    Returns:
+        int: 寫入（新增或更新）的 K 棒數
+    """
+    from .models import IntradayBar
+
+    last = (
+        IntradayBar.objects.filter(stock=stock)
+        .order_by('-timestamp')
+        .values_list('timestamp', flat=True)
+        .first()
+    )
+    df = _download(stock.ticker, start=last)
+    if df is None or df.empty:
+        return 0
+    if last is not None:
+        df = df[df.index >= last]
+
+    rows = _frame_to_rows(stock, df)
+    IntradayBar.objects.bulk_create(
+        rows,
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=['stock', 'timestamp'],
+        update_fields=['open', 'high', 'low', 'close', 'volume'],
+    )
+    return len(rows)
+
+
+def purge_expired(days=None):
+    """刪除超過保留天數的盤中 K 棒，回傳刪除筆數"""
+    from .models import IntradayBar
+
+    days = _retention_days() if days is None else days
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = IntradayBar.objects.filter(timestamp__lt=cutoff).delete()
+    return deleted
+
+
+def update_open_markets(now=None):
+    """
+    背景任務入口：更新開盤中（含收盤後的緩衝時間）市場內所有被追蹤股票的盤中 K 棒，並清除過期資料
+    """
+    from .models import Stock
+    from .market_calendar import is_market_open
+
+    now = now or datetime.now(pytz.utc)
+    grace = timedelta(minutes=getattr(settings, 'INTRADAY_CLOSE_GRACE_MINUTES', 10))
+    markets = [m for m in MARKETS if is_market_open(m, now) or is_market_open(m, now - grace)]
+
+    total = 0
+    if markets:
+        stocks = Stock.objects.filter(market__in=markets, watchers__isnull=False).distinct()
+        for stock in stocks:
+            try:
+                total += update_intraday(stock)
+            except Exception as e:
+                print(f"[Intraday] Error updating {stock.ticker}: {e}")
+
+    purged = purge_expired()
+    print(f"[Intraday] markets={markets or '-'} 寫入 {total} 根 K 棒，清除 {purged} 根過期資料")
+    return total
+
+
+def get_intraday_series(stock):
+    """
+    最近一個交易時段的盤中走勢（依市場時區）
+
+    Returns:
+        list: [['HH:MM', close], ...]
+    """
+    from .models import IntradayBar
+
+    bars = IntradayBar.objects.filter(stock=stock)
+    latest = bars.order_by('-timestamp').values_list('timestamp', flat=True).first()
+    if latest is None:
+        return []
+
+    tz = _market_tz(stock.market)
+    local = latest.astimezone(tz)
+    session_start = tz.localize(datetime(local.year, local.month, local.day))
+    rows = bars.filter(timestamp__gte=session_start).order_by('timestamp').values_list('timestamp', 'close')
+    return [[ts.astimezone(tz).strftime('%H:%M'), float(close)] for ts, close in rows]
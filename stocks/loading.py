@@ -0,0 +1,74 @@
+"""
+新加入股票的載入狀態
+背景任務完成資料寫入（交易提交後）時在共用快取留下完成通知；
+儀表板以長輪詢等待通知，等待期間只讀取快取，收到通知才以單一查詢確認哪些股票已可顯示
+"""
+import asyncio
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+
+EVENTS_CACHE_ALIAS = 'events'
+# 完成通知的保留時間（秒），只需涵蓋儀表板仍在等待的期間
+NOTIFY_TTL = 3600
+
+
+def _key(ticker):
+    return f"ingested:{ticker}"
+
+
+def notify_ingested(ticker, ok=True):
+    """
+    通知等待中的儀表板：此股票的資料抓取已結束（ok=False 表示抓取失敗）
+    在交易提交後才寫入，避免通知早於資料可見
+    """
+    def _notify():
+        caches[EVENTS_CACHE_ALIAS].set(_key(ticker), {'ok': ok, 'at': time.time()}, timeout=NOTIFY_TTL)
+
+    transaction.on_commit(_notify)
+
+
+def ready_queryset(tickers):
+    """已有報價或日 K 的股票（單一查詢）"""
+    from .models import Stock, StockPrice
+
+    return (
+        Stock.objects.filter(ticker__in=tickers)
+        .filter(Q(last_price__isnull=False) | Exists(StockPrice.objects.filter(stock=OuterRef('pk'))))
+        .values_list('ticker', flat=True)
+    )
+
+
+async def wait_for_ready(tickers, timeout):
+    """
+    等待任一股票載入完成或逾時
+
+    Returns:
+        (ready, failed): ready 為已可顯示的股票；failed 為抓取已結束但仍無資料的股票
+    """
+    cache = caches[EVENTS_CACHE_ALIAS]
+    keys = [_key(t) for t in tickers]
+    interval = getattr(settings, 'LOADING_WAIT_INTERVAL', 0.5)
+    deadline = time.monotonic() + timeout
+
+    seen = await cache.aget_many(keys)
+    while True:
+        ready = {t async for t in ready_queryset(tickers)}
+        signals = await cache.aget_many(keys)
+        failed = {
+            t for t in tickers
+            if t not in ready and not signals.get(_key(t), {}).get('ok', True)
+        }
+        if ready or failed or time.monotonic() >= deadline:
+            return sorted(ready), sorted(failed)
+
+        # 等待新的完成通知（只讀快取，不查資料庫）
+        while time.monotonic() < deadline:
+            await asyncio.sleep(interval)
+            signals = await cache.aget_many(keys)
+            if signals != seen:
+                seen = signals
+                break
@@ -0,0 +1,101 @@
+import json
+import tempfile
+import time
+from datetime import date, timedelta
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from stocks import columnar
+from stocks.charting import load_price_arrays
+from stocks.models import Stock, StockPrice
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Benchmarks ORM vs columnar (mmap) price reads on synthetic data. '
+            'All rows are created inside a transaction that is rolled back afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tickers', nargs='+', type=int, default=[1, 500], help='Ticker counts to benchmark.')
+        parser.add_argument('--bars', type=int, default=1250, help='Daily bars per ticker (about 5 years).')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement; the best run is reported.')
+        parser.add_argument('--json', dest='json_path', help='Also write results to this JSON file.')
+
+    def handle(self, *args, **options):
+        results = []
+        try:
+            with transaction.atomic():
+                with tempfile.TemporaryDirectory() as root:
+                    stocks = self._seed(max(options['tickers']), options['bars'], root)
+                    for count in options['tickers']:
+                        results.append(self._measure(stocks[:count], root, options['repeat']))
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+        self.stdout.write(f"{'tickers':>8} {'orm models':>12} {'orm values':>12} {'columnar':>10} {'speedup':>8}")
+        for r in results:
+            self.stdout.write(
+                f"{r['tickers']:>8} {r['orm_models_ms']:>10.1f}ms {r['orm_values_ms']:>10.1f}ms "
+                f"{r['columnar_ms']:>8.2f}ms {r['speedup_vs_values']:>7.0f}x"
+            )
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump({'bars_per_ticker': options['bars'], 'results': results}, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['json_path']}"))
+
+    def _seed(self, count, bars, root):
+        rng = np.random.default_rng(42)
+        start = date.today() - timedelta(days=bars)
+        stocks = []
+        for i in range(count):
+            stock = Stock.objects.create(ticker=f"BENCH{i:04d}")
+            closes = np.round(100 + np.cumsum(rng.normal(0, 1, bars)), 2)
+            StockPrice.objects.bulk_create([
+                StockPrice(stock=stock, date=start + timedelta(days=d), open=c, high=c + 1,
+                           low=c - 1, close=c, volume=1_000_000 + d)
+                for d, c in enumerate(closes)
+            ], batch_size=2000)
+            columnar.sync_ticker(stock, root=root)
+            stocks.append(stock)
+        return stocks
+
+    def _best(self, fn, repeat):
+        best = float('inf')
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - t0)
+        return best * 1000
+
+    def _measure(self, stocks, root, repeat):
+        def orm_models():
+            for stock in stocks:
+                for p in StockPrice.objects.filter(stock=stock).order_by('date'):
+                    p.close
+
+        def orm_values():
+            for stock in stocks:
+                load_price_arrays(stock, use_columnar=False)
+
+        def columnar_reads():
+            for stock in stocks:
+                arrays = columnar.read_range(stock.ticker, root=root)
+                arrays['close'][-1]
+
+        orm_models_ms = self._best(orm_models, repeat)
+        orm_values_ms = self._best(orm_values, repeat)
+        columnar_ms = self._best(columnar_reads, repeat)
+        return {
+            'tickers': len(stocks),
+            'orm_models_ms': round(orm_models_ms, 2),
+            'orm_values_ms': round(orm_values_ms, 2),
+            'columnar_ms': round(columnar_ms, 3),
+            'speedup_vs_values': round(orm_values_ms / columnar_ms, 1) if columnar_ms else None,
+        }
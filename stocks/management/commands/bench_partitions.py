@@ -0,0 +1,134 @@
+import json
+import random
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+BASE_DATE = date(2000, 1, 1)
+LAYOUTS = {
+    'plain': '',
+    'year': 'PARTITION BY RANGE (date)',
+    'hash': 'PARTITION BY HASH (stock_id)',
+}
+
+
+class Command(BaseCommand):
+    help = ('Benchmarks StockPrice-shaped upserts and range reads on PostgreSQL for a plain table versus '
+            'year-range and stock-hash partitioned tables, on synthetic data in scratch tables that are dropped '
+            'afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', nargs='+', type=int, default=[10_000_000, 50_000_000],
+                            help='Synthetic row counts to benchmark.')
+        parser.add_argument('--tickers', type=int, default=5000, help='Number of synthetic tickers.')
+        parser.add_argument('--layouts', nargs='+', choices=sorted(LAYOUTS), default=['plain', 'year', 'hash'])
+        parser.add_argument('--hash-partitions', type=int, default=16)
+        parser.add_argument('--repeat', type=int, default=20, help='Operations per measurement (median reported).')
+        parser.add_argument('--json', dest='json_path', help='Also write results to this JSON file.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('bench_partitions requires PostgreSQL.')
+
+        results = []
+        for rows in options['rows']:
+            days = max(rows // options['tickers'], 1)
+            for layout in options['layouts']:
+                table = f'bench_stockprice_{layout}'
+                try:
+                    seconds = self._create(table, layout, options['tickers'], days, options['hash_partitions'])
+                    result = self._measure(table, options['tickers'], days, options['repeat'])
+                finally:
+                    with connection.cursor() as cursor:
+                        cursor.execute(f'DROP TABLE IF EXISTS {table}')
+                result.update({'rows': options['tickers'] * days, 'layout': layout, 'seed_s': round(seconds, 1)})
+                results.append(result)
+                self.stdout.write(
+                    f"{result['rows']:>12,} {layout:>6}  upsert {result['upsert_ms']:>8.2f}ms  "
+                    f"range(1y) {result['range_ms']:>7.2f}ms  latest(5) {result['latest_ms']:>6.2f}ms  "
+                    f"(seeded in {result['seed_s']}s)"
+                )
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump({'tickers': options['tickers'], 'results': results}, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['json_path']}"))
+
+    def _create(self, table, layout, tickers, days, hash_partitions):
+        start = time.perf_counter()
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {table}')
+            cursor.execute(
+                f'CREATE TABLE {table} (id bigserial, stock_id bigint NOT NULL, date date NOT NULL, '
+                f'open numeric(10, 2) NOT NULL, high numeric(10, 2) NOT NULL, low numeric(10, 2) NOT NULL, '
+                f'close numeric(10, 2) NOT NULL, volume bigint NOT NULL) {LAYOUTS[layout]}'
+            )
+            if layout == 'year':
+                last = BASE_DATE + timedelta(days=days)
+                for year in range(BASE_DATE.year, last.year + 2):
+                    cursor.execute(
+                        f"CREATE TABLE {table}_y{year} PARTITION OF {table} "
+                        f"FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')"
+                    )
+            elif layout == 'hash':
+                for remainder in range(hash_partitions):
+                    cursor.execute(
+                        f'CREATE TABLE {table}_h{remainder} PARTITION OF {table} '
+                        f'FOR VALUES WITH (MODULUS {hash_partitions}, REMAINDER {remainder})'
+                    )
+            # 與 StockPrice 相同的寫入順序（依股票逐批寫入歷史資料）
+            cursor.execute(
+                f"INSERT INTO {table} (stock_id, date, open, high, low, close, volume) "
+                f"SELECT s, %s::date + d, 100, 101, 99, 100 + (s + d) %% 50, 1000 "
+                f"FROM generate_series(1, %s) AS s CROSS JOIN generate_series(0, %s) AS d",
+                [BASE_DATE, tickers, days - 1],
+            )
+            cursor.execute(f'CREATE UNIQUE INDEX ON {table} (stock_id, date)')
+            cursor.execute(f'ANALYZE {table}')
+        return time.perf_counter() - start
+
+    def _measure(self, table, tickers, days, repeat):
+        rng = random.Random(42)
+        last = BASE_DATE + timedelta(days=days - 1)
+        upsert, range_read, latest = [], [], []
+        with connection.cursor() as cursor:
+            for _ in range(repeat):
+                stock_id = rng.randint(1, tickers)
+
+                # 每次抓取：最近 5 年日 K upsert（大部分為既有列，最後 5 天為新資料）
+                started = time.perf_counter()
+                cursor.execute(
+                    f"INSERT INTO {table} (stock_id, date, open, high, low, close, volume) "
+                    f"SELECT %s, d::date, 100, 101, 99, 101, 2000 "
+                    f"FROM generate_series(%s::date, %s::date, interval '1 day') AS d "
+                    f"ON CONFLICT (stock_id, date) DO UPDATE SET close = EXCLUDED.close, volume = EXCLUDED.volume",
+                    [stock_id, last - timedelta(days=5 * 365), last + timedelta(days=5)],
+                )
+                upsert.append(time.perf_counter() - started)
+                cursor.execute(f'DELETE FROM {table} WHERE stock_id = %s AND date > %s', [stock_id, last])
+
+                # 走勢圖：一年區間
+                start = BASE_DATE + timedelta(days=rng.randint(0, max(days - 366, 0)))
+                started = time.perf_counter()
+                cursor.execute(
+                    f'SELECT date, close FROM {table} WHERE stock_id = %s AND date >= %s AND date <= %s ORDER BY date',
+                    [stock_id, start, start + timedelta(days=365)],
+                )
+                cursor.fetchall()
+                range_read.append(time.perf_counter() - started)
+
+                # 詳細頁：最近 5 根（與 StockPriceQuerySet.latest_bars 相同的回溯範圍）
+                started = time.perf_counter()
+                cursor.execute(
+                    f'SELECT date, close FROM {table} WHERE stock_id = %s AND date >= %s ORDER BY date DESC LIMIT 5',
+                    [stock_id, last - timedelta(days=45)],
+                )
+                cursor.fetchall()
+                latest.append(time.perf_counter() - started)
+
+        def median_ms(samples):
+            return sorted(samples)[len(samples) // 2] * 1000
+
+        return {'upsert_ms': median_ms(upsert), 'range_ms': median_ms(range_read), 'latest_ms': median_ms(latest)}
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from stocks.market_calendar import get_calendar
+from stocks.models import Stock, StockPrice
+
+class Command(BaseCommand):
+    help = 'Reports trading days missing from stored daily prices, based on the exchange calendar.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('tickers', nargs='*', type=str, help='Tickers to check (default: all stocks).')
+        parser.add_argument('--show', type=int, default=5, help='Number of missing dates to list per stock.')
+
+    def handle(self, *args, **options):
+        stocks = Stock.objects.all()
+        if options['tickers']:
+            stocks = stocks.filter(ticker__in=options['tickers'])
+
+        with_gaps = 0
+        for stock in stocks.iterator():
+            calendar = get_calendar(stock.market)
+            if calendar is None:
+                continue
+            dates = StockPrice.objects.filter(stock=stock).values_list('date', flat=True)
+            gaps = calendar.find_gaps(dates)
+            if not gaps:
+                continue
+            with_gaps += 1
+            shown = ', '.join(d.isoformat() for d in gaps[:options['show']])
+            more = f' ... (+{len(gaps) - options["show"]})' if len(gaps) > options['show'] else ''
+            self.stdout.write(f'{stock.ticker}: {len(gaps)} missing trading days: {shown}{more}')
+            uncovered = sorted({d.year for d in gaps} - calendar.covered_years)
+            if uncovered:
+                years = ', '.join(str(y) for y in uncovered)
+                self.stdout.write(self.style.WARNING(
+                    f'  no {stock.market} holiday data for {years}; holidays in those years are reported as gaps'))
+
+        self.stdout.write(self.style.SUCCESS(f'Checked price history; {with_gaps} stocks have gaps.'))
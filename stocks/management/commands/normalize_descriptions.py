@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from stocks.descriptions import normalize_description
+from stocks.models import Stock
+
+BATCH_SIZE = 200
+
+class Command(BaseCommand):
+    help = 'Backfills normalized company descriptions (original text, language and Traditional Chinese translation).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('tickers', nargs='*', type=str, help='Tickers to normalize (default: all stocks).')
+        parser.add_argument('--all', action='store_true', help='Re-normalize stocks that were already processed.')
+        parser.add_argument('--no-translate', action='store_true',
+                            help='Only split and deduplicate paragraphs; leave missing translations empty.')
+
+    def handle(self, *args, **options):
+        stocks = Stock.objects.exclude(description='')
+        if options['tickers']:
+            stocks = stocks.filter(ticker__in=options['tickers'])
+        if not options['all']:
+            # 尚未正規化，或先前翻譯失敗而沒有中文簡介
+            stocks = stocks.filter(Q(description_lang='') | Q(description_zh=''))
+
+        fields = ['description', 'description_lang', 'description_zh']
+        pending, updated = [], 0
+        for stock in stocks.only('ticker', *fields).iterator(chunk_size=BATCH_SIZE):
+            if normalize_description(stock, translate_missing=not options['no_translate']):
+                pending.append(stock)
+            if len(pending) >= BATCH_SIZE:
+                Stock.objects.bulk_update(pending, fields)
+                updated += len(pending)
+                pending = []
+        if pending:
+            Stock.objects.bulk_update(pending, fields)
+            updated += len(pending)
+
+        self.stdout.write(self.style.SUCCESS(f'Normalized {updated} stock descriptions.'))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from stocks import partitioning
+
+
+class Command(BaseCommand):
+    help = ('Maintains the partitioned StockPrice table on PostgreSQL: creates upcoming yearly partitions '
+            '(run it periodically, e.g. monthly), converts between partitioning schemes, or shows partition stats.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--convert', choices=sorted(partitioning.SCHEMES),
+                            help='Rebuild StockPrice with this partitioning scheme (copies all rows).')
+        parser.add_argument('--hash-partitions', type=int, help='Number of hash partitions for --convert hash.')
+        parser.add_argument('--unpartition', action='store_true', help='Rebuild StockPrice as a plain table.')
+        parser.add_argument('--years-ahead', type=int, help='Yearly partitions to create beyond the current year.')
+        parser.add_argument('--status', action='store_true', help='Only list partitions.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('StockPrice partitioning is only supported on PostgreSQL.')
+
+        if options['convert']:
+            partitioning.partition_prices(options['convert'], hash_partitions=options['hash_partitions'])
+        elif options['unpartition']:
+            partitioning.unpartition_prices()
+        elif not options['status']:
+            created = partitioning.ensure_year_partitions(years_ahead=options['years_ahead'])
+            self.stdout.write(f"Created partitions for years: {created or '-'}")
+
+        scheme = partitioning.current_scheme()
+        if scheme is None:
+            self.stdout.write('StockPrice is not partitioned.')
+            return
+        self.stdout.write(f'StockPrice is partitioned by {scheme}:')
+        for name, bound, rows, size in partitioning.partition_stats():
+            self.stdout.write(f'  {name:<32} {bound:<48} ~{rows:>12,} rows {size:>10}')
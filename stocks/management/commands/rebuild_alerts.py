@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from stocks.alerts import refresh_alerts
+from stocks.models import Stock
+
+class Command(BaseCommand):
+    help = 'Re-evaluates the financial alert rules for stocks in one pass (e.g. after changing the rules).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('tickers', nargs='*', type=str, help='Tickers to re-evaluate (default: all stocks).')
+
+    def handle(self, *args, **options):
+        stocks = Stock.objects.all()
+        if options['tickers']:
+            stocks = stocks.filter(ticker__in=options['tickers'])
+
+        changed = refresh_alerts(stocks)
+        self.stdout.write(self.style.SUCCESS(f'Updated alerts for {changed} stocks.'))
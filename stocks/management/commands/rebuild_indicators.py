@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from stocks.models import Stock
+from stocks.indicators import update_indicators
+
+class Command(BaseCommand):
+    help = 'Computes technical indicators (SMA/EMA, RSI, MACD, Bollinger, ATR) from stored daily bars.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('tickers', nargs='*', type=str, help='Tickers to update (default: all stocks).')
+        parser.add_argument('--force', action='store_true', help='Recompute full history instead of appending new bars.')
+
+    def handle(self, *args, **options):
+        stocks = Stock.objects.all()
+        if options['tickers']:
+            stocks = stocks.filter(ticker__in=options['tickers'])
+
+        total = 0
+        for stock in stocks.iterator():
+            total += update_indicators(stock, force=options['force'])
+
+        self.stdout.write(self.style.SUCCESS(f'Wrote {total} indicator rows.'))
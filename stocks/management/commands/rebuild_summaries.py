@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from stocks.models import Stock
+from stocks.utils import update_stock_summary
+
+class Command(BaseCommand):
+    help = 'Rebuilds the precomputed dashboard summary (sparkline, 52-week range, volume) for stocks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('tickers', nargs='*', type=str, help='Tickers to rebuild (default: all stocks).')
+        parser.add_argument('--force', action='store_true', help='Recompute even if the latest bar has not changed.')
+
+    def handle(self, *args, **options):
+        stocks = Stock.objects.all()
+        if options['tickers']:
+            stocks = stocks.filter(ticker__in=options['tickers'])
+
+        updated = 0
+        for stock in stocks.iterator():
+            if update_stock_summary(stock, force=options['force']) is not None:
+                updated += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {updated} stock summaries.'))
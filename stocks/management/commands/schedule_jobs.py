@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from stocks.tasks import schedule_intraday_updates, schedule_sentiment_warmup
+
+
+class Command(BaseCommand):
+    help = 'Ensures the recurring background jobs are scheduled (run before process_tasks on worker startup).'
+
+    def handle(self, *args, **options):
+        if schedule_intraday_updates():
+            self.stdout.write(self.style.SUCCESS('Scheduled the recurring intraday bar update'))
+        else:
+            self.stdout.write('Intraday bar update already scheduled')
+
+        if schedule_sentiment_warmup():
+            self.stdout.write(self.style.SUCCESS('Scheduled sentiment model warm-up ahead of the hourly fetch'))
+        else:
+            self.stdout.write('Sentiment model warm-up already scheduled')
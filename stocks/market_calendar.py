@@ -0,0 +1,217 @@
+"""
+交易所行事曆
+依本地假日檔（stocks/data/market_holidays.json，可由 MARKET_HOLIDAYS_PATH 覆蓋）預先計算各市場每年的交易時段表
+（含假日與提前收盤），開收盤判斷、下一個開盤時間與區間交易日數皆以 bisect 查表（O(log n)），
+不再每次呼叫都建立時區化的 datetime
+假日檔未涵蓋的年份只能排除週末（國定假日會被當成交易日），計算該年時會印出警告
+"""
+import bisect
+import json
+import threading
+import time as time_module
+from datetime import date, datetime, time, timedelta
+from pathlib import Path
+
+import pytz
+from django.conf import settings
+from django.utils import timezone
+
+MARKETS = {
+    'US': {'tz': 'America/New_York', 'open': time(9, 30), 'close': time(16, 0)},
+    'TW': {'tz': 'Asia/Taipei', 'open': time(9, 0), 'close': time(13, 30)},
+}
+DEFAULT_HOLIDAYS_PATH = Path(__file__).resolve().parent / 'data' / 'market_holidays.json'
+
+
+def _to_timestamp(value):
+    if value is None:
+        return time_module.time()
+    if isinstance(value, (int, float)):
+        return float(value)
+    return value.timestamp()
+
+
+class MarketCalendar:
+    """
+    單一市場的交易時段表
+    三個平行的遞增串列：交易日 ordinal、開盤與收盤的 epoch 秒；首次查詢某年份時才計算該年
+    """
+
+    def __init__(self, market, holidays=(), early_closes=None):
+        spec = MARKETS[market]
+        self.market = market
+        self.tz = pytz.timezone(spec['tz'])
+        self.open_time = spec['open']
+        self.close_time = spec['close']
+        self.holidays = frozenset(holidays)
+        self.early_closes = dict(early_closes or {})
+        # 假日檔有資料的年份（每年至少有元旦等假日，沒有任何假日的年份視為未涵蓋）
+        self.covered_years = frozenset(d.year for d in self.holidays)
+        self._years = set()
+        self._table = ([], [], [])
+        self._lock = threading.Lock()
+
+    def _epoch(self, day, at):
+        return self.tz.localize(datetime.combine(day, at)).timestamp()
+
+    def has_holiday_data(self, year):
+        return year in self.covered_years
+
+    def _build_year(self, year):
+        if not self.has_holiday_data(year):
+            print(f"[Calendar] {self.market} 假日檔沒有 {year} 年的資料，該年只排除週末；"
+                  f"請更新 market_holidays.json 或 MARKET_HOLIDAYS_PATH")
+        rows = []
+        day = date(year, 1, 1)
+        while day.year == year:
+            if day.weekday() < 5 and day not in self.holidays:
+                close_at = self.early_closes.get(day, self.close_time)
+                rows.append((day.toordinal(), self._epoch(day, self.open_time), self._epoch(day, close_at)))
+            day += timedelta(days=1)
+        return rows
+
+    def _ensure(self, first_year, last_year=None):
+        """確保年份區間已計算，回傳 (days, opens, closes)"""
+        years = range(first_year, (last_year or first_year) + 1)
+        if all(y in self._years for y in years):
+            return self._table
+        with self._lock:
+            missing = [y for y in years if y not in self._years]
+            rows = list(zip(*self._table))
+            for year in missing:
+                rows.extend(self._build_year(year))
+            rows.sort()
+            # 一次替換整組串列後才標記年份，其他執行緒不會讀到不一致或尚未涵蓋的表
+            self._table = tuple(map(list, zip(*rows))) if rows else ([], [], [])
+            self._years.update(missing)
+        return self._table
+
+    def _around(self, ts):
+        # 以 UTC 年份前後各一年涵蓋任何時區差
+        year = time_module.gmtime(ts).tm_year
+        return self._ensure(year - 1, year + 1)
+
+    def is_open(self, now=None):
+        """now（aware datetime 或 epoch 秒，預設為現在）是否在交易時段內（含收盤時刻）"""
+        ts = _to_timestamp(now)
+        _, opens, closes = self._around(ts)
+        i = bisect.bisect_right(opens, ts) - 1
+        return i >= 0 and ts <= closes[i]
+
+    def next_open(self, now=None):
+        """now 之後的下一次開盤時間（市場時區）"""
+        ts = _to_timestamp(now)
+        _, opens, _ = self._around(ts)
+        i = bisect.bisect_right(opens, ts)
+        if i == len(opens):
+            return None
+        return datetime.fromtimestamp(opens[i], self.tz)
+
+    def session(self, day):
+        """交易日的 (開盤, 收盤) 時間；非交易日回傳 None"""
+        days, opens, closes = self._ensure(day.year)
+        i = bisect.bisect_left(days, day.toordinal())
+        if i == len(days) or days[i] != day.toordinal():
+            return None
+        return datetime.fromtimestamp(opens[i], self.tz), datetime.fromtimestamp(closes[i], self.tz)
+
+    def is_trading_day(self, day):
+        return self.session(day) is not None
+
+    def _bounds(self, start, end):
+        days, _, _ = self._ensure(start.year, end.year)
+        return days, bisect.bisect_left(days, start.toordinal()), bisect.bisect_right(days, end.toordinal())
+
+    def trading_days_between(self, start, end):
+        """start 至 end（含兩端）之間的交易日數"""
+        if end < start:
+            return 0
+        _, lo, hi = self._bounds(start, end)
+        return hi - lo
+
+    def trading_days(self, start, end):
+        """start 至 end（含兩端）之間的交易日"""
+        if end < start:
+            return []
+        days, lo, hi = self._bounds(start, end)
+        return [date.fromordinal(d) for d in days[lo:hi]]
+
+    def find_gaps(self, dates, start=None, end=None):
+        """
+        缺漏的交易日：區間（預設為 dates 的最早至最晚日期）內應有交易、但不在 dates 中的日期
+        """
+        present = set(dates)
+        if not present and (start is None or end is None):
+            return []
+        start = start or min(present)
+        end = end or max(present)
+        return [d for d in self.trading_days(start, end) if d not in present]
+
+
+def _parse_holidays(raw):
+    holidays = {date.fromisoformat(d) for d in raw.get('holidays', {})}
+    early_closes = {
+        date.fromisoformat(d): time.fromisoformat(t)
+        for d, t in raw.get('early_closes', {}).items()
+    }
+    return holidays, early_closes
+
+
+def load_holidays(path=None) -> dict:
+    """
+    讀取假日檔；MARKET_HOLIDAYS_PATH 指向的 JSON 會覆蓋預設檔中對應市場的設定
+    格式：{"US": {"holidays": {"2025-01-01": "說明", ...}, "early_closes": {"2025-11-28": "13:00"}}, ...}
+
+    Returns:
+        dict: {market: (holidays, early_closes)}
+    """
+    raw = {}
+    for candidate in (DEFAULT_HOLIDAYS_PATH, path or getattr(settings, 'MARKET_HOLIDAYS_PATH', None)):
+        if not candidate:
+            continue
+        try:
+            with open(candidate, encoding='utf-8') as f:
+                raw.update(json.load(f))
+        except (OSError, ValueError) as e:
+            print(f"[Calendar] 假日檔載入失敗（{candidate}）: {e}")
+    return {market: _parse_holidays(raw.get(market, {})) for market in MARKETS}
+
+
+_calendars = None
+
+
+def get_calendar(market):
+    """取得市場行事曆（行程內共用）；不支援的市場回傳 None"""
+    global _calendars
+    if _calendars is None:
+        _calendars = {
+            market: MarketCalendar(market, holidays, early_closes)
+            for market, (holidays, early_closes) in load_holidays().items()
+        }
+    return _calendars.get(market)
+
+
+def reload_calendars():
+    """假日檔更新後重新載入"""
+    global _calendars
+    _calendars = None
+
+
+def is_market_open(market, now=None):
+    calendar = get_calendar(market)
+    return calendar is not None and calendar.is_open(now)
+
+
+def is_trading_day(market, day=None):
+    """day（預設為市場當地的今天）是否為交易日；不支援的市場一律視為交易日"""
+    calendar = get_calendar(market)
+    if calendar is None:
+        return True
+    if day is None:
+        day = timezone.now().astimezone(calendar.tz).date()
+    return calendar.is_trading_day(day)
+
+
+def next_market_open(market, now=None):
+    calendar = get_calendar(market)
+    return calendar.next_open(now) if calendar else None
@@ -0,0 +1,444 @@
+"""
+Prometheus 格式的效能指標（/metrics）
+
+不依賴 prometheus_client：指標量少、型別只有 counter / histogram / gauge，以行程內的字典累計即可
+web（多個 gunicorn worker）與 process_tasks 是不同行程，各行程定期把自己的累計值寫入 METRICS_DIR 下的
+<主機>-<pid>.json（最多每 METRICS_FLUSH_INTERVAL 秒一次，行程結束時再寫一次），/metrics 讀取時合併所有檔案；
+METRICS_DIR 為空（預設）時只回報處理該請求的行程本身
+只有 web 與 worker 行程會寫檔（migrate、shell、test 等其他管理指令不寫），同一主機上行程已結束的檔案於讀取時刪除
+
+- 請求：各 view 的延遲、回應狀態與每個請求的 SQL 查詢數（stocks.middleware.MetricsMiddleware）
+- 上游：各資料來源的請求延遲與錯誤數（stocks.upstream 觀察者）
+- 快取：報價與情緒分析快取的命中 / 未命中
+- 背景任務：執行時間（django-background-tasks signals）；佇列深度與延遲於讀取時由資料庫計算
+- 情緒分析：每批標題數、送進模型的標題數與耗時；各行程的模型載入 / 卸載次數
+- 行程：各行程的常駐記憶體 (RSS)
+"""
+import atexit
+import contextvars
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+# 延遲（秒）與筆數的 bucket 上界
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+# 會把累計值寫入 METRICS_DIR 的管理指令（gunicorn / uvicorn 等 web server 行程一律會寫）
+FLUSH_COMMANDS = ('runserver', 'process_tasks')
+
+_lock = threading.Lock()
+_metrics = {}
+
+
+class _Metric:
+    type = ''
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.samples = {}
+        _metrics[name] = self
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.samples[key] = self.samples.get(key, 0) + amount
+        _maybe_flush()
+
+    @staticmethod
+    def merge(a, b):
+        return a + b
+
+
+class Histogram(_Metric):
+    """樣本值為 [各 bucket（非累積）筆數..., 超過最大上界的筆數, 總和]"""
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with _lock:
+            sample = self.samples.get(key)
+            if sample is None:
+                sample = self.samples[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            sample[index] += 1
+            sample[-1] += value
+        _maybe_flush()
+
+    @staticmethod
+    def merge(a, b):
+        return [x + y for x, y in zip(a, b)]
+
+
+class Gauge(_Metric):
+    """行程層級的目前值；以 process 標籤區分各行程，合併時不相加"""
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.samples[key] = value
+
+    @staticmethod
+    def merge(a, b):
+        return b
+
+
+REQUEST_LATENCY = Histogram(
+    'stocks_http_request_duration_seconds', 'Request latency by view', ('view', 'method'))
+RESPONSES = Counter(
+    'stocks_http_responses_total', 'Responses by view and status code', ('view', 'status'))
+REQUEST_QUERIES = Histogram(
+    'stocks_http_request_db_queries', 'SQL queries per request', ('view',), buckets=COUNT_BUCKETS)
+UPSTREAM_LATENCY = Histogram(
+    'stocks_upstream_request_duration_seconds', 'Upstream HTTP latency by data source', ('source',))
+UPSTREAM_REQUESTS = Counter(
+    'stocks_upstream_requests_total', 'Upstream HTTP requests by data source and outcome', ('source', 'outcome'))
+CACHE_REQUESTS = Counter(
+    'stocks_cache_requests_total', 'Cache lookups by cache and result (hit / miss)', ('cache', 'result'))
+TASK_DURATION = Histogram(
+    'stocks_task_duration_seconds', 'Background task run time', ('task', 'outcome'))
+SENTIMENT_BATCH_SIZE = Histogram(
+    'stocks_sentiment_batch_size', 'Titles per sentiment batch (titles: input, model: sent to the model)',
+    ('stage',), buckets=COUNT_BUCKETS)
+SENTIMENT_LATENCY = Histogram(
+    'stocks_sentiment_batch_duration_seconds', 'Sentiment batch latency (total: analyze_batch, model: inference)',
+    ('stage',))
+SENTIMENT_MODEL_LOADS = Gauge(
+    'stocks_sentiment_model_loads', 'Sentiment model loads since the process started', ('process',))
+SENTIMENT_MODEL_UNLOADS = Gauge(
+    'stocks_sentiment_model_unloads', 'Sentiment model idle unloads since the process started', ('process',))
+SENTIMENT_MODEL_LOADED = Gauge(
+    'stocks_sentiment_model_loaded', 'Whether the sentiment model is currently loaded (1 / 0)', ('process',))
+PROCESS_RESIDENT_MEMORY = Gauge(
+    'stocks_process_resident_memory_bytes', 'Resident memory (RSS) of each web / worker process', ('process',))
+
+
+def resident_memory_mb():
+    """目前行程的常駐記憶體 (RSS, MB)；非 Linux 時以峰值近似"""
+    try:
+        with open('/proc/self/statm') as f:
+            rss_pages = int(f.read().split()[1])
+        return round(rss_pages * os.sysconf('SC_PAGE_SIZE') / 1024**2, 2)
+    except (OSError, ValueError, IndexError):
+        try:
+            import resource
+            maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # macOS 單位為 bytes，Linux 為 KB
+            divisor = 1024**2 if sys.platform == 'darwin' else 1024
+            return round(maxrss / divisor, 2)
+        except Exception:
+            return None
+
+
+def _update_process_gauges():
+    """寫檔與輸出前更新本行程的 gauge；情緒分析模組只在已載入的行程（通常是 worker）回報，不在此匯入 torch"""
+    process = f"{socket.gethostname()}-{os.getpid()}"
+    rss = resident_memory_mb()
+    if rss is not None:
+        PROCESS_RESIDENT_MEMORY.set(int(rss * 1024**2), process=process)
+    sentiment = sys.modules.get('stocks.sentiment')
+    if sentiment is not None:
+        stats = sentiment.get_model_stats()
+        SENTIMENT_MODEL_LOADS.set(stats['loads'], process=process)
+        SENTIMENT_MODEL_UNLOADS.set(stats['unloads'], process=process)
+        SENTIMENT_MODEL_LOADED.set(int(stats['loaded']), process=process)
+
+
+def cache_lookup(cache, hits, misses=0):
+    """記錄快取命中 / 未命中次數"""
+    if hits:
+        CACHE_REQUESTS.inc(hits, cache=cache, result='hit')
+    if misses:
+        CACHE_REQUESTS.inc(misses, cache=cache, result='miss')
+
+
+# --- 每個請求的 SQL 查詢數（contextvar 會隨 sync_to_async 傳遞，async view 的查詢也算在同一請求）---
+
+_query_count = contextvars.ContextVar('metrics_query_count', default=None)
+
+
+def _count_query(execute, sql, params, many, context):
+    counter = _query_count.get()
+    if counter is not None:
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+def _install_query_counter(sender, connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+def start_query_count():
+    """開始計算目前 context 內的查詢數；回傳 (counter, token)，結束時呼叫 stop_query_count(token)"""
+    counter = [0]
+    return counter, _query_count.set(counter)
+
+
+def stop_query_count(token):
+    _query_count.reset(token)
+
+
+# --- 上游請求與背景任務 ---
+
+def _observe_upstream(source, host, elapsed, ok):
+    UPSTREAM_LATENCY.observe(elapsed, source=source)
+    UPSTREAM_REQUESTS.inc(source=source, outcome='ok' if ok else 'error')
+
+
+_task_state = threading.local()
+
+
+def _task_started(**kwargs):
+    _task_state.started = time.perf_counter()
+    _task_state.name = None
+    _task_state.outcome = 'ok'
+
+
+def _task_successful(sender, completed_task=None, **kwargs):
+    _task_state.name = getattr(completed_task, 'task_name', None)
+
+
+def _task_error(sender, task=None, **kwargs):
+    _task_state.name = getattr(task, 'task_name', None)
+    _task_state.outcome = 'error'
+
+
+def _task_finished(**kwargs):
+    started = getattr(_task_state, 'started', None)
+    if started is None:
+        return
+    TASK_DURATION.observe(
+        time.perf_counter() - started,
+        task=_task_state.name or 'unknown', outcome=_task_state.outcome,
+    )
+    _task_state.started = None
+
+
+def install():
+    """由 StocksConfig.ready 呼叫：註冊查詢計數、上游觀察者與背景任務 signals"""
+    from django.db.backends.signals import connection_created
+    from background_task import signals as task_signals
+    from . import upstream
+
+    if not getattr(settings, 'METRICS_ENABLED', True):
+        return
+    connection_created.connect(_install_query_counter, dispatch_uid='stocks.metrics.queries')
+    upstream.install()
+    upstream.add_observer(_observe_upstream)
+    task_signals.task_started.connect(_task_started, dispatch_uid='stocks.metrics.task_started')
+    task_signals.task_successful.connect(_task_successful, dispatch_uid='stocks.metrics.task_successful')
+    task_signals.task_error.connect(_task_error, dispatch_uid='stocks.metrics.task_error')
+    task_signals.task_finished.connect(_task_finished, dispatch_uid='stocks.metrics.task_finished')
+
+    global _flush_enabled
+    _flush_enabled = _is_server_process()
+    if _flush_enabled:
+        atexit.register(flush)
+
+
+# --- 跨行程共用（METRICS_DIR）---
+
+_last_flush = 0.0
+_flush_enabled = False
+
+
+def _is_server_process(argv=None):
+    """web server 或 process_tasks 行程；以 manage.py 執行的其他指令（migrate、shell、test…）不算"""
+    argv = sys.argv if argv is None else argv
+    if not argv or Path(argv[0]).name not in ('manage.py', 'django-admin'):
+        return True
+    return len(argv) > 1 and argv[1] in FLUSH_COMMANDS
+
+
+def _metrics_dir():
+    path = getattr(settings, 'METRICS_DIR', '')
+    return Path(path) if path else None
+
+
+def _snapshot_path(directory):
+    return directory / f"{socket.gethostname()}-{os.getpid()}.json"
+
+
+def _pid_alive(pid):
+    if os.name == 'nt':
+        return True  # Windows 的 os.kill 會結束行程，無法用來檢查
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+def _is_stale(path):
+    """同一主機上、pid 已不存在的行程留下的檔案（其他主機的檔案無法判斷，一律保留）"""
+    host, _, pid = path.stem.rpartition('-')
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    return not _pid_alive(int(pid))
+
+
+def _snapshot():
+    _update_process_gauges()
+    with _lock:
+        return {
+            name: [[list(key), list(value) if metric.type == 'histogram' else value]
+                   for key, value in metric.samples.items()]
+            for name, metric in _metrics.items() if metric.samples
+        }
+
+
+def flush():
+    """把本行程的累計值寫入 METRICS_DIR（先寫暫存檔再改名，讀取端不會讀到寫一半的檔案）"""
+    global _last_flush
+    _last_flush = time.monotonic()
+    directory = _metrics_dir()
+    if directory is None or not _flush_enabled:
+        return
+    try:
+        directory.mkdir(parents=True, exist_ok=True)
+        path = _snapshot_path(directory)
+        tmp = path.with_suffix(f'.{threading.get_ident()}.tmp')
+        tmp.write_text(json.dumps(_snapshot()), encoding='utf-8')
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"[Metrics] Error writing {directory}: {e}")
+
+
+def _maybe_flush():
+    if time.monotonic() - _last_flush >= getattr(settings, 'METRICS_FLUSH_INTERVAL', 10):
+        flush()
+
+
+def _collect_samples():
+    """合併所有行程的樣本：{name: {labels: value}}（本行程直接讀記憶體中的累計值）"""
+    snapshots = [_snapshot()]
+    directory = _metrics_dir()
+    if directory is not None and directory.is_dir():
+        own = _snapshot_path(directory)
+        for path in directory.glob('*.json'):
+            if path == own:
+                continue
+            if _is_stale(path):
+                path.unlink(missing_ok=True)
+                continue
+            try:
+                snapshots.append(json.loads(path.read_text(encoding='utf-8')))
+            except (OSError, ValueError):
+                continue  # 其他行程正在改名或檔案已被清除
+
+    merged = {}
+    for snapshot in snapshots:
+        for name, samples in snapshot.items():
+            metric = _metrics.get(name)
+            if metric is None:
+                continue
+            target = merged.setdefault(name, {})
+            for key, value in samples:
+                key = tuple(key)
+                target[key] = metric.merge(target[key], value) if key in target else value
+    return merged
+
+
+# --- 讀取時計算的 gauge ---
+
+def _task_queue_gauges():
+    """背景任務佇列：各佇列待執行的任務數，以及最早到期、尚未被執行的任務已等待的秒數"""
+    from django.db.models import Count, Min
+    from django.utils import timezone
+    from background_task.models import Task
+
+    now = timezone.now()
+    pending = Task.objects.filter(failed_at__isnull=True)
+    depth = {row['queue'] or 'default': row['n'] for row in pending.values('queue').annotate(n=Count('id'))}
+    oldest = {
+        row['queue'] or 'default': row['oldest']
+        for row in pending.filter(run_at__lte=now, locked_by__isnull=True)
+        .values('queue').annotate(oldest=Min('run_at'))
+    }
+    failed = Task.objects.filter(failed_at__isnull=False).count()
+    return [
+        ('stocks_task_queue_depth', 'Pending background tasks by queue',
+         [({'queue': queue}, n) for queue, n in sorted(depth.items())]),
+        ('stocks_task_queue_lag_seconds', 'Age of the oldest due, unclaimed task by queue',
+         [({'queue': queue}, max((now - run_at).total_seconds(), 0)) for queue, run_at in sorted(oldest.items())]
+         or [({'queue': 'default'}, 0)]),
+        ('stocks_task_failed', 'Background tasks that exhausted their retries', [({}, failed)]),
+    ]
+
+
+# --- 輸出 ---
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render():
+    """Prometheus text exposition format（version 0.0.4）"""
+    lines = []
+    merged = _collect_samples()
+    for name, metric in _metrics.items():
+        lines.append(f"# HELP {name} {metric.documentation}")
+        lines.append(f"# TYPE {name} {metric.type}")
+        for key, value in sorted(merged.get(name, {}).items()):
+            pairs = list(zip(metric.labelnames, key))
+            if metric.type in ('counter', 'gauge'):
+                lines.append(f"{name}{_labels(pairs)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets + (float('inf'),), value[:-1]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(pairs + [('le', _number(float(bound)))])} {cumulative}")
+            lines.append(f"{name}_sum{_labels(pairs)} {_number(value[-1])}")
+            lines.append(f"{name}_count{_labels(pairs)} {cumulative}")
+
+    try:
+        gauges = _task_queue_gauges()
+    except Exception as e:
+        print(f"[Metrics] Error reading task queue: {e}")
+        gauges = []
+    for name, documentation, samples in gauges:
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in samples:
+            lines.append(f"{name}{_labels(sorted(labels.items()))} {_number(value)}")
+    return '\n'.join(lines) + '\n'
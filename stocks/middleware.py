@@ -0,0 +1,123 @@
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from . import metrics
+
+
+def _view_name(request):
+    """以 URL 名稱（沒有時為 view 路徑）作為標籤；未匹配任何路由的請求歸為同一類，避免標籤數量無限增加"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unmatched>'
+    return match.view_name or match._func_path
+
+
+class MetricsMiddleware:
+    """
+    記錄每個請求的延遲、回應狀態與 SQL 查詢數（stocks.metrics）
+    同時支援同步與非同步：async view（長輪詢、SSE）在 ASGI 下不會因此被轉成同步執行
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        queries, token = metrics.start_query_count()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.stop_query_count(token)
+        self._observe(request, response, time.perf_counter() - started, queries[0])
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        queries, token = metrics.start_query_count()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.stop_query_count(token)
+        self._observe(request, response, time.perf_counter() - started, queries[0])
+        return response
+
+    @staticmethod
+    def _observe(request, response, elapsed, queries):
+        view = _view_name(request)
+        metrics.REQUEST_LATENCY.observe(elapsed, view=view, method=request.method)
+        metrics.RESPONSES.inc(view=view, status=response.status_code)
+        metrics.REQUEST_QUERIES.observe(queries, view=view)
+
+
+class ProfilerMiddleware:
+    """
+    staff 帳號以 X-Profile: 1 標頭或 ?_profile=1 要求時剖析該請求（stocks.profiling）
+    需放在 AuthenticationMiddleware 之後；PROFILER_ENABLED 關閉時不會載入
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILER_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        from . import profiling
+
+        if not (profiling.is_requested(request) and request.user.is_staff):
+            return self.get_response(request)
+        profile, token = profiling.start(request)
+        profile.start_sampling({threading.get_ident(): 'request'})
+        try:
+            response = self.get_response(request)
+        finally:
+            profile.finish()
+            profiling.stop(token)
+        return self._annotate(profile, response)
+
+    async def __acall__(self, request):
+        from asgiref.sync import sync_to_async
+        from . import profiling
+
+        if not profiling.is_requested(request) or not (await request.auser()).is_staff:
+            return await self.get_response(request)
+        profile, token = profiling.start(request)
+        # 同步 view 由這個請求專屬的執行緒執行（thread_sensitive），事件迴圈執行緒則執行 async view
+        sync_thread = await sync_to_async(threading.get_ident)()
+        profile.start_sampling({threading.get_ident(): 'event_loop', sync_thread: 'request'})
+        try:
+            response = await self.get_response(request)
+        finally:
+            profile.finish()
+            profiling.stop(token)
+        return await sync_to_async(self._annotate)(profile, response)
+
+    @staticmethod
+    def _annotate(profile, response):
+        summary = profile.summary()
+        try:
+            profile.save(summary)
+        except OSError as e:
+            print(f"[Profiler] Error saving {profile.id}: {e}")
+        response['X-Profile'] = profile.header(summary)
+        response['Server-Timing'] = profile.server_timing(summary)
+        return response
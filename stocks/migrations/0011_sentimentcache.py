@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stocks', '0010_financialstatement_stockindicator_stockrevenue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SentimentCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title_hash', models.CharField(help_text='正規化標題的 SHA-1', max_length=40, unique=True)),
+                ('sentiment', models.CharField(help_text='positive, negative, neutral', max_length=20)),
+                ('score', models.FloatField(blank=True, help_text='模型信心度', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
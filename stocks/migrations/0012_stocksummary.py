@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stocks', '0011_sentimentcache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_date', models.DateField(help_text='最新 K 棒日期')),
+                ('last_close', models.DecimalField(decimal_places=2, help_text='最新收盤價', max_digits=10)),
+                ('recent_closes', models.JSONField(default=list, help_text='最近 20 筆收盤價（舊到新）')),
+                ('sparkline_svg', models.CharField(help_text='預先產生的 Sparkline SVG path', max_length=400)),
+                ('high_52w', models.DecimalField(blank=True, decimal_places=2, help_text='52 週最高', max_digits=10, null=True)),
+                ('low_52w', models.DecimalField(blank=True, decimal_places=2, help_text='52 週最低', max_digits=10, null=True)),
+                ('last_volume', models.BigIntegerField(blank=True, help_text='最新成交量', null=True)),
+                ('avg_volume_20', models.BigIntegerField(blank=True, help_text='近 20 日平均成交量', null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('stock', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='summary', to='stocks.stock')),
+            ],
+        ),
+    ]
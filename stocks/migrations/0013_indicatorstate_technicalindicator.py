@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stocks', '0012_stocksummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndicatorState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_date', models.DateField()),
+                ('state', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('stock', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='indicator_state', to='stocks.stock')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TechnicalIndicator',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('sma5', models.FloatField(blank=True, null=True)),
+                ('sma20', models.FloatField(blank=True, null=True)),
+                ('sma60', models.FloatField(blank=True, null=True)),
+                ('ema12', models.FloatField(blank=True, null=True)),
+                ('ema26', models.FloatField(blank=True, null=True)),
+                ('rsi14', models.FloatField(blank=True, help_text='RSI(14)，Wilder 平滑', null=True)),
+                ('macd', models.FloatField(blank=True, help_text='MACD (12, 26)', null=True)),
+                ('macd_signal', models.FloatField(blank=True, help_text='MACD 訊號線 (9)', null=True)),
+                ('macd_hist', models.FloatField(blank=True, null=True)),
+                ('bb_upper', models.FloatField(blank=True, help_text='布林通道上軌 (20, 2)', null=True)),
+                ('bb_middle', models.FloatField(blank=True, null=True)),
+                ('bb_lower', models.FloatField(blank=True, null=True)),
+                ('atr14', models.FloatField(blank=True, help_text='ATR(14)，Wilder 平滑', null=True)),
+                ('stock', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='technical_indicators', to='stocks.stock')),
+            ],
+            options={
+                'ordering': ['-date'],
+                'indexes': [models.Index(fields=['stock', '-date'], name='stocks_tech_stock_i_feba23_idx')],
+                'unique_together': {('stock', 'date')},
+            },
+        ),
+    ]
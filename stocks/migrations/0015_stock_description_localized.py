@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stocks', '0014_intradaybar'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stock',
+            name='description_lang',
+            field=models.CharField(blank=True, help_text='簡介原文語言（en / zh）', max_length=5),
+        ),
+        migrations.AddField(
+            model_name='stock',
+            name='description_zh',
+            field=models.TextField(blank=True, help_text='公司簡介（繁體中文）'),
+        ),
+        migrations.AlterField(
+            model_name='stock',
+            name='description',
+            field=models.TextField(blank=True, help_text='公司簡介（原文）'),
+        ),
+    ]
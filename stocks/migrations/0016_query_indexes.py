@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+# 只在 PostgreSQL 建立：date 的 BRIN 索引（日 K 大致依日期順序寫入，索引極小）
+# （原本另有 (stock_id, date DESC) INCLUDE (close) 覆蓋索引，與 (stock, date) 唯一索引重複，已由 0019 移除）
+POSTGRES_INDEXES = {
+    'stocks_stockprice_date_brin': 'ON stocks_stockprice USING brin (date)',
+}
+
+
+def create_postgres_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, definition in POSTGRES_INDEXES.items():
+        schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {name} {definition}')
+
+
+def drop_postgres_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in POSTGRES_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stocks', '0015_stock_description_localized'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='watchlist',
+            index=models.Index(fields=['user', '-id'], name='stocks_watc_user_id_95f966_idx'),
+        ),
+        migrations.RunPython(create_postgres_indexes, drop_postgres_indexes),
+    ]
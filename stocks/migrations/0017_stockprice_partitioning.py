@@ -0,0 +1,14 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    原本依 STOCKPRICE_PARTITIONING 設定在 migrate 時轉換分區，使相同的 migration 歷史在不同環境產生不同結構；
+    現在不做任何事，分區改由 manage.py partition_prices --convert 明確執行（已轉換的資料庫維持原狀）
+    """
+
+    dependencies = [
+        ('stocks', '0016_query_indexes'),
+    ]
+
+    operations = []
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stocks', '0017_stockprice_partitioning'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FetchRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ticker', models.CharField(max_length=20)),
+                ('started_at', models.DateTimeField(db_index=True)),
+                ('duration_ms', models.PositiveIntegerField(default=0)),
+                ('ok', models.BooleanField(default=True)),
+                ('stages', models.JSONField(default=dict, help_text='階段名稱 → 毫秒')),
+                ('rows', models.JSONField(default=dict, help_text='資料表 → 寫入筆數')),
+                ('upstream', models.JSONField(default=dict, help_text='資料來源 → {calls, errors, ms}')),
+                ('errors', models.JSONField(default=list, help_text='[階段, 錯誤訊息]')),
+            ],
+            options={
+                'ordering': ['-started_at'],
+                'indexes': [models.Index(fields=['ticker', '-started_at'], name='stocks_fetc_ticker_192706_idx')],
+            },
+        ),
+    ]
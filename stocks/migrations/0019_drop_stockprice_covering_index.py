@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+def drop_covering_index(apps, schema_editor):
+    """
+    (stock_id, date DESC) INCLUDE (close) 與 (stock, date) 唯一索引幾乎重複：最新價與最近 N 筆查詢反向掃描唯一索引即可，
+    多一個索引只增加每次 upsert 的寫入成本
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS stocks_stockprice_stock_date_close')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stocks', '0018_fetchrun'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_covering_index, migrations.RunPython.noop),
+    ]
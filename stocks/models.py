@@ -1,6 +1,89 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models.base import DEFERRED
+
+
+class ChangeTrackingMixin:
+    """
+    記錄從資料庫載入（或上次寫入）時的欄位值，save() 只寫入實際變動的欄位
+    未指定 update_fields 且完全沒有變動時略過寫入，此時 pre_save / post_save 訊號也不會觸發；
+    明確指定 update_fields 時一定會寫入（沒有變動就照原樣寫入指定欄位）並觸發訊號
+    比較前依欄位型別正規化（Decimal 欄位四捨五入到 decimal_places），float 與 Decimal 的微小差異不會被視為變動
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot_fields(
+            name for name, value in zip(field_names, values) if value is not DEFERRED
+        )
+        return instance
+
+    def _snapshot_fields(self, attnames):
+        snapshot = self.__dict__.setdefault('_loaded_values', {})
+        for attname in attnames:
+            snapshot[attname] = self._normalized(self._meta.get_field(attname), getattr(self, attname))
+
+    @staticmethod
+    def _normalized(field, value):
+        if value is None:
+            return None
+        try:
+            value = field.to_python(value)
+        except (ValidationError, TypeError, ValueError):
+            return value
+        if isinstance(field, models.DecimalField) and isinstance(value, Decimal) and value.is_finite():
+            return value.quantize(Decimal(1).scaleb(-field.decimal_places), rounding=ROUND_HALF_UP)
+        return value
+
+    def changed_fields(self):
+        """與載入時不同的欄位（attname）；載入時 deferred、之後才賦值的欄位一律視為變動"""
+        loaded = self.__dict__.get('_loaded_values', {})
+        deferred = self.get_deferred_fields()
+        changed = []
+        for field in self._meta.concrete_fields:
+            if field.primary_key or field.attname in deferred:
+                continue
+            if field.attname not in loaded or self._normalized(field, getattr(self, field.attname)) != loaded[field.attname]:
+                changed.append(field.attname)
+        return changed
+
+    def save(self, *args, **kwargs):
+        if self._state.adding or kwargs.get('force_insert') or '_loaded_values' not in self.__dict__:
+            super().save(*args, **kwargs)
+            self._snapshot_fields(
+                f.attname for f in self._meta.concrete_fields if f.attname not in self.get_deferred_fields()
+            )
+            return
 
-class Stock(models.Model):
+        changed = self.changed_fields()
+        requested = kwargs.get('update_fields')
+        if requested is None:
+            if not changed:
+                return
+            kwargs['update_fields'] = changed
+        else:
+            requested = [self._meta.get_field(name).attname for name in requested]
+            # 明確指定 update_fields 時一定呼叫 super().save()，讓 pre_save / post_save 照常觸發
+            kwargs['update_fields'] = [name for name in changed if name in requested] or requested
+        super().save(*args, **kwargs)
+        self._snapshot_fields(kwargs['update_fields'])
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        if fields is None:
+            fields = [f.attname for f in self._meta.concrete_fields if f.attname not in self.get_deferred_fields()]
+        else:
+            fields = [
+                field.attname for field in map(self._meta.get_field, fields)
+                if getattr(field, 'concrete', False)
+            ]
+        self._snapshot_fields(fields)
+
+
+class Stock(ChangeTrackingMixin, models.Model):
     MARKET_CHOICES = [
         ('US', '美股'),
         ('TW', '台股'),
@@ -8,7 +91,9 @@ class Stock(models.Model):
     ticker = models.CharField(max_length=15, unique=True, help_text="股票代號，例如：2330.TW")
     name = models.CharField(max_length=100, blank=True, help_text="公司名稱")
     market = models.CharField(max_length=2, choices=MARKET_CHOICES, default='US', help_text="市場別")
-    description = models.TextField(blank=True, help_text="公司簡介")
+    description = models.TextField(blank=True, help_text="公司簡介（原文）")
+    description_lang = models.CharField(max_length=5, blank=True, help_text="簡介原文語言（en / zh）")
+    description_zh = models.TextField(blank=True, help_text="公司簡介（繁體中文）")
     sector = models.CharField(max_length=50, blank=True, help_text="產業類別")
     pe_ratio = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, help_text="本益比")
     eps = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, help_text="每股盈餘")
@@ -56,6 +141,35 @@ class Stock(models.Model):
 
 from django.conf import settings
 
+class StockPriceQuerySet(models.QuerySet):
+    # 最新 K 棒的預設回溯天數：涵蓋長假與停牌，依年份分區時通常只需規劃、掃描最近一至兩個分區
+    LATEST_LOOKBACK_DAYS = 45
+
+    def between(self, start=None, end=None):
+        """以分區鍵 date 的常數範圍篩選（含兩端），PostgreSQL 依年份分區時規劃階段即可排除無關分區"""
+        qs = self
+        if start is not None:
+            qs = qs.filter(date__gte=start)
+        if end is not None:
+            qs = qs.filter(date__lte=end)
+        return qs
+
+    def latest_bars(self, count=1, lookback_days=None):
+        """
+        最近 count 根 K 棒（依日期遞減）
+        先限制在最近 lookback_days 天內查詢，不足 count 根（停牌、新上市或資料中斷）時才不限日期重查
+        """
+        from datetime import timedelta
+        from django.utils import timezone
+
+        lookback_days = lookback_days or self.LATEST_LOOKBACK_DAYS
+        since = timezone.localdate() - timedelta(days=lookback_days)
+        bars = list(self.between(start=since).order_by('-date')[:count])
+        if len(bars) < count:
+            bars = list(self.order_by('-date')[:count])
+        return bars
+
+
 class StockPrice(models.Model):
     stock = models.ForeignKey(Stock, on_delete=models.CASCADE, related_name='prices')
     date = models.DateField()
@@ -65,14 +179,60 @@ class StockPrice(models.Model):
     close = models.DecimalField(max_digits=10, decimal_places=2)
     volume = models.BigIntegerField()
 
+    objects = StockPriceQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.stock.ticker} on {self.date}"
 
     class Meta:
         # Ensure that for a given stock, a date can only appear once.
+        # (stock, date) 唯一索引可反向掃描，供最新價與最近 N 筆查詢使用；
+        # PostgreSQL 另有 date 的 BRIN 索引（見 migration 0016_query_indexes）
         unique_together = ('stock', 'date')
         ordering = ['-date']
 
+class IntradayBar(models.Model):
+    """
+    盤中 5 分鐘 K 棒（由背景任務在交易時段增量追加，超過 INTRADAY_RETENTION_DAYS 天自動清除）
+    詳細頁的盤中走勢直接由此讀取，不必每次瀏覽都向 Yahoo 取資料
+    """
+    stock = models.ForeignKey(Stock, on_delete=models.CASCADE, related_name='intraday_bars')
+    timestamp = models.DateTimeField(help_text="K 棒起始時間")
+    open = models.DecimalField(max_digits=10, decimal_places=2)
+    high = models.DecimalField(max_digits=10, decimal_places=2)
+    low = models.DecimalField(max_digits=10, decimal_places=2)
+    close = models.DecimalField(max_digits=10, decimal_places=2)
+    volume = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('stock', 'timestamp')
+        ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['stock', '-timestamp']),
+        ]
+
+    def __str__(self):
+        return f"{self.stock.ticker} @ {self.timestamp:%Y-%m-%d %H:%M}"
+
+class StockSummary(models.Model):
+    """
+    每支股票的儀表板摘要（由資料抓取流程在有新 K 棒時更新）
+    儀表板直接 join 此表，渲染時不需逐股計算
+    """
+    stock = models.OneToOneField(Stock, on_delete=models.CASCADE, related_name='summary')
+    last_date = models.DateField(help_text="最新 K 棒日期")
+    last_close = models.DecimalField(max_digits=10, decimal_places=2, help_text="最新收盤價")
+    recent_closes = models.JSONField(default=list, help_text="最近 20 筆收盤價（舊到新）")
+    sparkline_svg = models.CharField(max_length=400, help_text="預先產生的 Sparkline SVG path")
+    high_52w = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, help_text="52 週最高")
+    low_52w = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, help_text="52 週最低")
+    last_volume = models.BigIntegerField(null=True, blank=True, help_text="最新成交量")
+    avg_volume_20 = models.BigIntegerField(null=True, blank=True, help_text="近 20 日平均成交量")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.stock.ticker} summary @ {self.last_date}"
+
 class Watchlist(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='watchlist')
     stock = models.ForeignKey(Stock, on_delete=models.CASCADE, related_name='watchers')
@@ -82,6 +242,11 @@ class Watchlist(models.Model):
 
     class Meta:
         unique_together = ('user', 'stock')
+        indexes = [
+            # 追蹤清單預設依加入順序（-id）排序；依股票欄位排序時先以 user 索引取出該使用者的少量列再排序，
+            # 不在 Stock 的 last_price / change_percent 上建索引（報價每幾秒更新，索引只會增加寫入成本）
+            models.Index(fields=['user', '-id']),
+        ]
 
 class StockNews(models.Model):
     stock = models.ForeignKey(Stock, on_delete=models.CASCADE, related_name='news')
@@ -214,4 +379,87 @@ class StockIndicator(models.Model):
         ]
 
     def __str__(self):
-        return f"{self.stock.ticker} {self.date} {self.name}: {self.value}"
\ No newline at end of file
+        return f"{self.stock.ticker} {self.date} {self.name}: {self.value}"
+
+class SentimentCache(models.Model):
+    """
+    新聞標題情緒分析結果快取
+    以正規化標題的雜湊值為鍵，跨來源重複的標題只需推論一次
+    """
+    title_hash = models.CharField(max_length=40, unique=True, help_text="正規化標題的 SHA-1")
+    sentiment = models.CharField(max_length=20, help_text="positive, negative, neutral")
+    score = models.FloatField(null=True, blank=True, help_text="模型信心度")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.title_hash[:8]} - {self.sentiment}"
+
+
+class TechnicalIndicator(models.Model):
+    """
+    技術指標（由 stocks.indicators 依日 K 計算後儲存，每支股票每日一列）
+    供圖表 API 與選股條件直接查詢，前端不需自行重算
+    """
+    stock = models.ForeignKey(Stock, on_delete=models.CASCADE, related_name='technical_indicators')
+    date = models.DateField()
+    sma5 = models.FloatField(null=True, blank=True)
+    sma20 = models.FloatField(null=True, blank=True)
+    sma60 = models.FloatField(null=True, blank=True)
+    ema12 = models.FloatField(null=True, blank=True)
+    ema26 = models.FloatField(null=True, blank=True)
+    rsi14 = models.FloatField(null=True, blank=True, help_text="RSI(14)，Wilder 平滑")
+    macd = models.FloatField(null=True, blank=True, help_text="MACD (12, 26)")
+    macd_signal = models.FloatField(null=True, blank=True, help_text="MACD 訊號線 (9)")
+    macd_hist = models.FloatField(null=True, blank=True)
+    bb_upper = models.FloatField(null=True, blank=True, help_text="布林通道上軌 (20, 2)")
+    bb_middle = models.FloatField(null=True, blank=True)
+    bb_lower = models.FloatField(null=True, blank=True)
+    atr14 = models.FloatField(null=True, blank=True, help_text="ATR(14)，Wilder 平滑")
+
+    class Meta:
+        unique_together = ('stock', 'date')
+        ordering = ['-date']
+        indexes = [
+            models.Index(fields=['stock', '-date']),
+        ]
+
+    def __str__(self):
+        return f"{self.stock.ticker} indicators on {self.date}"
+
+
+class IndicatorState(models.Model):
+    """
+    技術指標的遞迴計算狀態（EMA、Wilder 平均、最近收盤視窗）
+    新 K 棒進來時由此接續計算，不需重掃整段歷史
+    """
+    stock = models.OneToOneField(Stock, on_delete=models.CASCADE, related_name='indicator_state')
+    last_date = models.DateField()
+    state = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.stock.ticker} indicator state @ {self.last_date}"
+
+
+class FetchRun(models.Model):
+    """
+    資料抓取流程（fetch_stock_data_sync）的單次執行紀錄：各階段耗時、寫入筆數、上游請求與錯誤
+    由 stocks.fetch_runs 寫入，超過 FETCH_RUN_RETENTION_DAYS 天自動清除
+    """
+    ticker = models.CharField(max_length=20)
+    started_at = models.DateTimeField(db_index=True)
+    duration_ms = models.PositiveIntegerField(default=0)
+    ok = models.BooleanField(default=True)
+    stages = models.JSONField(default=dict, help_text="階段名稱 → 毫秒")
+    rows = models.JSONField(default=dict, help_text="資料表 → 寫入筆數")
+    upstream = models.JSONField(default=dict, help_text="資料來源 → {calls, errors, ms}")
+    errors = models.JSONField(default=list, help_text="[階段, 錯誤訊息]")
+
+    class Meta:
+        ordering = ['-started_at']
+        indexes = [
+            models.Index(fields=['ticker', '-started_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.ticker} @ {self.started_at:%Y-%m-%d %H:%M:%S} ({self.duration_ms} ms)"
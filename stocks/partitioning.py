@@ -0,0 +1,222 @@
+"""
+StockPrice 分區（僅 PostgreSQL，選用）
+STOCKPRICE_PARTITIONING='year' 時依 date 年份做 range 分區（另有 DEFAULT 分區承接尚未建立年份的資料），
+'hash' 時依 stock_id 做 hash 分區；upsert 與區間查詢只會落在相關分區，單一分區的索引與 heap 也較小
+
+分區表的主鍵與唯一鍵必須包含分區鍵，因此主鍵改為 (id, date) 或 (id, stock_id)；
+(stock_id, date) 唯一約束本身已包含兩種分區鍵，bulk_create 的 ON CONFLICT upsert 不受影響
+轉換與還原都會重建整張表（複製資料），應在維護時段由 partition_prices 指令執行
+"""
+from datetime import date
+
+from django.conf import settings
+from django.db import connection as default_connection, transaction
+
+TABLE = 'stocks_stockprice'
+SEQUENCE = 'stocks_stockprice_id_seq'
+DEFAULT_PARTITION = f'{TABLE}_default'
+SCHEMES = {'year': ('RANGE', 'date'), 'hash': ('HASH', 'stock_id')}
+STRATEGIES = {'r': 'year', 'h': 'hash'}
+
+
+def _check_postgres(connection):
+    if connection.vendor != 'postgresql':
+        raise ValueError('StockPrice partitioning requires PostgreSQL')
+
+
+def current_scheme(connection=None):
+    """目前的分區方式：'year' / 'hash'，未分區（或非 PostgreSQL）為 None"""
+    connection = connection or default_connection
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT partstrat FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)", [TABLE]
+        )
+        row = cursor.fetchone()
+    return STRATEGIES.get(row[0]) if row else None
+
+
+def _constraints_and_indexes(cursor, table):
+    """主鍵以外的約束定義與非約束索引定義（在更名前讀取，重建資料表後以相同名稱加回）"""
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = %s::regclass AND contype IN ('u', 'f', 'c')",
+        [table],
+    )
+    constraints = cursor.fetchall()
+    cursor.execute(
+        "SELECT i.relname, pg_get_indexdef(ix.indexrelid) FROM pg_index ix "
+        "JOIN pg_class i ON i.oid = ix.indexrelid "
+        "WHERE ix.indrelid = %s::regclass "
+        "AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = ix.indexrelid)",
+        [table],
+    )
+    indexes = cursor.fetchall()
+    return constraints, indexes
+
+
+def _year_bounds(year):
+    return date(year, 1, 1).isoformat(), date(year + 1, 1, 1).isoformat()
+
+
+def _year_partition(year):
+    return f'{TABLE}_y{year}'
+
+
+def _create_partitions(cursor, scheme, years=(), hash_partitions=None):
+    if scheme == 'year':
+        for year in years:
+            start, end = _year_bounds(year)
+            cursor.execute(
+                f"CREATE TABLE {_year_partition(year)} PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)",
+                [start, end],
+            )
+        cursor.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT")
+    else:
+        for remainder in range(hash_partitions):
+            cursor.execute(
+                f"CREATE TABLE {TABLE}_h{remainder} PARTITION OF {TABLE} "
+                f"FOR VALUES WITH (MODULUS {hash_partitions}, REMAINDER {remainder})"
+            )
+
+
+def _rebuild(connection, scheme, hash_partitions=None, years_ahead=None):
+    """以新的結構（分區或一般資料表）重建 StockPrice 並搬移資料"""
+    old = f'{TABLE}_rebuild'
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        constraints, indexes = _constraints_and_indexes(cursor, TABLE)
+        cursor.execute(f"ALTER TABLE {TABLE} RENAME TO {old}")
+
+        cursor.execute("SELECT attidentity FROM pg_attribute WHERE attrelid = %s::regclass AND attname = 'id'", [old])
+        identity = cursor.fetchone()[0] != ''
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [old])
+        old_sequence = cursor.fetchone()[0]
+
+        # 保留 id 的 identity（或 serial 預設值）；索引與約束不由 LIKE 複製（分區表的唯一索引需包含分區鍵），之後另外重建
+        like = f"LIKE {old} INCLUDING DEFAULTS INCLUDING IDENTITY INCLUDING STORAGE"
+        if scheme is None:
+            cursor.execute(f"CREATE TABLE {TABLE} ({like})")
+            primary_key = '(id)'
+        else:
+            method, key = SCHEMES[scheme]
+            cursor.execute(f"CREATE TABLE {TABLE} ({like}) PARTITION BY {method} ({key})")
+            primary_key = f'(id, {key})'
+            years = []
+            if scheme == 'year':
+                cursor.execute(f"SELECT EXTRACT(YEAR FROM MIN(date))::int FROM {old}")
+                first = cursor.fetchone()[0]
+                this_year = date.today().year
+                ahead = getattr(settings, 'STOCKPRICE_PARTITION_YEARS_AHEAD', 1) if years_ahead is None else years_ahead
+                years = range(first or this_year, this_year + ahead + 1)
+            _create_partitions(cursor, scheme, years, hash_partitions)
+
+        cursor.execute(f"INSERT INTO {TABLE} {'OVERRIDING SYSTEM VALUE ' if identity else ''}SELECT * FROM {old}")
+        cursor.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {TABLE}")
+        next_id = cursor.fetchone()[0]
+        if identity:
+            # 新表有自己的 identity 序列（舊序列仍在時名稱會加上數字），刪除舊表後改回原名並接續編號
+            cursor.execute(f"DROP TABLE {old}")
+            cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [TABLE])
+            sequence = cursor.fetchone()[0]
+            if sequence.split('.')[-1].strip('"') != SEQUENCE:
+                cursor.execute(f"ALTER SEQUENCE {sequence} RENAME TO {SEQUENCE}")
+            cursor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN id RESTART WITH {int(next_id)}")
+        else:
+            # serial：預設值仍指向舊序列，先改由新表持有，避免隨舊表刪除
+            cursor.execute(f"ALTER SEQUENCE {old_sequence} OWNED BY {TABLE}.id")
+            cursor.execute(f"DROP TABLE {old}")
+            cursor.execute("SELECT setval(%s, %s, false)", [old_sequence, next_id])
+        # 約束與索引隨舊表刪除後，以相同名稱在新表重建
+        cursor.execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY {primary_key}")
+        for name, definition in constraints:
+            cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT "{name}" {definition}')
+        for name, definition in indexes:
+            # 由分區表讀出的定義為 ON ONLY（不含子分區），重建時需套用到所有分區
+            cursor.execute(definition.replace(' ON ONLY ', ' ON '))
+        cursor.execute(f"ANALYZE {TABLE}")
+
+
+def partition_prices(scheme, hash_partitions=None, connection=None):
+    """將 StockPrice 轉為分區表（已是相同分區方式時不動作）"""
+    connection = connection or default_connection
+    _check_postgres(connection)
+    if scheme not in SCHEMES:
+        raise ValueError(f"Unknown partitioning scheme {scheme!r} (expected 'year' or 'hash')")
+    if current_scheme(connection) == scheme:
+        return False
+    hash_partitions = hash_partitions or getattr(settings, 'STOCKPRICE_HASH_PARTITIONS', 16)
+    _rebuild(connection, scheme, hash_partitions=hash_partitions)
+    print(f"[Partition] {TABLE} 已轉為 {scheme} 分區")
+    return True
+
+
+def unpartition_prices(connection=None):
+    """還原為一般資料表"""
+    connection = connection or default_connection
+    _check_postgres(connection)
+    if current_scheme(connection) is None:
+        return False
+    _rebuild(connection, None)
+    print(f"[Partition] {TABLE} 已還原為一般資料表")
+    return True
+
+
+def ensure_year_partitions(years_ahead=None, connection=None):
+    """
+    分區維護（依年份分區時）：建立到今年 + years_ahead 為止的年份分區，
+    並把落在 DEFAULT 分區中的資料搬進新建立的對應年份分區
+
+    Returns:
+        list: 新建立的年份
+    """
+    connection = connection or default_connection
+    if current_scheme(connection) != 'year':
+        return []
+    if years_ahead is None:
+        years_ahead = getattr(settings, 'STOCKPRICE_PARTITION_YEARS_AHEAD', 1)
+
+    created = []
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = %s::regclass", [TABLE],
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+        cursor.execute(f"SELECT DISTINCT EXTRACT(YEAR FROM date)::int FROM {DEFAULT_PARTITION}")
+        stray_years = {row[0] for row in cursor.fetchall()}
+        this_year = date.today().year
+
+        for year in sorted(stray_years | set(range(this_year, this_year + years_ahead + 1))):
+            name = _year_partition(year)
+            if name in existing:
+                continue
+            start, end = _year_bounds(year)
+            # DEFAULT 分區有該年份資料時無法直接建立分區：先建獨立資料表搬入資料，再掛回分區
+            cursor.execute(f"CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS)")
+            cursor.execute(
+                f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE date >= %s AND date < %s RETURNING *) "
+                f"INSERT INTO {name} SELECT * FROM moved",
+                [start, end],
+            )
+            cursor.execute(f"ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", [start, end])
+            created.append(year)
+    if created:
+        print(f"[Partition] 建立年份分區: {created}")
+    return created
+
+
+def partition_stats(connection=None):
+    """各分區的估計列數與大小"""
+    connection = connection or default_connection
+    if current_scheme(connection) is None:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), c.reltuples::bigint, "
+            "pg_size_pretty(pg_total_relation_size(c.oid)) "
+            "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = %s::regclass ORDER BY c.relname",
+            [TABLE],
+        )
+        return cursor.fetchall()
@@ -0,0 +1,244 @@
+"""
+管理員用的單一請求效能剖析（PROFILER_ENABLED 開啟時由 stocks.middleware.ProfilerMiddleware 使用）
+
+staff 帳號的請求帶 X-Profile: 1 標頭或 ?_profile=1 參數時：
+- 取樣剖析：背景執行緒每 PROFILER_INTERVAL_MS 毫秒讀取處理該請求之執行緒的呼叫堆疊（sys._current_frames），
+  累計成 collapsed stack 格式（flamegraph.pl / speedscope 可直接讀取）
+- SQL：查詢數、耗時，以及完全相同（SQL 與參數皆同）與同模板（僅參數不同，常見於 N+1）的重複查詢
+- 上游：請求期間經 stocks.upstream 送出的 HTTP 請求（來源、主機、耗時、成功與否）
+回應加上 X-Profile 摘要與 Server-Timing 標頭，完整結果寫入 PROFILER_DIR（<id>.folded 與 <id>.json）
+
+PROFILER_ENABLED 關閉時不安裝 middleware 與查詢包裝，不會有任何額外負擔
+"""
+import contextvars
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+# 保留在 JSON 結果中的查詢數上限與單一 SQL 長度
+MAX_QUERIES = 500
+MAX_SQL_LENGTH = 2000
+ARTIFACT_NAME_RE = re.compile(r'^[0-9]{8}-[0-9]{6}-[0-9a-f]{8}\.(folded|json)$')
+
+_current = contextvars.ContextVar('request_profile', default=None)
+_root = str(Path(getattr(settings, 'BASE_DIR', '.'))) + os.sep
+
+
+def is_requested(request):
+    """請求是否要求剖析（是否為 staff 由 middleware 另外判斷）"""
+    return request.headers.get('X-Profile') == '1' or request.GET.get('_profile') == '1'
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    filename = code.co_filename
+    if filename.startswith(_root):
+        filename = filename[len(_root):]
+    elif 'site-packages' + os.sep in filename:
+        filename = filename.split('site-packages' + os.sep, 1)[1]
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(';', ':')
+
+
+class Sampler(threading.Thread):
+    """
+    定期取樣指定執行緒的呼叫堆疊
+
+    Args:
+        threads: {thread_id: 名稱}，名稱作為堆疊最外層（區分 ASGI 事件迴圈與執行同步 view 的執行緒）
+        interval: 取樣間隔（秒）
+    """
+
+    def __init__(self, threads, interval):
+        super().__init__(name='request-profiler', daemon=True)
+        self.threads = threads
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id, label in self.threads.items():
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                names = []
+                while frame is not None:
+                    names.append(_frame_name(frame))
+                    frame = frame.f_back
+                names.append(label)
+                self.stacks[';'.join(reversed(names))] += 1
+                self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class RequestProfile:
+    """單一請求的剖析結果"""
+
+    def __init__(self, request):
+        self.id = f"{timezone.localtime():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}"
+        self.method = request.method
+        self.path = request.get_full_path()
+        self.queries = []
+        self.upstream = []
+        self.sampler = None
+        self._started = time.perf_counter()
+        self.duration = 0.0
+
+    def start_sampling(self, threads):
+        interval = getattr(settings, 'PROFILER_INTERVAL_MS', 5) / 1000
+        self.sampler = Sampler(threads, interval)
+        self.sampler.start()
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._started
+        if self.sampler is not None:
+            self.sampler.stop()
+
+    def summary(self):
+        templates = Counter(sql for sql, _, _ in self.queries)
+        exact = Counter((sql, params) for sql, params, _ in self.queries)
+        sql_ms = sum(elapsed for _, _, elapsed in self.queries) * 1000
+        upstream_ms = sum(call['ms'] for call in self.upstream)
+        return {
+            'id': self.id,
+            'method': self.method,
+            'path': self.path,
+            'total_ms': round(self.duration * 1000, 1),
+            'samples': self.sampler.samples if self.sampler else 0,
+            'sql': len(self.queries),
+            'sql_ms': round(sql_ms, 1),
+            # 重複執行的次數（第一次不算）
+            'sql_duplicates': sum(n - 1 for n in exact.values() if n > 1),
+            'sql_similar': sum(n - 1 for n in templates.values() if n > 1),
+            'upstream': len(self.upstream),
+            'upstream_ms': round(upstream_ms, 1),
+            'upstream_errors': sum(1 for call in self.upstream if not call['ok']),
+        }
+
+    def header(self, summary):
+        """X-Profile 摘要標頭"""
+        return '; '.join(f"{key}={summary[key]}" for key in (
+            'total_ms', 'samples', 'sql', 'sql_ms', 'sql_duplicates', 'sql_similar',
+            'upstream', 'upstream_ms', 'upstream_errors', 'id',
+        ))
+
+    def server_timing(self, summary):
+        """Server-Timing 標頭（瀏覽器開發者工具的 Timing 頁籤可直接顯示）"""
+        return ', '.join([
+            f"total;dur={summary['total_ms']}",
+            f'sql;dur={summary["sql_ms"]};desc="{summary["sql"]} queries"',
+            f'upstream;dur={summary["upstream_ms"]};desc="{summary["upstream"]} calls"',
+        ])
+
+    def save(self, summary):
+        """寫入 <id>.folded（collapsed stacks）與 <id>.json（摘要、重複查詢、上游請求），回傳目錄"""
+        directory = Path(getattr(settings, 'PROFILER_DIR', 'profiles'))
+        directory.mkdir(parents=True, exist_ok=True)
+        stacks = self.sampler.stacks if self.sampler else {}
+        (directory / f"{self.id}.folded").write_text(
+            ''.join(f"{stack} {count}\n" for stack, count in stacks.items()), encoding='utf-8')
+
+        templates = Counter(sql for sql, _, _ in self.queries)
+        exact = Counter((sql, params) for sql, params, _ in self.queries)
+        detail = {
+            **summary,
+            'duplicate_queries': [
+                {'sql': sql[:MAX_SQL_LENGTH], 'params': params, 'count': n}
+                for (sql, params), n in exact.most_common() if n > 1
+            ],
+            'similar_queries': [
+                {'sql': sql[:MAX_SQL_LENGTH], 'count': n}
+                for sql, n in templates.most_common() if n > 1
+            ],
+            'queries': [
+                {'sql': sql[:MAX_SQL_LENGTH], 'params': params, 'ms': round(elapsed * 1000, 2)}
+                for sql, params, elapsed in self.queries[:MAX_QUERIES]
+            ],
+            'upstream_calls': self.upstream,
+        }
+        (directory / f"{self.id}.json").write_text(
+            json.dumps(detail, ensure_ascii=False, indent=2, default=str), encoding='utf-8')
+        _prune(directory)
+        return directory
+
+
+def _prune(directory):
+    """只保留最近 PROFILER_MAX_ARTIFACTS 次的結果"""
+    keep = getattr(settings, 'PROFILER_MAX_ARTIFACTS', 200)
+    runs = sorted({path.stem for path in directory.glob('*.json')}, reverse=True)
+    for stem in runs[keep:]:
+        for suffix in ('.json', '.folded'):
+            (directory / f"{stem}{suffix}").unlink(missing_ok=True)
+
+
+def start(request):
+    profile = RequestProfile(request)
+    return profile, _current.set(profile)
+
+
+def stop(token):
+    _current.reset(token)
+
+
+# --- 查詢與上游請求（只在剖析中的 context 記錄）---
+
+def _record_query(execute, sql, params, many, context):
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.queries.append((sql, repr(params), time.perf_counter() - started))
+
+
+def _install_query_recorder(sender, connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def _observe_upstream(source, host, elapsed, ok):
+    profile = _current.get()
+    if profile is not None:
+        profile.upstream.append({'source': source, 'host': host, 'ms': round(elapsed * 1000, 1), 'ok': ok})
+
+
+def install():
+    """由 StocksConfig.ready 呼叫（PROFILER_ENABLED 開啟時）"""
+    from django.db import connections
+    from django.db.backends.signals import connection_created
+    from . import upstream
+
+    connection_created.connect(_install_query_recorder, dispatch_uid='stocks.profiling.queries')
+    for connection in connections.all(initialized_only=True):
+        _install_query_recorder(None, connection)
+    upstream.install()
+    upstream.add_observer(_observe_upstream)
+
+
+def uninstall():
+    """還原 install()：移除查詢包裝與上游觀察者（上游傳輸層包裝仍由 metrics 使用，保留）"""
+    from django.db import connections
+    from django.db.backends.signals import connection_created
+    from . import upstream
+
+    connection_created.disconnect(dispatch_uid='stocks.profiling.queries')
+    for connection in connections.all(initialized_only=True):
+        if _record_query in connection.execute_wrappers:
+            connection.execute_wrappers.remove(_record_query)
+    upstream.remove_observer(_observe_upstream)
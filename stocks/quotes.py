@@ -0,0 +1,190 @@
+"""
+即時報價快取
+所有瀏覽者（跨 gunicorn worker）共用同一份報價：快取在 QUOTE_CACHE_TTL 秒內視為新鮮直接回傳；
+過期後由取得輪詢鎖的單一請求向上游更新，其餘請求在更新期間沿用舊報價（stale-while-revalidate）
+上游改用 yfinance 的 fast_info（只取價格），不再每次下載完整的 .info
+"""
+import time
+from datetime import datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import metrics
+
+QUOTE_CACHE_ALIAS = 'quotes'
+
+
+def _cache():
+    return caches[QUOTE_CACHE_ALIAS]
+
+
+def _ttl():
+    return getattr(settings, 'QUOTE_CACHE_TTL', 5)
+
+
+def _quote_key(ticker):
+    return f"quote:{ticker}"
+
+
+def _lock_key(ticker):
+    return f"quote-lock:{ticker}"
+
+
+def fetch_quote(ticker):
+    """
+    向上游取得最新價與前收（輕量來源）
+
+    Returns:
+        (price, previous_close) 或 (None, None)
+    """
+    import yfinance as yf
+
+    fast_info = yf.Ticker(ticker).fast_info
+    return fast_info.last_price, fast_info.previous_close
+
+
+def _persist(stock, quote):
+    """寫回報價欄位；價格未變動時 ChangeTrackingMixin 會略過寫入"""
+    stock.last_price = Decimal(str(quote['price']))
+    stock.change = Decimal(str(quote['change']))
+    stock.change_percent = Decimal(str(quote['change_percent']))
+    stock.save(update_fields=['last_price', 'change', 'change_percent'])
+
+
+def fetch_quotes(tickers):
+    """
+    以單一多股票請求取得多支股票的最新價與前收（批次報價快取未命中時使用）
+    交易時段內當日日 K 的收盤價即為最新成交價
+
+    Returns:
+        dict: {ticker: (price, previous_close)}，取不到的股票不在結果中
+    """
+    import yfinance as yf
+
+    if not tickers:
+        return {}
+    data = yf.download(list(tickers), period='5d', interval='1d', group_by='ticker',
+                       progress=False, threads=False, auto_adjust=False)
+    result = {}
+    if data is None or data.empty:
+        return result
+    multi = data.columns.nlevels == 2
+    for ticker in tickers:
+        if multi and ticker not in data.columns.get_level_values(0):
+            continue
+        closes = (data[ticker] if multi else data)['Close'].dropna()
+        if len(closes) >= 2:
+            result[ticker] = (float(closes.iloc[-1]), float(closes.iloc[-2]))
+    return result
+
+
+def _build_quote(price, previous_close):
+    change = price - previous_close
+    return {
+        'price': round(float(price), 2),
+        'change': round(float(change), 2),
+        'change_percent': round(float(change / previous_close * 100), 2),
+        'fetched_at': time.time(),
+    }
+
+
+def _store(stock, price, previous_close):
+    if not price or not previous_close:
+        return None
+    quote = _build_quote(price, previous_close)
+    # 保留時間遠長於新鮮期，上游失敗或輪詢中時仍有舊報價可用
+    _cache().set(_quote_key(stock.ticker), quote, timeout=max(_ttl() * 60, 300))
+    _persist(stock, quote)
+    return quote
+
+
+def _refresh(stock):
+    return _store(stock, *fetch_quote(stock.ticker))
+
+
+def _db_quote(stock):
+    return {
+        'price': stock.last_price,
+        'change': stock.change,
+        'change_percent': stock.change_percent,
+        'fetched_at': None,
+    }
+
+
+def get_quote(stock):
+    """
+    取得共用快取中的報價，必要時由單一輪詢者更新
+
+    Returns:
+        dict: price / change / change_percent / fetched_at（epoch 秒，資料庫備援時為 None）/ stale
+    """
+    cache = _cache()
+    quote = cache.get(_quote_key(stock.ticker))
+    if quote and time.time() - quote['fetched_at'] < _ttl():
+        metrics.cache_lookup('quotes', hits=1)
+        return {**quote, 'stale': False}
+    metrics.cache_lookup('quotes', hits=0, misses=1)
+
+    # cache.add 只有在鍵不存在時成功：同一時間每支股票只有一個請求會向上游查詢
+    # （Redis 的 add 為原子操作；檔案快取只保證單一行程內不重複，見 settings 的 CACHES 說明）
+    if cache.add(_lock_key(stock.ticker), 1, timeout=getattr(settings, 'QUOTE_POLL_LOCK_TIMEOUT', 10)):
+        try:
+            fresh = _refresh(stock)
+            if fresh:
+                return {**fresh, 'stale': False}
+        except Exception as e:
+            print(f"[Quote] Error refreshing {stock.ticker}: {e}")
+        finally:
+            cache.delete(_lock_key(stock.ticker))
+
+    return {**(quote or _db_quote(stock)), 'stale': True}
+
+
+def get_quotes(stocks):
+    """
+    批次取得多支股票的報價（單次快取讀取；未命中的股票合併成一個上游請求）
+
+    Returns:
+        dict: {ticker: quote}，格式同 get_quote
+    """
+    cache = _cache()
+    stocks = list(stocks)
+    cached = cache.get_many([_quote_key(s.ticker) for s in stocks])
+    now = time.time()
+
+    quotes, expired = {}, []
+    for stock in stocks:
+        quote = cached.get(_quote_key(stock.ticker))
+        if quote and now - quote['fetched_at'] < _ttl():
+            quotes[stock.ticker] = {**quote, 'stale': False}
+        else:
+            expired.append(stock)
+    metrics.cache_lookup('quotes', hits=len(quotes), misses=len(expired))
+
+    # 只更新取得輪詢鎖的股票；其他股票正由別的請求更新，先回傳舊報價
+    timeout = getattr(settings, 'QUOTE_POLL_LOCK_TIMEOUT', 10)
+    locked = [s for s in expired if cache.add(_lock_key(s.ticker), 1, timeout=timeout)]
+    if locked:
+        try:
+            fetched = fetch_quotes([s.ticker for s in locked])
+            for stock in locked:
+                if stock.ticker in fetched:
+                    quote = _store(stock, *fetched[stock.ticker])
+                    if quote:
+                        quotes[stock.ticker] = {**quote, 'stale': False}
+        except Exception as e:
+            print(f"[Quote] Error refreshing {len(locked)} tickers: {e}")
+        finally:
+            cache.delete_many([_lock_key(s.ticker) for s in locked])
+
+    for stock in expired:
+        if stock.ticker not in quotes:
+            quotes[stock.ticker] = {**(cached.get(_quote_key(stock.ticker)) or _db_quote(stock)), 'stale': True}
+    return quotes
+
+
+def format_quote_time(quote):
+    fetched_at = quote.get('fetched_at')
+    return (datetime.fromtimestamp(fetched_at) if fetched_at else datetime.now()).strftime('%H:%M:%S')
@@ -2,39 +2,252 @@
 情緒分析模組
 使用 Hugging Face Transformers 進行新聞標題情緒分析（GPU 加速）
 """
-import torch
-from functools import lru_cache
+import hashlib
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from django.conf import settings
+
+try:
+    import torch
+except ImportError:
+    # 未安裝 torch / transformers 時模型載入失敗，analyze_batch 改以詞典備援
+    torch = None
+
+from . import metrics
 
 # 全域變數：延遲載入模型
 _sentiment_pipeline = None
 
+# 模型生命週期：載入/卸載次數、最後使用時間與閒置卸載計時器
+_model_lock = threading.RLock()
+_model_state = {
+    'loads': 0,
+    'unloads': 0,
+    'loaded_at': None,
+    'last_used': None,
+    'active': 0,
+}
+_idle_timer = None
+
+# 記憶體快取層：正規化標題雜湊 -> 情緒標籤（LRU 淘汰）
+_sentiment_cache = OrderedDict()
+_cache_stats = {'memory_hits': 0, 'db_hits': 0, 'misses': 0}
+
+# 詞典快速路徑統計：略過模型的比例，以及抽樣與模型比對的一致率
+_lexicon_stats = {'classified': 0, 'bypassed': 0, 'audited': 0, 'agreed': 0, 'fallback': 0}
+
+# Google RSS 標題尾端的 " - 來源" 後綴：只有與該則新聞的發布者相同時才移除
+_SUFFIX_SEPARATOR = r'\s+[-–—|]\s+'
+_NON_WORD_RE = re.compile(r'[^\w]+')
+
 def _load_sentiment_model():
     """延遲載入情緒分析模型，確保 GPU 可用時使用 GPU"""
     global _sentiment_pipeline
-    if _sentiment_pipeline is None:
+    with _model_lock:
+        _model_state['last_used'] = time.monotonic()
+        if _sentiment_pipeline is None:
+            try:
+                if torch is None:
+                    raise ImportError("No module named 'torch'")
+                from transformers import pipeline
+
+                # 檢查 GPU 是否可用
+                device = 0 if torch.cuda.is_available() else -1
+                if torch.cuda.is_available():
+                    print(f"[Sentiment] 使用 GPU: {torch.cuda.get_device_name(0)}")
+                else:
+                    print("[Sentiment] GPU 不可用，使用 CPU")
+
+                # 使用多語言情緒分析模型（支援中英文）
+                _sentiment_pipeline = pipeline(
+                    "sentiment-analysis",
+                    model="lxyuan/distilbert-base-multilingual-cased-sentiments-student",
+                    device=device,
+                    truncation=True,
+                    max_length=512
+                )
+                _model_state['loads'] += 1
+                _model_state['loaded_at'] = time.monotonic()
+                print("[Sentiment] 模型載入成功")
+            except Exception as e:
+                print(f"[Sentiment] 模型載入失敗: {e}")
+                _sentiment_pipeline = None
+        return _sentiment_pipeline
+
+
+def warm_up_model() -> bool:
+    """預先載入模型（新聞排程更新前呼叫），並啟動閒置卸載計時"""
+    loaded = _load_sentiment_model() is not None
+    if loaded:
+        _schedule_idle_unload()
+    return loaded
+
+
+def _schedule_idle_unload():
+    """（重新）啟動閒置計時器；TTL 為 0 時不自動卸載"""
+    global _idle_timer
+    ttl = getattr(settings, 'SENTIMENT_MODEL_IDLE_TTL', 600)
+    if not ttl or ttl <= 0:
+        return
+    with _model_lock:
+        if _idle_timer is not None:
+            _idle_timer.cancel()
+        _idle_timer = threading.Timer(ttl, unload_if_idle)
+        _idle_timer.daemon = True
+        _idle_timer.start()
+
+
+def unload_if_idle(ttl=None) -> bool:
+    """
+    若模型已閒置超過 TTL 則卸載
+
+    Returns:
+        是否有卸載模型
+    """
+    if ttl is None:
+        ttl = getattr(settings, 'SENTIMENT_MODEL_IDLE_TTL', 600)
+    with _model_lock:
+        if _sentiment_pipeline is None or _model_state['active'] > 0:
+            return False
+        last_used = _model_state['last_used'] or 0
+        if time.monotonic() - last_used < ttl:
+            return False
+        unload_model()
+        return True
+
+
+def normalize_title(text: str, publisher: str = None) -> str:
+    """
+    正規化新聞標題，讓不同來源轉載的同一則新聞對應到相同的快取鍵
+
+    - NFKC 全半形統一、轉小寫
+    - 移除尾端的 " - 發布者" 後綴（只在與 publisher 相同時；"... - shares surge" 這類標題本身的子句不會被移除）
+    - 去除標點並壓縮空白
+    """
+    if not text:
+        return ''
+    normalized = unicodedata.normalize('NFKC', text).lower().strip()
+    if publisher:
+        suffix = unicodedata.normalize('NFKC', publisher).lower().strip()
+        if suffix:
+            normalized = re.sub(_SUFFIX_SEPARATOR + re.escape(suffix) + '$', '', normalized)
+    normalized = _NON_WORD_RE.sub(' ', normalized)
+    return ' '.join(normalized.split())
+
+
+def _title_key(text: str, publisher: str = None) -> str:
+    return hashlib.sha1(normalize_title(text, publisher).encode('utf-8')).hexdigest()
+
+
+def _label_from_result(result) -> str:
+    """將模型輸出轉換為標準化標籤，信心度低於 0.6 視為中性"""
+    label = result['label'].lower()
+    if result['score'] < 0.6:
+        return 'neutral'
+    if 'positive' in label:
+        return 'positive'
+    if 'negative' in label:
+        return 'negative'
+    return 'neutral'
+
+
+def _cache_get_many(keys) -> dict:
+    """先查記憶體，再以單一查詢補查資料庫"""
+    found = {}
+    missing = []
+    for key in keys:
+        if key in _sentiment_cache:
+            _sentiment_cache.move_to_end(key)
+            found[key] = _sentiment_cache[key]
+            _cache_stats['memory_hits'] += 1
+        else:
+            missing.append(key)
+
+    if missing:
         try:
-            from transformers import pipeline
-            
-            # 檢查 GPU 是否可用
-            device = 0 if torch.cuda.is_available() else -1
-            if torch.cuda.is_available():
-                print(f"[Sentiment] 使用 GPU: {torch.cuda.get_device_name(0)}")
-            else:
-                print("[Sentiment] GPU 不可用，使用 CPU")
-            
-            # 使用多語言情緒分析模型（支援中英文）
-            _sentiment_pipeline = pipeline(
-                "sentiment-analysis",
-                model="lxyuan/distilbert-base-multilingual-cased-sentiments-student",
-                device=device,
-                truncation=True,
-                max_length=512
-            )
-            print("[Sentiment] 模型載入成功")
+            from .models import SentimentCache
+            rows = SentimentCache.objects.filter(title_hash__in=missing).values_list('title_hash', 'sentiment')
+            for key, sentiment in rows:
+                found[key] = sentiment
+                _cache_put(key, sentiment)
+                _cache_stats['db_hits'] += 1
         except Exception as e:
-            print(f"[Sentiment] 模型載入失敗: {e}")
-            _sentiment_pipeline = None
-    return _sentiment_pipeline
+            print(f"[Sentiment] 快取讀取失敗: {e}")
+
+    _cache_stats['misses'] += len(keys) - len(found)
+    metrics.cache_lookup('sentiment', hits=len(found), misses=len(keys) - len(found))
+    return found
+
+
+def _cache_put(key, sentiment):
+    _sentiment_cache[key] = sentiment
+    _sentiment_cache.move_to_end(key)
+    max_size = getattr(settings, 'SENTIMENT_CACHE_SIZE', 5000)
+    while len(_sentiment_cache) > max_size:
+        _sentiment_cache.popitem(last=False)
+
+
+def _cache_set_many(entries: dict, scores: dict = None):
+    """寫入記憶體快取並持久化到資料庫（已存在的鍵略過）"""
+    scores = scores or {}
+    for key, sentiment in entries.items():
+        _cache_put(key, sentiment)
+    try:
+        from .models import SentimentCache
+        SentimentCache.objects.bulk_create(
+            [SentimentCache(title_hash=k, sentiment=v, score=scores.get(k)) for k, v in entries.items()],
+            ignore_conflicts=True
+        )
+    except Exception as e:
+        print(f"[Sentiment] 快取寫入失敗: {e}")
+
+
+def _lexicon_classify(keys, key_texts) -> dict:
+    """回傳詞典可明確判定的 {key: label}"""
+    from .sentiment_lexicon import classify
+    labels = {}
+    for key in keys:
+        label = classify(key_texts[key])
+        if label is not None:
+            labels[key] = label
+    _lexicon_stats['classified'] += len(keys)
+    _lexicon_stats['bypassed'] += len(labels)
+    return labels
+
+
+def _should_audit(key) -> bool:
+    """依雜湊值決定性抽樣，讓部分詞典結果也經模型比對以追蹤一致率"""
+    rate = getattr(settings, 'SENTIMENT_LEXICON_AUDIT_RATE', 0.05)
+    if rate <= 0:
+        return False
+    return int(key[:8], 16) / 0xFFFFFFFF < rate
+
+
+def get_lexicon_stats() -> dict:
+    """回傳詞典快速路徑的略過比例與模型一致率"""
+    stats = dict(_lexicon_stats)
+    stats['bypass_ratio'] = stats['bypassed'] / stats['classified'] if stats['classified'] else 0.0
+    stats['agreement'] = stats['agreed'] / stats['audited'] if stats['audited'] else None
+    return stats
+
+
+def get_cache_stats() -> dict:
+    """回傳快取命中統計"""
+    stats = dict(_cache_stats)
+    stats['memory_size'] = len(_sentiment_cache)
+    total = stats['memory_hits'] + stats['db_hits'] + stats['misses']
+    stats['hit_ratio'] = (stats['memory_hits'] + stats['db_hits']) / total if total else 0.0
+    return stats
+
+
+def clear_cache():
+    """清除記憶體快取（資料庫中的結果保留）"""
+    _sentiment_cache.clear()
 
 
 def analyze_sentiment(text: str) -> str:
@@ -49,85 +262,149 @@ def analyze_sentiment(text: str) -> str:
     """
     if not text or len(text.strip()) == 0:
         return 'neutral'
-    
-    try:
-        pipeline = _load_sentiment_model()
-        if pipeline is None:
-            return 'neutral'
-        
-        result = pipeline(text[:512])[0]  # 限制長度避免記憶體問題
-        label = result['label'].lower()
-        score = result['score']
-        
-        # 信心度閾值：低於 0.6 視為中性
-        if score < 0.6:
-            return 'neutral'
-        
-        # 標準化標籤
-        if 'positive' in label:
-            return 'positive'
-        elif 'negative' in label:
-            return 'negative'
-        else:
-            return 'neutral'
-            
-    except Exception as e:
-        print(f"[Sentiment] 分析錯誤: {e}")
-        return 'neutral'
 
+    return analyze_batch([text])[0]
 
-def analyze_batch(texts: list) -> list:
+
+def analyze_batch(texts: list, publishers: list = None) -> list:
     """
     批次分析多個文字的情緒
+    已分析過的標題直接由快取回傳；未命中者先經詞典快速判定，
+    只有語意不明確的標題才會送進模型
     
     Args:
         texts: 文字列表
+        publishers: 與 texts 對應的發布者（選用），用來移除標題尾端的 " - 發布者" 後綴
     
     Returns:
         情緒標籤列表
     """
     if not texts:
         return []
-    
-    try:
-        pipeline = _load_sentiment_model()
-        if pipeline is None:
-            return ['neutral'] * len(texts)
-        
-        # 預處理：截斷過長文字
-        processed_texts = [t[:512] if t else "" for t in texts]
-        results = pipeline(processed_texts)
-        
-        sentiments = []
-        for result in results:
-            label = result['label'].lower()
-            score = result['score']
-            
-            if score < 0.6:
-                sentiments.append('neutral')
-            elif 'positive' in label:
-                sentiments.append('positive')
-            elif 'negative' in label:
-                sentiments.append('negative')
-            else:
-                sentiments.append('neutral')
-        
+
+    started = time.perf_counter()
+    metrics.SENTIMENT_BATCH_SIZE.observe(len(texts), stage='titles')
+    sentiments = ['neutral'] * len(texts)
+
+    # 以正規化標題去重，同批次內重複的轉載只推論一次
+    key_positions = OrderedDict()
+    key_texts = {}
+    for i, text in enumerate(texts):
+        if not text or not text.strip():
+            continue
+        key = _title_key(text, publishers[i] if publishers else None)
+        key_positions.setdefault(key, []).append(i)
+        key_texts.setdefault(key, text)
+
+    if not key_positions:
         return sentiments
-        
-    except Exception as e:
-        print(f"[Sentiment] 批次分析錯誤: {e}")
-        return ['neutral'] * len(texts)
+
+    cached = _cache_get_many(list(key_positions.keys()))
+    miss_keys = [k for k in key_positions if k not in cached]
+
+    results = dict(cached)
+
+    # 詞典快速路徑：語意明確的標題直接判定，只有不明確者（及少量抽樣）送進模型
+    lexicon_labels = {}
+    model_keys = miss_keys
+    if miss_keys and getattr(settings, 'SENTIMENT_LEXICON_ENABLED', True):
+        lexicon_labels = _lexicon_classify(miss_keys, key_texts)
+        results.update(lexicon_labels)
+        model_keys = [k for k in miss_keys if k not in lexicon_labels or _should_audit(k)]
+
+    if model_keys:
+        model_ok = False
+        try:
+            with _model_lock:
+                _model_state['active'] += 1
+            pipeline = _load_sentiment_model()
+            if pipeline is not None:
+                # 預處理：截斷過長文字，避免記憶體問題
+                processed_texts = [key_texts[k][:512] for k in model_keys]
+                model_started = time.perf_counter()
+                outputs = pipeline(processed_texts)
+                metrics.SENTIMENT_BATCH_SIZE.observe(len(processed_texts), stage='model')
+                metrics.SENTIMENT_LATENCY.observe(time.perf_counter() - model_started, stage='model')
+
+                fresh = {}
+                scores = {}
+                for key, output in zip(model_keys, outputs):
+                    fresh[key] = _label_from_result(output)
+                    scores[key] = float(output['score'])
+                    if key in lexicon_labels:
+                        _lexicon_stats['audited'] += 1
+                        if lexicon_labels[key] == fresh[key]:
+                            _lexicon_stats['agreed'] += 1
+                _cache_set_many(fresh, scores)
+                results.update(fresh)
+                model_ok = True
+        except Exception as e:
+            print(f"[Sentiment] 批次分析錯誤: {e}")
+        finally:
+            with _model_lock:
+                _model_state['active'] -= 1
+                _model_state['last_used'] = time.monotonic()
+            _schedule_idle_unload()
+
+        if not model_ok:
+            # 模型無法使用時以詞典備援，而非全部回傳中性（結果不寫入快取）
+            from .sentiment_lexicon import classify
+            for key in model_keys:
+                if key not in lexicon_labels:
+                    results[key] = classify(key_texts[key], fallback=True)
+                    _lexicon_stats['fallback'] += 1
+
+    for key, positions in key_positions.items():
+        label = results.get(key, 'neutral')
+        for i in positions:
+            sentiments[i] = label
+
+    metrics.SENTIMENT_LATENCY.observe(time.perf_counter() - started, stage='total')
+    return sentiments
 
 
 def unload_model():
     """釋放 GPU 記憶體"""
-    global _sentiment_pipeline
-    if _sentiment_pipeline is not None:
-        del _sentiment_pipeline
-        _sentiment_pipeline = None
-        if torch.cuda.is_available():
-            torch.cuda.empty_cache()
-        print("[Sentiment] 模型已卸載，GPU 記憶體已釋放")
+    global _sentiment_pipeline, _idle_timer
+    with _model_lock:
+        if _idle_timer is not None:
+            _idle_timer.cancel()
+            _idle_timer = None
+        if _sentiment_pipeline is not None:
+            del _sentiment_pipeline
+            _sentiment_pipeline = None
+            _model_state['unloads'] += 1
+            _model_state['loaded_at'] = None
+            import gc
+            gc.collect()
+            if torch is not None and torch.cuda.is_available():
+                torch.cuda.empty_cache()
+            print("[Sentiment] 模型已卸載，GPU 記憶體已釋放")
+
+
+def get_model_stats() -> dict:
+    """
+    回傳模型生命週期狀態
+
+    Returns:
+        dict 包含載入狀態、載入/卸載次數、閒置秒數與記憶體用量
+    """
+    with _model_lock:
+        now = time.monotonic()
+        stats = {
+            'loaded': _sentiment_pipeline is not None,
+            'loads': _model_state['loads'],
+            'unloads': _model_state['unloads'],
+            'active': _model_state['active'],
+            'idle_seconds': round(now - _model_state['last_used'], 1) if _model_state['last_used'] else None,
+            'loaded_seconds': round(now - _model_state['loaded_at'], 1) if _model_state['loaded_at'] else None,
+            'idle_ttl': getattr(settings, 'SENTIMENT_MODEL_IDLE_TTL', 600),
+            'resident_memory_mb': metrics.resident_memory_mb(),
+            'gpu_memory_allocated_mb': None,
+        }
+    if torch is not None and torch.cuda.is_available():
+        stats['gpu_memory_allocated_mb'] = round(torch.cuda.memory_allocated(0) / 1024**2, 2)
+    return stats
 
 
 def check_gpu_available() -> dict:
@@ -138,8 +415,8 @@ def check_gpu_available() -> dict:
         dict 包含 GPU 資訊
     """
     info = {
-        'cuda_available': torch.cuda.is_available(),
-        'device_count': torch.cuda.device_count() if torch.cuda.is_available() else 0,
+        'cuda_available': torch is not None and torch.cuda.is_available(),
+        'device_count': torch.cuda.device_count() if torch is not None and torch.cuda.is_available() else 0,
         'device_name': None,
         'memory_allocated': None,
         'memory_reserved': None
@@ -0,0 +1,136 @@
+"""
+情緒詞典快速分類
+在送進 Transformer 之前，先以中英文財經詞典判斷語意明確的標題（如「創新高」、「plunges」）
+只有詞典無法判定的標題才需要模型推論；模型無法載入時也作為備援分類器
+"""
+import json
+import re
+
+from django.conf import settings
+
+DEFAULT_LEXICON = {
+    'positive': {
+        'en': [
+            'surge', 'surges', 'surged', 'soar', 'soars', 'soared', 'skyrocket', 'skyrockets',
+            'skyrocketed', 'rally', 'rallies', 'rallied', 'jumps', 'jumped', 'record high',
+            'all-time high', 'beats estimates', 'beat estimates', 'tops estimates',
+            'beats expectations', 'upgrade', 'upgrades', 'upgraded', 'raises guidance',
+            'record profit', 'record revenue', 'breakout',
+        ],
+        'zh': [
+            '創新高', '創歷史新高', '大漲', '飆漲', '暴漲', '漲停', '勁揚', '噴出', '攻頂',
+            '上修', '優於預期', '獲利創高', '營收創高', '調升評等', '強勢上攻',
+        ],
+    },
+    'negative': {
+        'en': [
+            'plunge', 'plunges', 'plunged', 'plummet', 'plummets', 'plummeted', 'tumble',
+            'tumbles', 'tumbled', 'crash', 'crashes', 'crashed', 'slump', 'slumps', 'slumped',
+            'sinks', 'sank', 'tanks', 'tanked', 'sell-off', 'selloff', 'record low',
+            'misses estimates', 'missed estimates', 'downgrade', 'downgrades', 'downgraded',
+            'cuts guidance', 'bankruptcy', 'layoffs', 'fraud',
+        ],
+        'zh': [
+            '重挫', '大跌', '暴跌', '崩跌', '跌停', '狂瀉', '急殺', '重摔', '創新低',
+            '下修', '不如預期', '低於預期', '虧損擴大', '調降評等', '破產', '裁員',
+        ],
+    },
+    # 出現否定詞時不做判斷，交給模型處理（例如 "not a crash"、「未創新高」）
+    'negation': {
+        'en': ['not', 'no', 'never', "isn't", "won't", "didn't", 'despite', 'fails to', 'failed to'],
+        'zh': ['不', '未', '沒', '無', '非', '難以'],
+    },
+}
+
+_compiled = None
+
+
+def _compile_terms(terms_by_lang):
+    """英文以單字邊界比對，中文以子字串比對"""
+    patterns = []
+    en_terms = [t.lower() for t in terms_by_lang.get('en', []) if t]
+    zh_terms = [t for t in terms_by_lang.get('zh', []) if t]
+    # 較長的詞優先比對，避免 "record" 先吃掉 "record high"
+    if en_terms:
+        alternation = '|'.join(re.escape(t) for t in sorted(en_terms, key=len, reverse=True))
+        patterns.append(rf"(?<![\w-])(?:{alternation})(?![\w-])")
+    if zh_terms:
+        patterns.append('|'.join(re.escape(t) for t in sorted(zh_terms, key=len, reverse=True)))
+    if not patterns:
+        return None
+    return re.compile('|'.join(f"(?:{p})" for p in patterns))
+
+
+def load_lexicon(path=None) -> dict:
+    """
+    讀取詞典設定；SENTIMENT_LEXICON_PATH 指向的 JSON 會覆蓋預設詞典的對應欄位
+    JSON 格式與 DEFAULT_LEXICON 相同
+    """
+    lexicon = {polarity: dict(langs) for polarity, langs in DEFAULT_LEXICON.items()}
+    path = path or getattr(settings, 'SENTIMENT_LEXICON_PATH', None)
+    if path:
+        try:
+            with open(path, encoding='utf-8') as f:
+                custom = json.load(f)
+            for polarity, langs in custom.items():
+                lexicon.setdefault(polarity, {}).update(langs)
+        except (OSError, ValueError) as e:
+            print(f"[Lexicon] 詞典載入失敗，使用預設詞典: {e}")
+    return lexicon
+
+
+def _get_compiled():
+    global _compiled
+    if _compiled is None:
+        lexicon = load_lexicon()
+        _compiled = {polarity: _compile_terms(lexicon.get(polarity, {}))
+                     for polarity in ('positive', 'negative', 'negation')}
+    return _compiled
+
+
+def reload_lexicon():
+    """設定變更後重新編譯詞典"""
+    global _compiled
+    _compiled = None
+    _get_compiled()
+
+
+def classify(text: str, fallback: bool = False):
+    """
+    以詞典判斷標題情緒
+
+    Args:
+        text: 新聞標題
+        fallback: True 時（模型不可用）即使語意不夠明確也以正負詞數量決定
+
+    Returns:
+        'positive', 'negative', 'neutral' 或 None（語意不明確，需交給模型）
+    """
+    if not text:
+        return None
+    compiled = _get_compiled()
+    lowered = text.lower()
+
+    pos_hits = compiled['positive'].findall(lowered) if compiled['positive'] else []
+    neg_hits = compiled['negative'].findall(lowered) if compiled['negative'] else []
+
+    if fallback:
+        if len(pos_hits) > len(neg_hits):
+            return 'positive'
+        if len(neg_hits) > len(pos_hits):
+            return 'negative'
+        return 'neutral'
+
+    if bool(pos_hits) == bool(neg_hits):
+        # 沒有命中或正負詞同時出現
+        return None
+
+    # 移除已命中的詞後再檢查否定詞，避免「不如預期」中的「不」被誤判為否定
+    remainder = lowered
+    for pattern in (compiled['positive'], compiled['negative']):
+        if pattern:
+            remainder = pattern.sub(' ', remainder)
+    if compiled['negation'] and compiled['negation'].search(remainder):
+        return None
+
+    return 'positive' if pos_hits else 'negative'
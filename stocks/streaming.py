@@ -0,0 +1,161 @@
+"""
+即時報價推播（Server-Sent Events，需以 ASGI 執行）
+每個 ASGI 行程內每支股票只有一個上游輪詢協程，訂閱同一股票的所有連線共用其結果；
+只有價格變動時才推送事件，期間連線保持開啟，瀏覽者不再每 10 秒發出新請求
+"""
+import asyncio
+import json
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+# 單一連線的待送事件上限；消費太慢時丟棄最舊的事件
+QUEUE_SIZE = 100
+
+
+def _default_feed(ticker):
+    """經由共用報價快取取得報價（跨行程仍只有一個請求會呼叫上游）"""
+    from .models import Stock
+    from .quotes import get_quote
+
+    stock = Stock.objects.filter(ticker=ticker).first()
+    if stock is None:
+        return None
+    quote = get_quote(stock)
+    return {
+        key: None if quote[key] is None else float(quote[key])
+        for key in ('price', 'change', 'change_percent')
+    }
+
+
+class QuoteHub:
+    """每支股票一個輪詢協程，將價格變動扇出給所有訂閱者"""
+
+    def __init__(self, feed=None, interval=None):
+        self.feed = feed or sync_to_async(_default_feed)
+        self.interval = interval
+        self._subscribers = {}  # ticker -> set(asyncio.Queue)
+        self._pollers = {}      # ticker -> asyncio.Task
+        self._latest = {}       # ticker -> 最近一次推送的報價
+
+    @property
+    def poll_interval(self):
+        if self.interval is not None:
+            return self.interval
+        return getattr(settings, 'QUOTE_STREAM_POLL_INTERVAL', 2)
+
+    def subscribe(self, tickers):
+        """訂閱多支股票；已有報價的股票會立即收到一筆目前報價"""
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        for ticker in tickers:
+            self._subscribers.setdefault(ticker, set()).add(queue)
+            if ticker in self._latest:
+                self._offer(queue, ticker, self._latest[ticker])
+            poller = self._pollers.get(ticker)
+            if poller is None or poller.done():
+                self._pollers[ticker] = asyncio.create_task(self._poll(ticker))
+        return queue
+
+    def unsubscribe(self, tickers, queue):
+        """取消訂閱；股票已無訂閱者時停止其輪詢協程"""
+        for ticker in tickers:
+            subscribers = self._subscribers.get(ticker)
+            if subscribers is None:
+                continue
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._subscribers[ticker]
+                poller = self._pollers.pop(ticker, None)
+                if poller is not None:
+                    poller.cancel()
+
+    def subscriber_count(self, ticker):
+        return len(self._subscribers.get(ticker, ()))
+
+    def _offer(self, queue, ticker, quote):
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait((ticker, quote))
+
+    async def _poll(self, ticker):
+        while ticker in self._subscribers:
+            try:
+                quote = await self.feed(ticker)
+            except Exception as e:
+                print(f"[QuoteStream] Error polling {ticker}: {e}")
+                quote = None
+            previous = self._latest.get(ticker)
+            if quote and quote.get('price') is not None and (previous is None or previous['price'] != quote['price']):
+                quote = {**quote, 'timestamp': datetime.now().strftime('%H:%M:%S')}
+                self._latest[ticker] = quote
+                for queue in list(self._subscribers.get(ticker, ())):
+                    self._offer(queue, ticker, quote)
+            await asyncio.sleep(self.poll_interval)
+
+
+_hub = None
+
+
+def get_hub():
+    global _hub
+    if _hub is None:
+        _hub = QuoteHub()
+    return _hub
+
+
+def format_event(ticker, quote):
+    return f"event: quote\ndata: {json.dumps({'ticker': ticker, **quote})}\n\n"
+
+
+class QuoteEventStream:
+    """
+    SSE 事件串流：連線期間持續推送報價變動，閒置時送出註解行維持連線
+
+    StreamingHttpResponse 在回應結束或客戶端斷線時會呼叫 close()，於此取消訂閱；
+    不依賴 async generator 的 finalizer：它要等到產生器被垃圾回收、再由建立它的事件迴圈排程 aclose() 才會執行，
+    斷線後何時取消訂閱無法確定，期間輪詢協程會繼續向上游取報價
+    """
+
+    def __init__(self, tickers, hub=None, heartbeat=None):
+        self.tickers = tickers
+        self.hub = hub or get_hub()
+        self.heartbeat = heartbeat or getattr(settings, 'QUOTE_STREAM_HEARTBEAT', 15)
+        self._queue = None
+        self._loop = None
+        self._closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._closed:
+            raise StopAsyncIteration
+        if self._queue is None:
+            self._loop = asyncio.get_running_loop()
+            self._queue = self.hub.subscribe(self.tickers)
+            return "retry: 3000\n\n"
+        try:
+            ticker, quote = await asyncio.wait_for(self._queue.get(), timeout=self.heartbeat)
+        except asyncio.TimeoutError:
+            return ": keep-alive\n\n"
+        return format_event(ticker, quote)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._queue is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self.hub.unsubscribe(self.tickers, self._queue)
+            return
+        # response.close() 可能在其他執行緒執行，需交回事件迴圈處理
+        try:
+            self._loop.call_soon_threadsafe(self.hub.unsubscribe, self.tickers, self._queue)
+        except RuntimeError:
+            pass
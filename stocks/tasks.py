@@ -1,32 +1,116 @@
 from background_task import background
-from .models import Stock, StockPrice
+from .models import Stock
+from .loading import notify_ingested
+from .fetch_runs import add_rows, record_error, span, start_run
 import yfinance as yf
 import pandas as pd
+import numpy as np
 from datetime import datetime
 
 @background(schedule=0) # Run immediately
-def fetch_stock_data(ticker):
+def fetch_stock_data(ticker, trading_days_only=False):
     """
     Background task wrapper for fetching stock data.
+    trading_days_only: 每小時的定期更新使用；該股票市場當地今天休市時略過（沒有新 K 棒）
     """
+    if trading_days_only:
+        from .market_calendar import is_trading_day
+
+        market = Stock.objects.filter(ticker=ticker).values_list('market', flat=True).first()
+        if market and not is_trading_day(market):
+            print(f"[Fetch] {ticker}: {market} 今日休市，略過定期更新")
+            return
     fetch_stock_data_sync(ticker)
 
+@background(schedule=0)
+def warm_sentiment_model():
+    """
+    Background task: pre-load the sentiment model ahead of a news refresh window.
+    The model unloads itself again once idle for SENTIMENT_MODEL_IDLE_TTL seconds.
+    """
+    from .sentiment import warm_up_model
+    warm_up_model()
+
+
+def schedule_sentiment_warmup(repeat=3600, now=None):
+    """
+    確保情緒模型的預熱任務已排程，且與每小時的股價/新聞更新同步：
+    排在最早一筆待執行的 fetch_stock_data 之前 SENTIMENT_WARMUP_LEAD 秒（沒有抓取任務時立即執行），
+    並以較高優先權排在同批次的 fetch_stock_data 之前
+    既有的預熱任務已對齊時不變動；已失敗或未對齊的任務會被取代
+    """
+    from datetime import timedelta
+    from django.conf import settings
+    from django.db.models import Min
+    from django.utils import timezone
+    from background_task.models import Task
+
+    now = now or timezone.now()
+    lead = timedelta(seconds=getattr(settings, 'SENTIMENT_WARMUP_LEAD', 120))
+    next_fetch = Task.objects.filter(
+        task_name=fetch_stock_data.name, repeat__gt=0, failed_at__isnull=True,
+    ).aggregate(run_at=Min('run_at'))['run_at']
+    run_at = max(next_fetch - lead, now) if next_fetch else now
+
+    warmups = Task.objects.filter(task_name=warm_sentiment_model.name)
+    if warmups.filter(failed_at__isnull=True, run_at__gte=run_at - lead, run_at__lte=run_at + lead).exists():
+        return False
+    warmups.delete()
+    warm_sentiment_model(schedule=run_at, repeat=repeat, priority=10)
+    return True
+
+
+@background(schedule=0)
+def update_intraday_bars():
+    """
+    Background task: append new 5-minute bars for watched stocks while their market is open,
+    then purge bars older than INTRADAY_RETENTION_DAYS.
+    """
+    from .intraday import update_open_markets
+    update_open_markets()
+
+
+def schedule_intraday_updates(repeat=None):
+    """
+    確保盤中 K 棒的週期更新任務已排程（全站只需一個）
+    已失敗（超過重試次數、不會再執行）的任務不算，會被取代
+    """
+    from background_task.models import Task
+    from django.conf import settings
+    tasks = Task.objects.filter(task_name=update_intraday_bars.name)
+    if tasks.filter(failed_at__isnull=True).exists():
+        return False
+    tasks.delete()
+    repeat = repeat or getattr(settings, 'INTRADAY_UPDATE_INTERVAL', 300)
+    update_intraday_bars(schedule=0, repeat=repeat)
+    return True
+
+
 def fetch_stock_data_sync(ticker):
     """
     Fetches historical stock data from yfinance and saves it to the database.
     (Synchronous version for testing and easier calling)
+    Each stage is timed and the run is stored as a FetchRun (see stocks/fetch_runs.py).
     """
+    with start_run(ticker) as run:
+        _fetch_stock_data(ticker, run)
+
+
+def _fetch_stock_data(ticker, run):
     print(f"Fetching data for {ticker}...")
     try:
         stock_obj, created = Stock.objects.get_or_create(ticker=ticker)
         if created:
             print(f"Created new stock entry for {ticker}")
 
-        # Download historical data
-        stock_data = yf.download(ticker, period="5y", progress=False)
+        # Download historical data（單一股票不需 yfinance 的下載執行緒，計時與上游統計也才能對應到此次執行）
+        with span('download'):
+            stock_data = yf.download(ticker, period="5y", progress=False, threads=False)
 
         if stock_data.empty:
             print(f"No data found for {ticker}. It might be delisted or an invalid ticker.")
+            run.fail('download', 'no data')
+            notify_ingested(ticker, ok=False)
             return
 
         # Handle MultiIndex columns (common in newer yfinance versions)
@@ -41,13 +125,18 @@ def fetch_stock_data_sync(ticker):
         try:
             # Re-fetch ticker object
             ticker_obj = yf.Ticker(ticker)
-            info = ticker_obj.info
+            with span('info'):
+                info = ticker_obj.info
 
             # Update stock fields if they are empty
             updated = False
-            if not stock_obj.description and info.get('longBusinessSummary'):
-                stock_obj.description = info.get('longBusinessSummary')
-                updated = True
+            # 簡介：首次取得或尚未正規化時拆分中英段落並翻譯（只在抓取時做一次，瀏覽時不再處理）
+            raw_description = stock_obj.description or info.get('longBusinessSummary')
+            if raw_description and (not stock_obj.description or not stock_obj.description_lang):
+                from .descriptions import normalize_description
+                with span('description'):
+                    if normalize_description(stock_obj, raw=raw_description):
+                        updated = True
             if not stock_obj.sector and info.get('sector'):
                 stock_obj.sector = info.get('sector')
                 updated = True
@@ -125,8 +214,9 @@ def fetch_stock_data_sync(ticker):
             # Fallback Calculation for Missing Ratios (e.g. for Financial Sector)
             if len(stock_data) > 0: # Ensure we accessed the ticker successfully
                 try:
-                    financials = ticker_obj.financials
-                    balance_sheet = ticker_obj.balance_sheet
+                    with span('statements'):
+                        financials = ticker_obj.financials
+                        balance_sheet = ticker_obj.balance_sheet
                     
                     if not financials.empty and not balance_sheet.empty:
                         # Get latest data (column 0)
@@ -168,29 +258,34 @@ def fetch_stock_data_sync(ticker):
 
                 except Exception as e:
                     print(f"Error calculating fallback ratios for {ticker}: {e}")
+                    record_error('statements', e)
 
             # Localized Name (TW Stocks)
             if '.TW' in ticker and not stock_obj.short_name:
                 try:
                     from .data_sources import get_tw_stock_name
-                    cname = get_tw_stock_name(ticker)
+                    with span('finmind'):
+                        cname = get_tw_stock_name(ticker)
                     if cname:
                         stock_obj.short_name = cname
                         updated = True
                 except Exception as e:
                     print(f"Error fetching FinMind name: {e}")
+                    record_error('finmind', e)
 
             # Financial Data
             # For TW stocks, try FinMind first for Revenue
             if '.TW' in ticker:
                 try:
                     from .data_sources import get_tw_revenue_finmind
-                    fm_rev = get_tw_revenue_finmind(ticker)
+                    with span('finmind'):
+                        fm_rev = get_tw_revenue_finmind(ticker)
                     if fm_rev:
                         stock_obj.last_revenue = fm_rev
                         updated = True
                 except Exception as e:
                     print(f"Error fetching FinMind revenue: {e}")
+                    record_error('finmind', e)
             
             # Fallback to yfinance revenue if empty
             if not stock_obj.last_revenue and info.get('totalRevenue'):
@@ -200,12 +295,14 @@ def fetch_stock_data_sync(ticker):
             # Earnings Date logic - Multi-source
             try:
                 from .data_sources import get_earnings_date_multi_source
-                earnings_dt = get_earnings_date_multi_source(ticker, info)
+                with span('earnings'):
+                    earnings_dt = get_earnings_date_multi_source(ticker, info)
                 if earnings_dt:
                     stock_obj.next_earnings_date = earnings_dt
                     updated = True
             except Exception as e:
                 print(f"Error fetching earnings date: {e}")
+                record_error('earnings', e)
                 # Fallback to old logic if error
                 from django.utils import timezone
                 earnings_ts = info.get('earningsTimestamp') or info.get('earningsTimestampStart')
@@ -216,12 +313,15 @@ def fetch_stock_data_sync(ticker):
                     except:
                         pass
 
+            # 只寫入實際變動的欄位（Stock 的 ChangeTrackingMixin 會依欄位精度比較）
             if updated:
-                stock_obj.save()
+                with span('db.metadata'):
+                    stock_obj.save()
                 print(f"Updated metadata for {ticker}")
 
         except Exception as e:
             print(f"Error fetching metadata for {ticker}: {e}")
+            record_error('info', e)
 
         # Iterate over the downloaded data and save it
         latest_row = None
@@ -232,26 +332,67 @@ def fetch_stock_data_sync(ticker):
              if len(stock_data) >= 2:
                  previous_close = stock_data.iloc[-2]['Close']
 
-        for index, row in stock_data.iterrows():
-            if isinstance(index, pd.Timestamp):
-                date = index.date()
-                StockPrice.objects.update_or_create(
-                    stock=stock_obj,
-                    date=date,
-                    defaults={
-                        'open': float(row['Open']),
-                        'high': float(row['High']),
-                        'low': float(row['Low']),
-                        'close': float(row['Close']),
-                        'volume': int(row['Volume'])
-                    }
-                )
+        # 批次寫入日 K（關聯式資料表，並鏡像至設定的時間序列後端）
+        from .timeseries import write_prices
+        bars = stock_data.dropna(subset=['Open', 'High', 'Low', 'Close'])
+        bars = bars[[isinstance(index, pd.Timestamp) for index in bars.index]]
+        if not bars.empty:
+            with span('db.prices'):
+                written = write_prices(stock_obj, {
+                    'date': np.array([index.date() for index in bars.index], dtype='datetime64[D]'),
+                    'open': bars['Open'].to_numpy(dtype=float),
+                    'high': bars['High'].to_numpy(dtype=float),
+                    'low': bars['Low'].to_numpy(dtype=float),
+                    'close': bars['Close'].to_numpy(dtype=float),
+                    'volume': bars['Volume'].fillna(0).to_numpy(dtype='int64'),
+                })
+            add_rows('prices', written)
+
+        # 同步欄位式價格檔（選用），後續摘要與指標計算即可直接讀取
+        from . import columnar
+        if columnar.is_enabled():
+            try:
+                with span('columnar'):
+                    columnar.sync_ticker(stock_obj)
+            except Exception as e:
+                print(f"Error syncing columnar store for {ticker}: {e}")
+                record_error('columnar', e)
+
+        # 更新儀表板摘要（最新 K 棒未變動時自動略過）
+        try:
+            from .utils import update_stock_summary
+            with span('summary'):
+                update_stock_summary(stock_obj)
+        except Exception as e:
+            print(f"Error updating summary for {ticker}: {e}")
+            record_error('summary', e)
+
+        # 技術指標（有計算狀態時只接續計算新 K 棒）
+        try:
+            from .indicators import update_indicators
+            with span('indicators'):
+                written = update_indicators(stock_obj)
+            add_rows('indicators', written)
+            print(f"[Indicators] {ticker} 更新 {written} 筆技術指標")
+        except Exception as e:
+            print(f"Error updating indicators for {ticker}: {e}")
+            record_error('indicators', e)
+
+        # 盤中 5 分鐘 K 棒（首次加入時回溯數日，之後只追加新 K 棒）
+        try:
+            from .intraday import update_intraday
+            with span('intraday'):
+                add_rows('intraday', update_intraday(stock_obj))
+        except Exception as e:
+            print(f"Error updating intraday bars for {ticker}: {e}")
+            record_error('intraday', e)
         
         # Update Real-time stats on Stock model
         # Try to use yfinance info for more up-to-date price/change first
         try:
             ticker_obj = yf.Ticker(ticker)
-            info = ticker_obj.info
+            with span('info'):
+                info = ticker_obj.info
             
             # Use currentPrice or regularMarketPrice
             current_price = info.get('currentPrice') or info.get('regularMarketPrice')
@@ -287,6 +428,7 @@ def fetch_stock_data_sync(ticker):
 
         except Exception as e:
             print(f"Error updating stats from info for {ticker}: {e}")
+            record_error('info', e)
             # Fallback to dataframe logic if info fetch fails completely
             if latest_row is not None:
                 current_close = float(latest_row['Close'])
@@ -312,69 +454,36 @@ def fetch_stock_data_sync(ticker):
              except:
                  pass
         
-        stock_obj.save()
+        with span('db.stock'):
+            stock_obj.save()
         print(f"Updated price stats for {ticker}: {stock_obj.last_price} ({stock_obj.change_percent}%)")
 
         print(f"Successfully updated data for {ticker}")
+        notify_ingested(ticker)
         
         # === 財務警示檢查 ===
-        check_financial_alerts(stock_obj)
+        with span('alerts'):
+            check_financial_alerts(stock_obj)
 
         # === 新聞抓取與情緒分析 (GPU) ===
         try:
              fetch_news_and_analyze(stock_obj)
         except Exception as e:
              print(f"Error fetching news for {ticker}: {e}")
+             record_error('news', e)
 
     except Exception as e:
         print(f"An error occurred while fetching data for {ticker}: {e}")
+        run.fail('run', e)
+        notify_ingested(ticker, ok=False)
 
 
 def check_financial_alerts(stock):
     """
-    檢查財務指標是否有異常，並更新 alert_message
+    檢查財務指標是否有異常，並更新 alert_message（規則見 stocks/alerts.py；內容未變動時不寫入）
     """
-    alerts = []
-    
-    # 1. 負債權益比 > 200% 高槓桿風險
-    if stock.debt_to_equity and stock.debt_to_equity > 200:
-        alerts.append(f"⚠️ 高財務槓桿：負債權益比達 {stock.debt_to_equity:.1f}%，顯示公司債務壓力較大")
-    
-    # 2. 速動比率 < 0.5 短期償債能力不足
-    if stock.quick_ratio and stock.quick_ratio < 0.5:
-        alerts.append(f"⚠️ 流動性風險：速動比率僅 {stock.quick_ratio:.2f}，短期償債能力可能不足")
-    
-    # 3. ROE 為負值
-    if stock.roe and stock.roe < 0:
-        roe_pct = stock.roe * 100
-        alerts.append(f"⚠️ 獲利警訊：ROE 為 {roe_pct:.2f}%，公司股東權益報酬呈現虧損")
-    
-    # 4. 自由現金流為負
-    if stock.free_cash_flow and stock.free_cash_flow < 0:
-        fcf_billions = stock.free_cash_flow / 1_000_000_000
-        alerts.append(f"⚠️ 現金流警訊：自由現金流為負 ({fcf_billions:.2f}B)，可能影響股利發放或再投資能力")
-    
-    # 5. 本益比過高 (> 50)
-    if stock.pe_ratio and stock.pe_ratio > 50:
-        alerts.append(f"⚠️ 估值偏高：本益比達 {stock.pe_ratio:.1f}，回本年限較長，需確認成長性是否支撐")
-    
-    # 6. 營業利益率為負
-    if stock.operating_margin and stock.operating_margin < 0:
-        op_margin_pct = stock.operating_margin * 100
-        alerts.append(f"⚠️ 本業虧損：營業利益率為 {op_margin_pct:.2f}%，本業經營處於虧損狀態")
-    
-    # 7. Beta 過高 (> 2) 波動風險
-    if stock.beta and stock.beta > 2:
-        alerts.append(f"⚠️ 高波動風險：Beta 值達 {stock.beta:.2f}，股價波動遠大於大盤")
-    
-    # 更新 alert_message
-    if alerts:
-        stock.alert_message = "\n".join(alerts)
-        print(f"[Alert] {stock.ticker} 有 {len(alerts)} 項財務警示")
-    else:
-        stock.alert_message = ""
-    
-    stock.save(update_fields=['alert_message'])
+    from .alerts import refresh_alerts
+    refresh_alerts(Stock.objects.filter(pk=stock.pk))
 
     print(f"[Fetch] {stock.ticker} 資料更新完成")
 
@@ -403,7 +512,8 @@ def fetch_news_and_analyze(stock):
     # 1. Yahoo Finance News
     try:
         yf_ticker = yf.Ticker(stock.ticker)
-        raw_news = yf_ticker.news
+        with span('news.yahoo'):
+            raw_news = yf_ticker.news
         
         if raw_news:
             for item in raw_news[:25]:
@@ -456,6 +566,7 @@ def fetch_news_and_analyze(stock):
                 })
     except Exception as e:
         print(f"[News] Error fetching Yahoo news for {stock.ticker}: {e}")
+        record_error('news.yahoo', e)
 
     # 2. Google RSS News
     try:
@@ -486,8 +597,12 @@ def fetch_news_and_analyze(stock):
         encoded_query = requests.utils.quote(query)
         rss_url = f"https://news.google.com/rss/search?q={encoded_query}&hl=zh-TW&gl=TW&ceid=TW:zh-Hant"
 
-        
-        feed = feedparser.parse(rss_url)
+
+        # 經由 requests 取得再交給 feedparser 解析（逾時可控，並可由 HTTP cassette 錄製 / 重播）
+        with span('news.rss'):
+            resp = requests.get(rss_url, timeout=10)
+            resp.raise_for_status()
+            feed = feedparser.parse(resp.content)
         
         for entry in feed.entries[:30]:
              if any(n['link'] == entry.link for n in news_list): continue
@@ -515,6 +630,7 @@ def fetch_news_and_analyze(stock):
              
     except Exception as e:
         print(f"[News] Error fetching RSS for {stock.ticker}: {e}")
+        record_error('news.rss', e)
 
     if not news_list:
         print(f"[News] No new news found for {stock.ticker}")
@@ -525,9 +641,11 @@ def fetch_news_and_analyze(stock):
         from .sentiment import analyze_batch
         original_titles = [n['original_title'] for n in news_list]
         print(f"[Sentiment] Analyzing {len(original_titles)} news items for {stock.ticker}...")
-        sentiments = analyze_batch(original_titles) # This uses GPU if available
+        with span('sentiment'):
+            sentiments = analyze_batch(original_titles, publishers=[n['publisher'] for n in news_list]) # This uses GPU if available
     except Exception as e:
         print(f"[Sentiment] Analysis failed: {e}")
+        record_error('sentiment', e)
         sentiments = ['neutral'] * len(news_list)
 
     # 4. Save to DB (with Translation)
@@ -536,7 +654,8 @@ def fetch_news_and_analyze(stock):
         try:
             # Translate title to Traditional Chinese
             try:
-                title_zh = translator.translate(item['original_title'])
+                with span('translate'):
+                    title_zh = translator.translate(item['original_title'])
             except:
                 title_zh = item['original_title']
             
@@ -547,17 +666,19 @@ def fetch_news_and_analyze(stock):
             except:
                 pub_date_aware = item['pub_date']
 
-            StockNews.objects.create(
-                stock=stock,
-                title=title_zh,
-                link=item['link'],
-                publisher=item['publisher'],
-                pub_date=pub_date_aware,
-                sentiment=sentiments[i]
-            )
+            with span('db.news'):
+                StockNews.objects.create(
+                    stock=stock,
+                    title=title_zh,
+                    link=item['link'],
+                    publisher=item['publisher'],
+                    pub_date=pub_date_aware,
+                    sentiment=sentiments[i]
+                )
             count += 1
         except Exception as e:
             print(f"[News] Error saving news item: {e}")
             continue
             
+    add_rows('news', count)
     print(f"[News] Saved {count} new news items for {stock.ticker}")
\ No newline at end of file
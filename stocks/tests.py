@@ -1,3 +1,1707 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import date, datetime, time as dt_time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+import pytz
+import requests
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import alerts, charting, descriptions, fetch_runs, http_cassette, indicators, streaming, timeseries, views
+from .charting import aggregate_ohlc, get_chart_data, lttb_indices, resample_ohlc
+from .models import FetchRun, IndicatorState, IntradayBar, Stock, StockPrice, TechnicalIndicator, Watchlist
+from .streaming import QuoteHub
+from .timeseries import InfluxDBBackend, RelationalBackend, to_line_protocol
+from .utils import get_recent_closes
+
+
+def make_bars(n=60, start=date(2024, 1, 1)):
+    """產生 n 個交易日（略過週末）的確定性日 K"""
+    dates = []
+    d = start
+    while len(dates) < n:
+        if d.weekday() < 5:
+            dates.append(d)
+        d += timedelta(days=1)
+    close = np.round(100 + np.cumsum(np.sin(np.arange(n)) * 2), 2)
+    return {
+        'date': np.array(dates, dtype='datetime64[D]'),
+        'open': close - 0.5,
+        'high': close + 1.0,
+        'low': close - 1.0,
+        'close': close,
+        'volume': np.arange(n, dtype=np.int64) * 10 + 1000,
+    }
+
+
+class LocalInfluxStandIn:
+    """
+    InfluxDB 的行程內替身：解析 line protocol 寫入，
+    並以 InfluxDBBackend 產生的 Flux 參數（range / ticker / aggregateWindow）回答查詢
+    """
+    AGGREGATES = {'first': lambda v: v[0], 'last': lambda v: v[-1], 'max': max, 'min': min, 'sum': sum}
+
+    def __init__(self):
+        self.points = {}
+        self.batches = []
+        self.queries = []
+
+    def write_lines(self, lines):
+        self.batches.append(list(lines))
+        for line in lines:
+            head, fields, ts = re.split(r'(?<!\\) ', line)
+            measurement, *tags = re.split(r'(?<!\\),', head)
+            tags = dict(t.split('=', 1) for t in tags)
+            tags = {k: v.replace('\\ ', ' ').replace('\\,', ',').replace('\\=', '=') for k, v in tags.items()}
+            values = {}
+            for field in fields.split(','):
+                key, raw = field.split('=', 1)
+                values[key] = int(raw[:-1]) if raw.endswith('i') else float(raw)
+            key = (measurement, tags['ticker'])
+            self.points.setdefault(key, {}).setdefault(int(ts), {}).update(values)
+
+    def query(self, flux):
+        self.queries.append(flux)
+        measurement = re.search(r'r\._measurement == "([^"]+)"', flux).group(1)
+        ticker = re.search(r'r\.ticker == "([^"]+)"', flux).group(1)
+        start, stop = re.search(r'range\(start: (\S+), stop: (now\(\)|[^)]+)\)', flux).groups()
+        start_ts = datetime.fromisoformat(start.replace('Z', '+00:00')).timestamp()
+        stop_ts = float('inf') if stop == 'now()' else datetime.fromisoformat(stop.replace('Z', '+00:00')).timestamp()
+
+        series = sorted((ts, v) for ts, v in self.points.get((measurement, ticker), {}).items()
+                        if start_ts <= ts < stop_ts)
+        window = re.search(r'aggregateWindow\(every: (\w+), offset: (\w+)', flux)
+        if not window:
+            return [{'_time': datetime.fromtimestamp(ts, dt_timezone.utc), **v} for ts, v in series]
+
+        every = window.group(1)
+        buckets = {}
+        for ts, v in series:
+            dt = datetime.fromtimestamp(ts, dt_timezone.utc)
+            if every == '1w':
+                # 與 Flux offset: 4d 相同：週一為每週起點
+                key = (dt - timedelta(days=dt.weekday())).replace(hour=0)
+            else:
+                key = dt.replace(day=1, hour=0)
+            buckets.setdefault(key, []).append(v)
+
+        fns = dict(re.findall(r'r\._field == "(\w+)"\) \|> aggregateWindow\([^)]*fn: (\w+)', flux))
+        return [
+            {'_time': key, **{f: self.AGGREGATES[fn]([v[f] for v in rows]) for f, fn in fns.items()}}
+            for key, rows in sorted(buckets.items())
+        ]
+
+
+class LineProtocolTests(SimpleTestCase):
+    def test_escapes_tags_and_types_fields(self):
+        line = to_line_protocol('stock_price', {'ticker': 'BRK B', 'market': 'US'},
+                                {'close': 1.5, 'volume': np.int64(10), 'rsi': float('nan')}, 100)
+        self.assertEqual(line, 'stock_price,market=US,ticker=BRK\\ B close=1.5,volume=10i 100')
+
+    def test_all_empty_fields_yield_no_line(self):
+        self.assertIsNone(to_line_protocol('technical_indicator', {'ticker': 'AAPL'}, {'sma5': float('nan')}, 1))
+
+
+class InfluxDBBackendTests(SimpleTestCase):
+    def setUp(self):
+        self.transport = LocalInfluxStandIn()
+        self.backend = InfluxDBBackend(transport=self.transport, bucket='test', batch_size=25)
+        self.stock = Stock(ticker='AAPL', market='US')
+        self.bars = make_bars(60)
+
+    def test_writes_are_batched(self):
+        self.backend.write_prices(self.stock, self.bars)
+        self.assertEqual([len(b) for b in self.transport.batches], [25, 25, 10])
+
+    def test_read_round_trip(self):
+        self.backend.write_prices(self.stock, self.bars)
+        arrays = self.backend.read_prices(self.stock)
+        for field in ('date', 'open', 'high', 'low', 'close', 'volume'):
+            np.testing.assert_array_equal(arrays[field], self.bars[field])
+
+    def test_weekly_aggregation_matches_numpy_resample(self):
+        self.backend.write_prices(self.stock, self.bars)
+        aggregated = self.backend.aggregate_prices(self.stock, 'W')
+        expected = resample_ohlc(self.bars, 'W')
+        self.assertIn('aggregateWindow(every: 1w', self.transport.queries[-1])
+        for field in ('date', 'open', 'high', 'low', 'close', 'volume'):
+            np.testing.assert_array_equal(aggregated[field], expected[field])
+
+    def test_range_limits_query(self):
+        self.backend.write_prices(self.stock, self.bars)
+        arrays = self.backend.read_prices(self.stock, start=date(2024, 2, 1), end=date(2024, 2, 29))
+        self.assertTrue((arrays['date'] >= np.datetime64('2024-02-01')).all())
+        self.assertTrue((arrays['date'] <= np.datetime64('2024-02-29')).all())
+        self.assertEqual(len(arrays['date']), 21)
+
+
+class TimeSeriesWriteTests(TestCase):
+    def setUp(self):
+        self.stock = Stock.objects.create(ticker='AAPL', market='US')
+        self.bars = make_bars(30)
+
+    def test_relational_write_upserts(self):
+        RelationalBackend().write_prices(self.stock, self.bars)
+        self.bars['close'] = self.bars['close'] + 1
+        RelationalBackend().write_prices(self.stock, self.bars)
+        self.assertEqual(StockPrice.objects.filter(stock=self.stock).count(), 30)
+        latest = StockPrice.objects.filter(stock=self.stock).order_by('-date').first()
+        self.assertAlmostEqual(float(latest.close), float(self.bars['close'][-1]), places=2)
+
+    @override_settings(TIMESERIES_BACKEND='influxdb')
+    def test_influx_mirrors_writes_and_serves_weekly_charts(self):
+        transport = LocalInfluxStandIn()
+        with mock.patch.object(timeseries, '_influx', InfluxDBBackend(transport=transport)):
+            timeseries.write_prices(self.stock, self.bars)
+            chart = get_chart_data(self.stock, range_key='max', resolution='W')
+
+        self.assertEqual(StockPrice.objects.filter(stock=self.stock).count(), 30)
+        self.assertEqual(sum(len(b) for b in transport.batches), 30)
+        self.assertEqual(chart['points'], len(resample_ohlc(self.bars, 'W')['date']))
+        self.assertEqual(len(transport.queries), 1)
+
+
+class FakeQuoteFeed:
+    """本地假報價來源：依序回傳預先設定的價格（用完後維持最後一筆），並記錄呼叫次數"""
+
+    def __init__(self, prices):
+        self.prices = {ticker: list(values) for ticker, values in prices.items()}
+        self.calls = {}
+
+    async def __call__(self, ticker):
+        self.calls[ticker] = self.calls.get(ticker, 0) + 1
+        values = self.prices[ticker]
+        price = values.pop(0) if len(values) > 1 else values[0]
+        return {'price': price, 'change': 0.0, 'change_percent': 0.0}
+
+
+class QuoteHubTests(SimpleTestCase):
+    async def test_subscribers_share_one_poller(self):
+        feed = FakeQuoteFeed({'AAPL': [100.0, 101.0]})
+        hub = QuoteHub(feed=feed, interval=0.01)
+        first, second = hub.subscribe(['AAPL']), hub.subscribe(['AAPL'])
+
+        for queue in (first, second):
+            self.assertEqual((await asyncio.wait_for(queue.get(), 1))[1]['price'], 100.0)
+            self.assertEqual((await asyncio.wait_for(queue.get(), 1))[1]['price'], 101.0)
+        self.assertEqual(len(hub._pollers), 1)
+
+        hub.unsubscribe(['AAPL'], first)
+        hub.unsubscribe(['AAPL'], second)
+        self.assertEqual(hub._pollers, {})
+
+    async def test_unchanged_price_is_not_pushed(self):
+        feed = FakeQuoteFeed({'AAPL': [100.0]})
+        hub = QuoteHub(feed=feed, interval=0.01)
+        queue = hub.subscribe(['AAPL'])
+        await asyncio.wait_for(queue.get(), 1)
+
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(queue.get(), 0.1)
+        self.assertGreater(feed.calls['AAPL'], 2)
+        hub.unsubscribe(['AAPL'], queue)
+
+    async def test_late_subscriber_gets_latest_quote(self):
+        hub = QuoteHub(feed=FakeQuoteFeed({'AAPL': [100.0]}), interval=0.01)
+        first = hub.subscribe(['AAPL'])
+        await asyncio.wait_for(first.get(), 1)
+
+        second = hub.subscribe(['AAPL'])
+        self.assertEqual(second.get_nowait()[1]['price'], 100.0)
+        hub.unsubscribe(['AAPL'], first)
+        hub.unsubscribe(['AAPL'], second)
+
+
+class QuoteStreamViewTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='viewer', password='pw')
+
+    async def test_streams_quote_events(self):
+        request = AsyncRequestFactory().get('/stocks/api/stream/quotes/', {'tickers': 'AAPL'})
+        request.user = self.user
+        hub = QuoteHub(feed=FakeQuoteFeed({'AAPL': [100.0, 100.5]}), interval=0.01)
+        with mock.patch.object(streaming, '_hub', hub):
+            response = views.quote_stream(request)
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            chunks = aiter(response.streaming_content)
+            self.assertEqual(await anext(chunks), b'retry: 3000\n\n')
+            events = [await anext(chunks), await anext(chunks)]
+            response.close()  # 與 ASGI handler 相同：回應結束或斷線後關閉
+            await chunks.aclose()
+            self.assertEqual(hub.subscriber_count('AAPL'), 0)
+
+        prices = [json.loads(e.decode().split('data: ', 1)[1])['price'] for e in events]
+        self.assertEqual(prices, [100.0, 100.5])
+
+    def test_rejects_non_asgi_requests(self):
+        self.client.force_login(self.user)
+        response = self.client.get('/stocks/api/stream/quotes/', {'tickers': 'AAPL'})
+        self.assertEqual(response.status_code, 503)
+
+    def test_requires_login(self):
+        response = self.client.get('/stocks/api/stream/quotes/', {'tickers': 'AAPL'})
+        self.assertEqual(response.status_code, 302)
+
+
+class QueryPlanTests(TestCase):
+    """
+    以 EXPLAIN 確認儀表板與詳細頁的查詢維持索引掃描
+    日 K 表預設灌入 1000 萬筆（PostgreSQL）；SQLite 以 20 萬筆驗證同樣的計畫，可用 QUERY_PLAN_SEED_ROWS 調整
+    """
+    STOCKS = 2000
+    USERS = 300
+    WATCHLIST_SIZE = 20
+
+    @classmethod
+    def setUpTestData(cls):
+        postgres = connection.vendor == 'postgresql'
+        rows = int(os.environ.get('QUERY_PLAN_SEED_ROWS') or (10_000_000 if postgres else 200_000))
+        days = max(rows // cls.STOCKS, 1)
+
+        Stock.objects.bulk_create([
+            Stock(ticker=f'QP{i}', name=f'Stock {i}', last_price=100 + i % 97, change_percent=i % 13 - 6)
+            for i in range(cls.STOCKS)
+        ])
+        with connection.cursor() as cursor:
+            if postgres:
+                cursor.execute(
+                    "INSERT INTO stocks_stockprice (stock_id, date, open, high, low, close, volume) "
+                    "SELECT s.id, DATE '2000-01-01' + d, 100, 101, 99, 100 + d % 50, 1000 "
+                    "FROM stocks_stock s CROSS JOIN generate_series(0, %s) AS d",
+                    [days - 1],
+                )
+            else:
+                cursor.execute(
+                    "WITH RECURSIVE days(d) AS (SELECT 0 UNION ALL SELECT d + 1 FROM days WHERE d < %s) "
+                    "INSERT INTO stocks_stockprice (stock_id, date, open, high, low, close, volume) "
+                    "SELECT s.id, date('2000-01-01', '+' || d || ' days'), 100, 101, 99, 100 + d % 50, 1000 "
+                    "FROM stocks_stock s CROSS JOIN days",
+                    [days - 1],
+                )
+
+        User = get_user_model()
+        User.objects.bulk_create([User(username=f'qp-user-{i}') for i in range(cls.USERS)])
+        users = list(User.objects.filter(username__startswith='qp-user-').values_list('pk', flat=True))
+        stocks = list(Stock.objects.values_list('pk', flat=True))
+        Watchlist.objects.bulk_create([
+            Watchlist(user_id=user, stock_id=stocks[(n * cls.WATCHLIST_SIZE + k) % len(stocks)])
+            for n, user in enumerate(users) for k in range(cls.WATCHLIST_SIZE)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        cls.stock = Stock.objects.get(ticker='QP7')
+        cls.user_id = users[0]
+
+    def explain(self, sql):
+        prefix = 'EXPLAIN ' if connection.vendor == 'postgresql' else 'EXPLAIN QUERY PLAN '
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql)
+            return '\n'.join(' '.join(str(col) for col in row) for row in cursor.fetchall())
+
+    def assertIndexScan(self, plan, table, sorted_by_index=False):
+        if not isinstance(plan, str):
+            plan = plan.explain()
+        if connection.vendor == 'postgresql':
+            self.assertNotIn(f'Seq Scan on {table}', plan)
+            self.assertRegex(plan, rf'Index (Only )?Scan.* on {table}\b|Bitmap Index Scan on {table}')
+            if sorted_by_index:
+                self.assertNotRegex(plan, r'\bSort\b')
+        else:
+            self.assertNotRegex(plan, rf'SCAN {table}\b(?! USING)')
+            self.assertRegex(plan, rf'(SEARCH|SCAN) {table} USING (COVERING )?INDEX')
+            if sorted_by_index:
+                self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_price_lookups_use_index(self):
+        # stock_detail 的 latest_price / recent_prices
+        self.assertIndexScan(self.stock.prices.order_by('-date')[:1], 'stocks_stockprice', sorted_by_index=True)
+        self.assertIndexScan(self.stock.prices.order_by('-date')[:5], 'stocks_stockprice', sorted_by_index=True)
+
+    def test_sparkline_window_uses_index(self):
+        # 儀表板缺少摘要時的最近收盤價視窗查詢（QuerySet.explain 無法包住視窗函式的外層子查詢，改為直接 EXPLAIN 執行的 SQL）
+        stock_ids = list(Stock.objects.order_by('pk').values_list('pk', flat=True)[:10])
+        with CaptureQueriesContext(connection) as queries:
+            closes = get_recent_closes(stock_ids)
+        self.assertEqual(len(closes), 10)
+        self.assertIndexScan(self.explain(queries.captured_queries[-1]['sql']), 'stocks_stockprice')
+
+    def test_watchlist_sorts_use_index(self):
+        for order in ('-id', 'stock__change_percent', '-stock__last_price', 'stock__name'):
+            with self.subTest(order=order):
+                queryset = (
+                    Watchlist.objects.filter(user_id=self.user_id)
+                    .select_related('stock', 'stock__summary')
+                    .order_by(order)
+                )
+                self.assertIndexScan(queryset, 'stocks_watchlist', sorted_by_index=(order == '-id'))
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    """回傳請求路徑的本機 HTTP 伺服器（cassette 錄製測試用）"""
+
+    def do_GET(self):
+        body = json.dumps({'path': self.path}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class HttpCassetteTests(SimpleTestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'upstream.jsonl.gz')
+        server = HTTPServer(('127.0.0.1', 0), EchoHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.base = f'http://127.0.0.1:{server.server_port}'
+        self.addCleanup(server.server_close)
+        self.server = server
+
+    def test_replays_recorded_responses_offline(self):
+        with http_cassette.use_cassette(self.path, mode='record'):
+            recorded = requests.get(f'{self.base}/quote?b=2&a=1&apikey=SECRET', timeout=5).json()
+        self.server.shutdown()
+
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            keys = [json.loads(line)['key'] for line in f]
+        self.assertEqual(len(keys), 1)
+        self.assertNotIn('SECRET', keys[0])
+
+        # 伺服器已關閉：參數順序與 API key 不同仍回放同一筆
+        with http_cassette.use_cassette(self.path, mode='replay') as cassette:
+            replayed = requests.get(f'{self.base}/quote?a=1&b=2&apikey=OTHER', timeout=5)
+            with self.assertRaises(http_cassette.CassetteMiss):
+                requests.get(f'{self.base}/missing', timeout=5)
+        self.assertEqual(replayed.json(), recorded)
+        self.assertEqual(dict(cassette.misses), {f'127.0.0.1:{self.server.server_port}': 1})
+        self.assertIsNone(http_cassette.active_cassette())
+
+
+class FetchRunTests(TestCase):
+    def test_records_stages_rows_and_upstream_calls(self):
+        server = HTTPServer(('127.0.0.1', 0), EchoHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        with fetch_runs.start_run('AAPL') as run:
+            with fetch_runs.span('download'):
+                requests.get(f'http://127.0.0.1:{server.server_port}/chart', timeout=5)
+            fetch_runs.add_rows('prices', 3)
+            fetch_runs.record_error('news', ValueError('boom'))
+        self.assertIsNone(fetch_runs.current())
+        # 沒有進行中的紀錄時不做任何事
+        with fetch_runs.span('download'):
+            fetch_runs.add_rows('prices', 1)
+
+        saved = FetchRun.objects.get()
+        self.assertTrue(saved.ok)
+        self.assertEqual(set(saved.stages), {'download'})
+        self.assertEqual(saved.rows, {'prices': 3})
+        self.assertEqual(saved.upstream['127.0.0.1']['calls'], 1)
+        self.assertEqual(saved.errors, [['news', 'boom']])
+        self.assertEqual(run.duration_ms, saved.duration_ms)
+
+        staff = get_user_model().objects.create_user('ops', password='pw', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get('/stocks/admin/fetch-runs/?hours=6')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['report']['tickers'][0]['slowest_stage'], 'download')
+
+
+class MetricsTests(TestCase):
+    def test_endpoint_merges_request_and_worker_metrics(self):
+        directory = tempfile.mkdtemp()
+        # 另一個行程（背景任務 worker）寫入的累計值
+        with open(os.path.join(directory, 'worker-1.json'), 'w') as f:
+            json.dump({'stocks_upstream_requests_total': [[['finmind', 'error'], 2]]}, f)
+
+        user = get_user_model().objects.create_user('metrics', password='pw')
+        self.client.force_login(user)
+        with override_settings(METRICS_DIR=directory, METRICS_TOKEN='s3cret'):
+            self.client.get('/stocks/dashboard/')
+            self.assertEqual(self.client.get('/metrics').status_code, 401)
+            body = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret').content.decode()
+
+        self.assertIn('stocks_upstream_requests_total{source="finmind",outcome="error"} 2', body)
+        self.assertRegex(body, r'stocks_http_request_duration_seconds_count\{view="dashboard",method="GET"\} [1-9]')
+        queries = re.search(r'stocks_http_request_db_queries_sum\{view="dashboard"\} (\d+)', body)
+        self.assertGreater(int(queries.group(1)), 0)
+        self.assertIn('# TYPE stocks_task_queue_depth gauge', body)
+
+    def test_endpoint_denied_by_default(self):
+        with override_settings(METRICS_TOKEN='', METRICS_ALLOWED_IPS=[]):
+            self.assertEqual(self.client.get('/metrics').status_code, 401)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer ').status_code, 401)
+            self.client.force_login(get_user_model().objects.create_user('user', password='pw'))
+            self.assertEqual(self.client.get('/metrics').status_code, 401)
+
+            self.client.force_login(get_user_model().objects.create_user('ops', password='pw', is_staff=True))
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+        self.client.logout()
+        with override_settings(METRICS_TOKEN='', METRICS_ALLOWED_IPS=['10.0.0.5']):
+            self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.6').status_code, 401)
+            self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.5').status_code, 200)
+
+    def test_model_lifecycle_and_memory_gauges(self):
+        import socket
+        from . import sentiment
+
+        self.client.force_login(get_user_model().objects.create_user('ops', password='pw', is_staff=True))
+        with mock.patch.dict(sentiment._model_state, {'loads': 3, 'unloads': 2}):
+            body = self.client.get('/metrics').content.decode()
+        process = f'{socket.gethostname()}-{os.getpid()}'
+        self.assertIn('# TYPE stocks_sentiment_model_loads gauge', body)
+        self.assertIn(f'stocks_sentiment_model_loads{{process="{process}"}} 3', body)
+        self.assertIn(f'stocks_sentiment_model_unloads{{process="{process}"}} 2', body)
+        self.assertIn(f'stocks_sentiment_model_loaded{{process="{process}"}} 0', body)
+        rss = re.search(rf'stocks_process_resident_memory_bytes{{process="{process}"}} (\d+)', body)
+        self.assertGreater(int(rss.group(1)), 0)
+
+    def test_only_server_processes_write_snapshots(self):
+        from . import metrics
+
+        self.assertTrue(metrics._is_server_process(['/venv/bin/gunicorn', 'stock_dashboard.wsgi']))
+        self.assertTrue(metrics._is_server_process(['manage.py', 'process_tasks']))
+        self.assertTrue(metrics._is_server_process(['manage.py', 'runserver']))
+        for command in ('migrate', 'shell', 'test', 'fetchdata'):
+            self.assertFalse(metrics._is_server_process(['manage.py', command]))
+        self.assertFalse(metrics._is_server_process(['manage.py']))
+
+        # 測試行程本身不寫檔
+        directory = tempfile.mkdtemp()
+        with override_settings(METRICS_DIR=directory):
+            metrics.RESPONSES.inc(view='dashboard', status=200)
+            metrics.flush()
+        self.assertEqual(os.listdir(directory), [])
+
+    def test_snapshots_of_exited_processes_are_removed(self):
+        import socket
+        import subprocess
+        import sys
+        from . import metrics
+
+        exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+        exited.wait()
+        directory = tempfile.mkdtemp()
+        host = socket.gethostname()
+        snapshot = {'stocks_upstream_requests_total': [[['finmind', 'ok'], 3]]}
+        for name in (f'{host}-{exited.pid}.json', f'{host}-{os.getppid()}.json', f'other-{exited.pid}.json'):
+            with open(os.path.join(directory, name), 'w') as f:
+                json.dump(snapshot, f)
+
+        with override_settings(METRICS_DIR=directory):
+            body = metrics.render()
+        # 已結束的本機行程被刪除；仍在執行的行程與其他主機的檔案保留並合併
+        self.assertEqual(sorted(os.listdir(directory)), sorted([f'{host}-{os.getppid()}.json', f'other-{exited.pid}.json']))
+        self.assertIn('stocks_upstream_requests_total{source="finmind",outcome="ok"} 6', body)
+
+
+class ProfilerTests(TestCase):
+    def test_staff_request_is_profiled_on_demand(self):
+        from . import profiling, upstream
+        profiling.install()
+        self.addCleanup(profiling.uninstall)
+        directory = tempfile.mkdtemp()
+        User = get_user_model()
+        staff = User.objects.create_user('staff', password='pw', is_staff=True)
+        user = User.objects.create_user('user', password='pw')
+
+        with override_settings(PROFILER_ENABLED=True, PROFILER_DIR=directory):
+            client = self.client_class()
+            client.force_login(user)
+            self.assertNotIn('X-Profile', client.get('/stocks/dashboard/?_profile=1'))
+
+            client.force_login(staff)
+            self.assertNotIn('X-Profile', client.get('/stocks/dashboard/'))
+            response = client.get('/stocks/dashboard/', HTTP_X_PROFILE='1')
+            summary = dict(part.split('=', 1) for part in response['X-Profile'].split('; '))
+            self.assertGreater(int(summary['sql']), 0)
+            self.assertIn('sql;dur=', response['Server-Timing'])
+
+            artifact = client.get(f"/stocks/admin/profiles/{summary['id']}.json")
+            detail = json.loads(b''.join(artifact.streaming_content))
+            self.assertEqual(detail['sql'], int(summary['sql']))
+            self.assertEqual(len(detail['queries']), detail['sql'])
+            self.assertTrue(os.path.exists(os.path.join(directory, f"{summary['id']}.folded")))
+            self.assertEqual(client.get('/stocks/admin/profiles/..%2Fsettings.py').status_code, 404)
+
+        profiling.uninstall()
+        self.assertNotIn(profiling._record_query, connection.execute_wrappers)
+        self.assertNotIn(profiling._observe_upstream, upstream._observers)
+
+
+class SentimentCacheKeyTests(TestCase):
+    def setUp(self):
+        from . import sentiment
+        self.sentiment = sentiment
+        sentiment._sentiment_cache.clear()
+        self.addCleanup(sentiment._sentiment_cache.clear)
+
+    def test_normalize_title(self):
+        normalize = self.sentiment.normalize_title
+        self.assertEqual(normalize('  Apple Beats Estimates!  '), 'apple beats estimates')
+        self.assertEqual(normalize('ＡＰＰＬ　創新高'), 'appl 創新高')
+        self.assertEqual(normalize('Apple beats estimates - Reuters', 'Reuters'), 'apple beats estimates')
+        self.assertEqual(normalize('台積電營收創新高 － 經濟日報', '經濟日報'), '台積電營收創新高')
+        # 後綴與發布者不同（或未提供發布者）時是標題本身的一部分
+        self.assertEqual(normalize('Apple beats estimates - Reuters', 'Bloomberg'), 'apple beats estimates reuters')
+        self.assertEqual(normalize('Apple beats estimates - shares surge'), 'apple beats estimates shares surge')
+
+    def test_clauses_after_dash_do_not_collide(self):
+        key = self.sentiment._title_key
+        self.assertNotEqual(
+            key('Apple beats estimates - shares surge', 'Yahoo'),
+            key('Apple beats estimates - shares plunge', 'Yahoo'),
+        )
+        # 同一則新聞的轉載（一則帶發布者後綴）共用快取鍵
+        self.assertEqual(key('Apple beats estimates - Reuters', 'Reuters'), key('Apple beats estimates', 'Yahoo'))
+
+    def test_cached_sentiment_is_not_served_to_a_different_headline(self):
+        surge = 'Apple beats estimates - shares surge'
+        self.sentiment._cache_set_many({self.sentiment._title_key(surge): 'positive'})
+
+        misses = self.sentiment._cache_stats['misses']
+        self.assertEqual(self.sentiment.analyze_batch([surge]), ['positive'])
+        self.assertEqual(self.sentiment._cache_stats['misses'], misses)
+        self.sentiment.analyze_batch(['Apple beats estimates - shares plunge'])
+        self.assertEqual(self.sentiment._cache_stats['misses'], misses + 1)
+
+
+class SentimentModelLifecycleTests(TestCase):
+    def setUp(self):
+        from . import sentiment
+        self.sentiment = sentiment
+        self.addCleanup(setattr, sentiment, '_sentiment_pipeline', None)
+
+    def test_warm_up_then_unload_when_idle(self):
+        sentiment = self.sentiment
+        sentiment._sentiment_pipeline = lambda texts: []  # 已載入的模型
+        unloads = sentiment._model_state['unloads']
+
+        with override_settings(SENTIMENT_MODEL_IDLE_TTL=3600):
+            self.assertTrue(sentiment.warm_up_model())
+        self.addCleanup(sentiment.unload_model)
+        self.assertIsNotNone(sentiment._idle_timer)
+        # 剛使用過、或仍有批次在執行時不卸載
+        self.assertFalse(sentiment.unload_if_idle(ttl=60))
+        sentiment._model_state['last_used'] -= 120
+        sentiment._model_state['active'] += 1
+        self.assertFalse(sentiment.unload_if_idle(ttl=60))
+        sentiment._model_state['active'] -= 1
+
+        self.assertTrue(sentiment.unload_if_idle(ttl=60))
+        self.assertIsNone(sentiment._sentiment_pipeline)
+        self.assertIsNone(sentiment._idle_timer)
+        self.assertEqual(sentiment._model_state['unloads'], unloads + 1)
+        self.assertFalse(sentiment.get_model_stats()['loaded'])
+
+    def test_warmup_is_scheduled_ahead_of_the_hourly_fetch(self):
+        from background_task.models import Task
+        from .tasks import fetch_stock_data, schedule_sentiment_warmup, warm_sentiment_model
+
+        now = timezone.now()
+        fetch_stock_data('AAPL', schedule=now + timedelta(minutes=30), repeat=3600)
+        with override_settings(SENTIMENT_WARMUP_LEAD=120):
+            self.assertTrue(schedule_sentiment_warmup(now=now))
+            warmup = Task.objects.get(task_name=warm_sentiment_model.name)
+            self.assertEqual(warmup.run_at, now + timedelta(minutes=28))
+            self.assertEqual(warmup.repeat, 3600)
+            self.assertFalse(schedule_sentiment_warmup(now=now))
+
+            # 永久失敗的預熱任務會被取代
+            Task.objects.filter(pk=warmup.pk).update(failed_at=now)
+            self.assertTrue(schedule_sentiment_warmup(now=now))
+            self.assertEqual(Task.objects.filter(task_name=warm_sentiment_model.name, failed_at__isnull=True).count(), 1)
+
+
+class SentimentLexiconTests(SimpleTestCase):
+    def setUp(self):
+        from .sentiment_lexicon import classify
+        self.classify = classify
+
+    def test_clear_headlines_in_english_and_chinese(self):
+        self.assertEqual(self.classify('Nvidia shares surge after earnings beat estimates'), 'positive')
+        self.assertEqual(self.classify('Tesla stock plunges on delivery miss'), 'negative')
+        self.assertEqual(self.classify('台積電股價創新高'), 'positive')
+        self.assertEqual(self.classify('鴻海第三季獲利不如預期 股價重挫'), 'negative')
+
+    def test_ambiguous_or_negated_headlines_defer_to_the_model(self):
+        self.assertIsNone(self.classify('Apple announces new iPhone'))
+        self.assertIsNone(self.classify('Apple beats estimates - shares plunge'))
+        self.assertIsNone(self.classify('Analysts say it is not a crash'))
+        self.assertIsNone(self.classify('聯發科股價未創新高'))
+        # 「不如預期」是負面詞本身，其中的「不」不算否定詞
+        self.assertEqual(self.classify('營收不如預期'), 'negative')
+
+    def test_fallback_always_returns_a_label(self):
+        self.assertEqual(self.classify('Analysts say it is not a crash', fallback=True), 'negative')
+        self.assertEqual(self.classify('Shares surge and rally despite downgrade', fallback=True), 'positive')
+        self.assertEqual(self.classify('Apple beats estimates - shares plunge', fallback=True), 'neutral')
+        self.assertEqual(self.classify('Apple announces new iPhone', fallback=True), 'neutral')
+
+
+class SentimentFallbackTests(TestCase):
+    def test_model_failure_falls_back_to_lexicon_without_caching(self):
+        from . import sentiment
+        sentiment._sentiment_cache.clear()
+        self.addCleanup(sentiment._sentiment_cache.clear)
+        titles = ['Apple beats estimates - shares plunge', 'Analysts say it is not a crash', 'Nvidia shares surge']
+
+        with mock.patch.object(sentiment, '_load_sentiment_model', return_value=None):
+            labels = sentiment.analyze_batch(titles)
+        self.assertEqual(labels, ['neutral', 'negative', 'positive'])
+        # 備援結果不寫入快取，模型恢復後仍會重新分析
+        self.assertEqual(list(sentiment._sentiment_cache), [])
+
+
+class ChartAggregationTests(SimpleTestCase):
+    def setUp(self):
+        self.bars = make_bars(300)
+
+    def assert_bucket_invariants(self, bars, buckets, key):
+        """每個桶：開=首筆、收=末筆、高低=極值、量=加總，且涵蓋完整的日曆週期"""
+        keys = key(bars['date'])
+        for i, bucket_key in enumerate(key(buckets['date'])):
+            members = keys == bucket_key
+            self.assertEqual(buckets['open'][i], bars['open'][members][0])
+            self.assertEqual(buckets['close'][i], bars['close'][members][-1])
+            self.assertEqual(buckets['high'][i], bars['high'][members].max())
+            self.assertEqual(buckets['low'][i], bars['low'][members].min())
+            self.assertEqual(buckets['volume'][i], bars['volume'][members].sum())
+            self.assertEqual(buckets['end_date'][i], bars['date'][members][-1])
+        self.assertEqual(buckets['volume'].sum(), bars['volume'].sum())
+
+    def test_under_cap_keeps_daily_bars(self):
+        arrays, resolution = aggregate_ohlc(self.bars, 300)
+        self.assertEqual(resolution, 'D')
+        self.assertIs(arrays, self.bars)
+
+    def test_over_cap_uses_weekly_buckets(self):
+        arrays, resolution = aggregate_ohlc(self.bars, 100)
+        self.assertEqual(resolution, 'W')
+        self.assertLessEqual(len(arrays['date']), 100)
+        # 每週從週一開始（2024-01-01 為週一，make_bars 略過週末）
+        self.assertTrue((arrays['date'].astype('datetime64[D]').view('int64') % 7 == 4).all())
+        self.assert_bucket_invariants(
+            self.bars, arrays, lambda d: (d + np.timedelta64(3, 'D')).astype('datetime64[W]'))
+
+    def test_escalates_to_monthly_buckets(self):
+        arrays, resolution = aggregate_ohlc(self.bars, 20)
+        self.assertEqual(resolution, 'M')
+        self.assertEqual(len(arrays['date']), 14)
+        self.assert_bucket_invariants(self.bars, arrays, lambda d: d.astype('datetime64[M]'))
+
+    def test_weekly_request_escalates_to_yearly(self):
+        arrays, resolution = aggregate_ohlc(self.bars, 10, 'W')
+        self.assertEqual(resolution, 'Y')
+        self.assertEqual(len(arrays['date']), 2)
+        self.assert_bucket_invariants(self.bars, arrays, lambda d: d.astype('datetime64[Y]'))
+
+    def test_weekly_input_is_not_resampled_again(self):
+        weekly = resample_ohlc(self.bars, 'W')
+        arrays, resolution = aggregate_ohlc(weekly, 100, 'W')
+        self.assertEqual(resolution, 'W')
+        np.testing.assert_array_equal(arrays['close'], weekly['close'])
+
+    def test_chart_reports_effective_resolution(self):
+        chart = get_chart_data(Stock(ticker='AAPL'), resolution='D', max_points=100, arrays=self.bars)
+        self.assertEqual(chart['resolution'], 'W')
+        self.assertEqual(chart['total_points'], 300)
+        self.assertEqual(chart['points'], len(resample_ohlc(self.bars, 'W')['date']))
+
+    def test_lttb_keeps_endpoints_and_point_count(self):
+        x = self.bars['date'].astype(np.int64)
+        for threshold in (3, 50, 299):
+            idx = lttb_indices(x, self.bars['close'], threshold)
+            self.assertEqual(len(idx), threshold)
+            self.assertEqual(idx[0], 0)
+            self.assertEqual(idx[-1], 299)
+            self.assertTrue((np.diff(idx) > 0).all())
+        np.testing.assert_array_equal(lttb_indices(x, self.bars['close'], 300), np.arange(300))
+
+    def test_line_chart_keeps_endpoints(self):
+        chart = get_chart_data(Stock(ticker='AAPL'), chart_type='line', max_points=50, arrays=self.bars)
+        self.assertEqual(chart['points'], 50)
+        self.assertEqual(chart['data'][0], ['2024-01-01', round(float(self.bars['close'][0]), 2)])
+        self.assertEqual(chart['data'][-1][0], str(self.bars['date'][-1]))
+
+
+class IndicatorIncrementalTests(SimpleTestCase):
+    def test_incremental_updates_match_full_compute(self):
+        bars = make_bars(120)
+        full, full_state = indicators.compute_indicators(bars)
+        for k in (1, 5, 40):
+            _, state = indicators.compute_indicators({key: arr[:-k] for key, arr in bars.items()})
+            values, new_state = indicators.update_indicators_incremental(
+                state, {key: arr[-k:] for key, arr in bars.items()})
+            for field in indicators.INDICATOR_FIELDS:
+                np.testing.assert_allclose(values[field], full[field][-k:], rtol=1e-9, err_msg=f"{field} (k={k})")
+            self.assertEqual(new_state['count'], full_state['count'])
+            self.assertEqual(new_state['closes_tail'], full_state['closes_tail'])
+            for key in ('ema12', 'ema26', 'macd_signal', 'avg_gain', 'avg_loss', 'atr14'):
+                self.assertAlmostEqual(new_state[key], full_state[key], places=9)
+
+    def test_short_history_has_no_state(self):
+        _, state = indicators.compute_indicators(make_bars(indicators.WARMUP_BARS - 1))
+        self.assertIsNone(state)
+
+
+class IndicatorUpdateTests(TestCase):
+    def setUp(self):
+        self.stock = Stock.objects.create(ticker='AAPL', market='US')
+        self.bars = make_bars(100)
+
+    def stored(self, field):
+        return np.array(
+            TechnicalIndicator.objects.filter(stock=self.stock).order_by('date').values_list(field, flat=True),
+            dtype=np.float64)
+
+    def assert_matches_full_compute(self):
+        expected, _ = indicators.compute_indicators(charting.load_price_arrays(self.stock))
+        for field in indicators.INDICATOR_FIELDS:
+            # 寫入時四捨五入到小數第 6 位
+            np.testing.assert_allclose(self.stored(field), expected[field], rtol=0, atol=1e-6, err_msg=field)
+
+    def test_new_bars_are_computed_incrementally(self):
+        RelationalBackend().write_prices(self.stock, {key: arr[:90] for key, arr in self.bars.items()})
+        self.assertEqual(indicators.update_indicators(self.stock), 90)
+
+        RelationalBackend().write_prices(self.stock, self.bars)
+        with mock.patch.object(indicators, 'compute_indicators', wraps=indicators.compute_indicators) as full:
+            self.assertEqual(indicators.update_indicators(self.stock), 10)
+            self.assertEqual(indicators.update_indicators(self.stock), 0)
+        full.assert_not_called()
+        self.assertEqual(IndicatorState.objects.get(stock=self.stock).state['count'], 100)
+        self.assert_matches_full_compute()
+
+    def test_rewritten_history_triggers_rebuild(self):
+        RelationalBackend().write_prices(self.stock, {key: arr[:90] for key, arr in self.bars.items()})
+        indicators.update_indicators(self.stock)
+
+        # 還原權值改寫歷史：已計算的最後一根 K 棒收盤價與狀態不一致
+        self.bars['close'] = np.round(self.bars['close'] * 0.5, 2)
+        RelationalBackend().write_prices(self.stock, self.bars)
+        with mock.patch.object(indicators, 'compute_indicators', wraps=indicators.compute_indicators) as full:
+            self.assertEqual(indicators.update_indicators(self.stock), 100)
+        full.assert_called_once()
+        state = IndicatorState.objects.get(stock=self.stock)
+        self.assertEqual(state.state['last_close'], float(self.bars['close'][-1]))
+        self.assertEqual(TechnicalIndicator.objects.filter(stock=self.stock).count(), 100)
+        self.assert_matches_full_compute()
+
+
+class IntradayUpdateTests(TestCase):
+    # 2026-03-04（週三）10:00 紐約時間，台股已收盤
+    US_SESSION = datetime(2026, 3, 4, 15, 0, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        from . import intraday
+        self.intraday = intraday
+        # 過期清除以目前時間為準，固定在測試的交易時段
+        patcher = mock.patch.object(timezone, 'now', return_value=self.US_SESSION)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        user = get_user_model().objects.create_user('intraday', password='pw')
+        self.aapl = Stock.objects.create(ticker='AAPL', market='US')
+        self.msft = Stock.objects.create(ticker='MSFT', market='US')
+        self.tsmc = Stock.objects.create(ticker='2330.TW', market='TW')
+        Watchlist.objects.create(user=user, stock=self.aapl)
+        Watchlist.objects.create(user=user, stock=self.tsmc)
+
+    def frame(self, start, n=2):
+        index = pd.date_range(start, periods=n, freq='5min')
+        return pd.DataFrame({'Open': 1.0, 'High': 2.0, 'Low': 0.5, 'Close': 1.5, 'Volume': 100}, index=index)
+
+    def test_updates_watched_stocks_in_open_markets_only(self):
+        download = mock.Mock(return_value=self.frame(self.US_SESSION))
+        with mock.patch.object(self.intraday, '_download', download):
+            self.assertEqual(self.intraday.update_open_markets(now=self.US_SESSION), 2)
+        download.assert_called_once_with('AAPL', start=None)
+        self.assertEqual(IntradayBar.objects.filter(stock=self.aapl).count(), 2)
+
+    def test_close_grace_period_and_closed_market(self):
+        after_close = datetime(2026, 3, 4, 21, 5, tzinfo=dt_timezone.utc)
+        saturday = datetime(2026, 3, 7, 15, 0, tzinfo=dt_timezone.utc)
+        download = mock.Mock(return_value=self.frame(after_close))
+        with mock.patch.object(self.intraday, '_download', download):
+            self.assertEqual(self.intraday.update_open_markets(now=after_close), 2)
+            self.assertEqual(self.intraday.update_open_markets(now=saturday), 0)
+        self.assertEqual(download.call_count, 1)
+
+    def test_resumes_from_last_bar_and_purges_expired(self):
+        last = self.US_SESSION - timedelta(minutes=5)
+        IntradayBar.objects.create(stock=self.aapl, timestamp=last, open=1, high=1, low=1, close=1)
+        IntradayBar.objects.create(stock=self.tsmc, timestamp=self.US_SESSION - timedelta(days=30),
+                                   open=1, high=1, low=1, close=1)
+        download = mock.Mock(return_value=self.frame(last - timedelta(minutes=5), n=3))
+        with mock.patch.object(self.intraday, '_download', download):
+            self.assertEqual(self.intraday.update_open_markets(now=self.US_SESSION), 2)
+        download.assert_called_once_with('AAPL', start=last)
+        self.assertEqual(IntradayBar.objects.get(stock=self.aapl, timestamp=last).close, Decimal('1.50'))
+        self.assertFalse(IntradayBar.objects.filter(stock=self.tsmc).exists())
+
+    def test_one_failing_stock_does_not_stop_the_rest(self):
+        Watchlist.objects.create(user=get_user_model().objects.get(username='intraday'), stock=self.msft)
+        download = mock.Mock(side_effect=[RuntimeError('rate limited'), self.frame(self.US_SESSION)])
+        with mock.patch.object(self.intraday, '_download', download):
+            self.assertEqual(self.intraday.update_open_markets(now=self.US_SESSION), 2)
+        self.assertEqual(download.call_count, 2)
+
+
+class IntradayScheduleTests(TestCase):
+    def test_schedules_one_task_and_replaces_failed_ones(self):
+        from background_task.models import Task
+        from .tasks import schedule_intraday_updates, update_intraday_bars
+
+        self.assertTrue(schedule_intraday_updates(repeat=300))
+        self.assertFalse(schedule_intraday_updates(repeat=300))
+        tasks = Task.objects.filter(task_name=update_intraday_bars.name)
+        self.assertEqual(tasks.get().repeat, 300)
+
+        tasks.update(failed_at=timezone.now())
+        self.assertTrue(schedule_intraday_updates(repeat=300))
+        self.assertEqual(tasks.count(), 1)
+        self.assertIsNone(tasks.get().failed_at)
+
+    def test_schedule_jobs_command(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from background_task.models import Task
+        from .tasks import update_intraday_bars, warm_sentiment_model
+
+        call_command('schedule_jobs', stdout=StringIO())
+        call_command('schedule_jobs', stdout=StringIO())
+        self.assertEqual(Task.objects.filter(task_name=update_intraday_bars.name).count(), 1)
+        self.assertEqual(Task.objects.filter(task_name=warm_sentiment_model.name).count(), 1)
+
+    def test_hourly_fetch_skips_closed_market_days(self):
+        from .tasks import fetch_stock_data
+
+        Stock.objects.create(ticker='AAPL', market='US')
+        saturday = datetime(2024, 6, 15, 15, 0, tzinfo=dt_timezone.utc)
+        wednesday = datetime(2024, 6, 12, 15, 0, tzinfo=dt_timezone.utc)
+        with mock.patch('stocks.tasks.fetch_stock_data_sync') as sync:
+            with mock.patch('django.utils.timezone.now', return_value=saturday):
+                fetch_stock_data.now('AAPL', trading_days_only=True)
+                sync.assert_not_called()
+                # 手動觸發（新增股票、fetchdata）不受行事曆限制
+                fetch_stock_data.now('AAPL')
+                sync.assert_called_once_with('AAPL')
+            with mock.patch('django.utils.timezone.now', return_value=wednesday):
+                fetch_stock_data.now('AAPL', trading_days_only=True)
+            self.assertEqual(sync.call_count, 2)
+
+    def test_refresh_all_schedules_calendar_gated_fetches(self):
+        from background_task.models import Task
+        from .tasks import fetch_stock_data
+
+        user = get_user_model().objects.create_user('refresher', password='pw')
+        stock = Stock.objects.create(ticker='AAPL', market='US')
+        Watchlist.objects.create(user=user, stock=stock)
+        self.client.force_login(user)
+        with mock.patch('stocks.views.schedule_intraday_updates'):
+            self.client.get(reverse('refresh_all_stocks'))
+        task = Task.objects.get(task_name=fetch_stock_data.name)
+        self.assertEqual(task.repeat, 3600)
+        self.assertEqual(json.loads(task.task_params), [['AAPL'], {'trading_days_only': True}])
+
+
+# 共用快取改為行程內的 LocMemCache，測試之間不經由檔案快取互相影響
+LOCMEM_CACHES = {
+    alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': f'test-{alias}'}
+    for alias in ('default', 'quotes', 'events')
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHES, QUOTE_CACHE_TTL=60)
+class BatchQuotesApiTests(TestCase):
+    def setUp(self):
+        from . import quotes
+        self.quotes = quotes
+        quotes._cache().clear()
+        user = get_user_model().objects.create_user('quotes', password='pw')
+        self.client.force_login(user)
+        self.stocks = [Stock.objects.create(ticker=t, market='US') for t in ('AAPL', 'MSFT', 'NVDA')]
+        for stock in self.stocks:
+            Watchlist.objects.create(user=user, stock=stock)
+
+    def test_one_upstream_call_for_the_page_misses(self):
+        self.quotes._store(self.stocks[0], 110.0, 100.0)
+        fetch = mock.Mock(return_value={'MSFT': (95.0, 100.0), 'NVDA': (100.0, 100.0)})
+        with mock.patch.object(self.quotes, 'fetch_quotes', fetch):
+            data = self.client.get(reverse('batch_quotes_api')).json()['quotes']
+        fetch.assert_called_once()
+        self.assertEqual(sorted(fetch.call_args.args[0]), ['MSFT', 'NVDA'])
+        self.assertEqual(data['AAPL']['change_percent'], 10.0)
+        self.assertEqual((data['MSFT']['change'], data['MSFT']['change_percent']), (-5.0, -5.0))
+        self.assertFalse(any(quote['stale'] for quote in data.values()))
+
+    def test_cache_hits_skip_upstream(self):
+        for stock in self.stocks:
+            self.quotes._store(stock, 101.0, 100.0)
+        fetch = mock.Mock()
+        with mock.patch.object(self.quotes, 'fetch_quotes', fetch):
+            data = self.client.get(reverse('batch_quotes_api'), {'tickers': 'AAPL,MSFT'}).json()['quotes']
+        fetch.assert_not_called()
+        self.assertEqual(sorted(data), ['AAPL', 'MSFT'])
+        self.assertEqual(data['MSFT']['price'], 101.0)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, LOADING_WAIT_INTERVAL=0.01)
+class LoadingWaitTests(TestCase):
+    def setUp(self):
+        from django.core.cache import caches
+        from . import loading
+        self.loading = loading
+        caches[loading.EVENTS_CACHE_ALIAS].clear()
+        self.user = get_user_model().objects.create_user('loading', password='pw')
+        Stock.objects.create(ticker='AAPL', market='US')
+        Stock.objects.create(ticker='MSFT', market='US')
+
+    def ingest(self, ticker, ok=True):
+        """模擬背景任務：寫入資料並在交易提交後發出完成通知"""
+        with self.captureOnCommitCallbacks(execute=True):
+            if ok:
+                Stock.objects.filter(ticker=ticker).update(last_price=Decimal('100.00'))
+            self.loading.notify_ingested(ticker, ok=ok)
+
+    def test_notification_waits_for_commit(self):
+        from django.core.cache import caches
+        events = caches[self.loading.EVENTS_CACHE_ALIAS]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.loading.notify_ingested('AAPL')
+            self.assertIsNone(events.get('ingested:AAPL'))
+        self.assertTrue(events.get('ingested:AAPL')['ok'])
+
+    def wait(self, tickers, timeout, during=None):
+        """執行 wait_for_ready（during 為同時進行的協程，例如模擬背景任務完成）"""
+        async def scenario():
+            task = asyncio.create_task(during()) if during else None
+            result = await self.loading.wait_for_ready(tickers, timeout=timeout)
+            if task:
+                await task
+            return result
+        return async_to_sync(scenario)()
+
+    def test_returns_immediately_when_already_loaded(self):
+        Stock.objects.filter(ticker='AAPL').update(last_price=Decimal('100.00'))
+        started = time.monotonic()
+        self.assertEqual(self.wait(['AAPL', 'MSFT'], timeout=5), (['AAPL'], []))
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_wakes_up_on_notify_after_commit(self):
+        async def ingest_later():
+            await asyncio.sleep(0.05)
+            await sync_to_async(self.ingest)('MSFT')
+
+        started = time.monotonic()
+        self.assertEqual(self.wait(['AAPL', 'MSFT'], timeout=5, during=ingest_later), (['MSFT'], []))
+        self.assertLess(time.monotonic() - started, 2)
+
+    def test_failed_ingestion_is_reported(self):
+        self.ingest('AAPL', ok=False)
+        self.assertEqual(self.wait(['AAPL', 'MSFT'], timeout=5), ([], ['AAPL']))
+
+    def test_times_out_without_notification(self):
+        started = time.monotonic()
+        self.assertEqual(self.wait(['AAPL'], timeout=0.1), ([], []))
+        self.assertGreaterEqual(time.monotonic() - started, 0.1)
+
+    def test_finmind_import_does_not_patch_asyncio(self):
+        import FinMind.data  # noqa: F401
+        self.assertFalse(hasattr(asyncio, '_nest_patched'))
+        # 套用 nest_asyncio 時，同一執行緒第二次 async_to_sync 會排到已停止的事件迴圈而卡住
+        for _ in range(2):
+            self.assertEqual(self.wait(['AAPL'], timeout=0), ([], []))
+
+    def test_check_loading_status_reports_pending(self):
+        self.ingest('AAPL')
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('check_loading_status'),
+                                    json.dumps({'tickers': ['AAPL', 'MSFT'], 'wait': 0}),
+                                    content_type='application/json')
+        self.assertEqual(response.json(), {'ready': ['AAPL'], 'failed': [], 'pending': ['MSFT']})
+
+
+class MarketCalendarTests(SimpleTestCase):
+    def setUp(self):
+        from . import market_calendar
+        self.mc = market_calendar
+        self.tw = market_calendar.get_calendar('TW')
+        self.us = market_calendar.get_calendar('US')
+        self.taipei = pytz.timezone('Asia/Taipei')
+        self.new_york = pytz.timezone('America/New_York')
+
+    def test_is_open_respects_session_holiday_and_early_close(self):
+        self.assertTrue(self.tw.is_open(self.taipei.localize(datetime(2026, 12, 31, 9, 0))))
+        self.assertTrue(self.tw.is_open(self.taipei.localize(datetime(2026, 12, 31, 13, 30))))
+        self.assertFalse(self.tw.is_open(self.taipei.localize(datetime(2026, 12, 31, 13, 31))))
+        # 行憲紀念日
+        self.assertFalse(self.tw.is_open(self.taipei.localize(datetime(2026, 12, 25, 10, 0))))
+        # 感恩節隔天 13:00 提前收盤
+        self.assertTrue(self.us.is_open(self.new_york.localize(datetime(2026, 11, 27, 12, 59))))
+        self.assertFalse(self.us.is_open(self.new_york.localize(datetime(2026, 11, 27, 13, 30))))
+        self.assertEqual(self.us.session(date(2026, 11, 27))[1].time(), dt_time(13, 0))
+
+    def test_next_open_skips_new_year_holiday(self):
+        after_close = self.taipei.localize(datetime(2026, 12, 31, 14, 0))
+        self.assertEqual(self.mc.next_market_open('TW', after_close),
+                         self.taipei.localize(datetime(2027, 1, 4, 9, 0)))
+        before_open = self.new_york.localize(datetime(2026, 11, 26, 8, 0))
+        self.assertEqual(self.us.next_open(before_open), self.new_york.localize(datetime(2026, 11, 27, 9, 30)))
+
+    def test_trading_days_between(self):
+        # 2027 農曆春節：2/2 至 2/10 休市
+        self.assertEqual(self.tw.trading_days_between(date(2027, 2, 1), date(2027, 2, 12)), 3)
+        self.assertEqual(self.tw.trading_days(date(2027, 2, 1), date(2027, 2, 12)),
+                         [date(2027, 2, 1), date(2027, 2, 11), date(2027, 2, 12)])
+        self.assertEqual(self.us.trading_days_between(date(2026, 12, 21), date(2026, 12, 27)), 4)
+        self.assertEqual(self.us.trading_days_between(date(2026, 12, 27), date(2026, 12, 21)), 0)
+
+    def test_find_gaps_ignores_holidays_and_weekends(self):
+        dates = [date(2026, 12, 22), date(2026, 12, 24), date(2026, 12, 29)]
+        self.assertEqual(self.us.find_gaps(dates), [date(2026, 12, 23), date(2026, 12, 28)])
+        self.assertEqual(self.us.find_gaps([], start=date(2026, 12, 24), end=date(2026, 12, 28)),
+                         [date(2026, 12, 24), date(2026, 12, 28)])
+        self.assertEqual(self.us.find_gaps([]), [])
+
+    def test_years_without_holiday_data_warn(self):
+        from io import StringIO
+        from contextlib import redirect_stdout
+
+        self.assertTrue(self.tw.has_holiday_data(2027))
+        calendar = self.mc.MarketCalendar('TW', holidays=[date(2027, 1, 1)])
+        out = StringIO()
+        with redirect_stdout(out):
+            calendar.is_trading_day(date(2027, 1, 4))
+            self.assertEqual(out.getvalue(), '')
+            self.assertTrue(calendar.is_trading_day(date(2030, 1, 1)))
+        self.assertIn('TW 假日檔沒有 2030 年的資料', out.getvalue())
+
+
+def legacy_alert_message(stock):
+    """改為規則引擎前 check_financial_alerts 的逐筆判斷（對照用）"""
+    alerts = []
+    if stock.debt_to_equity and stock.debt_to_equity > 200:
+        alerts.append(f"⚠️ 高財務槓桿：負債權益比達 {stock.debt_to_equity:.1f}%，顯示公司債務壓力較大")
+    if stock.quick_ratio and stock.quick_ratio < 0.5:
+        alerts.append(f"⚠️ 流動性風險：速動比率僅 {stock.quick_ratio:.2f}，短期償債能力可能不足")
+    if stock.roe and stock.roe < 0:
+        alerts.append(f"⚠️ 獲利警訊：ROE 為 {stock.roe * 100:.2f}%，公司股東權益報酬呈現虧損")
+    if stock.free_cash_flow and stock.free_cash_flow < 0:
+        alerts.append(f"⚠️ 現金流警訊：自由現金流為負 ({stock.free_cash_flow / 1_000_000_000:.2f}B)，可能影響股利發放或再投資能力")
+    if stock.pe_ratio and stock.pe_ratio > 50:
+        alerts.append(f"⚠️ 估值偏高：本益比達 {stock.pe_ratio:.1f}，回本年限較長，需確認成長性是否支撐")
+    if stock.operating_margin and stock.operating_margin < 0:
+        alerts.append(f"⚠️ 本業虧損：營業利益率為 {stock.operating_margin * 100:.2f}%，本業經營處於虧損狀態")
+    if stock.beta and stock.beta > 2:
+        alerts.append(f"⚠️ 高波動風險：Beta 值達 {stock.beta:.2f}，股價波動遠大於大盤")
+    return "\n".join(alerts)
+
+
+class FinancialAlertTests(TestCase):
+    def setUp(self):
+        D = Decimal
+        self.stocks = [
+            # 全部觸發；201.35、50.25 等落在四捨五入邊界
+            Stock.objects.create(ticker='RISKY', debt_to_equity=D('201.35'), quick_ratio=D('0.45'),
+                                 roe=D('-0.1235'), free_cash_flow=-1_235_000_000, pe_ratio=D('50.25'),
+                                 operating_margin=D('-0.0005'), beta=D('2.50')),
+            # 剛好等於門檻不觸發
+            Stock.objects.create(ticker='EDGE', debt_to_equity=D('200.00'), quick_ratio=D('0.50'),
+                                 pe_ratio=D('50.00'), beta=D('2.00')),
+            # 0 與空值視為無資料
+            Stock.objects.create(ticker='EMPTY', roe=D('0'), free_cash_flow=0, operating_margin=None),
+            Stock.objects.create(ticker='MIXED', roe=D('0.2500'), free_cash_flow=-987_654_321, beta=D('3.14')),
+        ]
+
+    def test_matches_legacy_per_stock_logic(self):
+        self.assertEqual(alerts.refresh_alerts(), 2)
+        for stock in Stock.objects.filter(pk__in=[s.pk for s in self.stocks]):
+            self.assertEqual(stock.alert_message, legacy_alert_message(stock), stock.ticker)
+        self.assertEqual(len(Stock.objects.get(ticker='RISKY').alert_message.splitlines()), 7)
+
+    def test_only_changed_rows_are_written(self):
+        alerts.refresh_alerts()
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(alerts.refresh_alerts(), 0)
+        self.assertEqual([q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE')], [])
+
+        Stock.objects.filter(ticker='EDGE').update(beta=Decimal('2.01'))
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(alerts.refresh_alerts(), 1)
+        updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('Beta 值達 2.01', Stock.objects.get(ticker='EDGE').alert_message)
+
+    def test_rebuild_alerts_command(self):
+        from io import StringIO
+        from django.core.management import call_command
+
+        out = StringIO()
+        call_command('rebuild_alerts', 'MIXED', 'EDGE', stdout=out)
+        self.assertIn('Updated alerts for 1 stocks.', out.getvalue())
+        self.assertEqual(Stock.objects.get(ticker='RISKY').alert_message, '')
+        self.assertEqual(Stock.objects.get(ticker='MIXED').alert_message,
+                         legacy_alert_message(Stock.objects.get(ticker='MIXED')))
+
+
+class ChangeTrackingTests(TestCase):
+    def setUp(self):
+        self.stock = Stock.objects.create(ticker='TRACK', name='Tracker', pe_ratio=Decimal('12.34'))
+        self.stock = Stock.objects.get(pk=self.stock.pk)
+
+    def updates(self, ctx):
+        return [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+
+    def test_noop_save_skips_update(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.stock.save()
+        self.assertEqual(ctx.captured_queries, [])
+
+    def test_only_dirty_fields_are_written(self):
+        self.stock.pe_ratio = Decimal('15.00')
+        self.assertEqual(self.stock.changed_fields(), ['pe_ratio'])
+        with CaptureQueriesContext(connection) as ctx:
+            self.stock.save()
+        [sql] = self.updates(ctx)
+        self.assertIn('"pe_ratio"', sql)
+        self.assertNotIn('"name"', sql)
+        self.assertEqual(Stock.objects.get(pk=self.stock.pk).pe_ratio, Decimal('15.00'))
+
+    def test_update_fields_limited_to_changed(self):
+        self.stock.pe_ratio = Decimal('15.00')
+        self.stock.name = 'Renamed'
+        with CaptureQueriesContext(connection) as ctx:
+            self.stock.save(update_fields=['name', 'beta'])
+        [sql] = self.updates(ctx)
+        self.assertIn('"name"', sql)
+        self.assertNotIn('"pe_ratio"', sql)
+        self.assertNotIn('"beta"', sql)
+        self.assertEqual(Stock.objects.get(pk=self.stock.pk).pe_ratio, Decimal('12.34'))
+
+    def test_explicit_update_fields_saves_and_sends_signals_without_changes(self):
+        from django.db.models.signals import post_save, pre_save
+
+        received = []
+
+        def receiver(sender, update_fields, **kwargs):
+            received.append(set(update_fields))
+
+        pre_save.connect(receiver, sender=Stock)
+        post_save.connect(receiver, sender=Stock)
+        self.addCleanup(pre_save.disconnect, receiver, sender=Stock)
+        self.addCleanup(post_save.disconnect, receiver, sender=Stock)
+
+        self.stock.save()
+        self.assertEqual(received, [])
+        with CaptureQueriesContext(connection) as ctx:
+            self.stock.save(update_fields=['name'])
+        [sql] = self.updates(ctx)
+        self.assertIn('"name"', sql)
+        self.assertEqual(received, [{'name'}, {'name'}])
+
+    def test_decimal_compared_at_field_precision(self):
+        # 12.341 與 float 12.34 存入 decimal_places=2 後都是 12.34，不算變動
+        self.stock.pe_ratio = Decimal('12.341')
+        self.assertEqual(self.stock.changed_fields(), [])
+        self.stock.pe_ratio = 12.34
+        with CaptureQueriesContext(connection) as ctx:
+            self.stock.save()
+        self.assertEqual(ctx.captured_queries, [])
+        self.stock.pe_ratio = 12.345
+        self.assertEqual(self.stock.changed_fields(), ['pe_ratio'])
+
+    def test_snapshot_updated_after_save_and_refresh(self):
+        self.stock.name = 'Renamed'
+        self.stock.save()
+        self.assertEqual(self.stock.changed_fields(), [])
+
+        Stock.objects.filter(pk=self.stock.pk).update(beta=Decimal('1.20'))
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.beta, Decimal('1.20'))
+        with CaptureQueriesContext(connection) as ctx:
+            self.stock.save()
+        self.assertEqual(ctx.captured_queries, [])
+
+        self.stock.refresh_from_db(fields=['beta'])
+        self.stock.beta = Decimal('1.30')
+        self.assertEqual(self.stock.changed_fields(), ['beta'])
+
+    def test_first_save_inserts_all_fields(self):
+        stock = Stock(ticker='NEW', name='New Co', beta=Decimal('0.90'))
+        with CaptureQueriesContext(connection) as ctx:
+            stock.save()
+        self.assertTrue(any(q['sql'].startswith('INSERT') for q in ctx.captured_queries))
+        self.assertEqual(stock.changed_fields(), [])
+        self.assertEqual(Stock.objects.get(ticker='NEW').name, 'New Co')
+
+    def test_deferred_field_assigned_later_is_written(self):
+        stock = Stock.objects.only('ticker').get(pk=self.stock.pk)
+        stock.name = 'Late'
+        self.assertIn('name', stock.changed_fields())
+        stock.save()
+        self.assertEqual(Stock.objects.get(pk=self.stock.pk).name, 'Late')
+
+
+class DescriptionTests(TestCase):
+    def test_split_description(self):
+        split = descriptions.split_description
+        self.assertEqual(split(''), ('', '', ''))
+        self.assertEqual(split(None), ('', '', ''))
+        self.assertEqual(split('Makes chips.\n\nMakes chips.\n  \nSells them.'),
+                         ('Makes chips.\n\nSells them.', 'en', ''))
+        # 舊資料：原文後附加譯文
+        self.assertEqual(split('Makes chips.\n製造晶片。\n製造晶片。'), ('Makes chips.', 'en', '製造晶片。'))
+        self.assertEqual(split('台積電製造晶片。\n  \n為全球客戶代工。'),
+                         ('台積電製造晶片。\n\n為全球客戶代工。', 'zh', '台積電製造晶片。\n\n為全球客戶代工。'))
+
+    def test_normalize_translates_once(self):
+        stock = Stock(ticker='DESC', description='')
+        with mock.patch.object(descriptions, 'translate', return_value='製造晶片。') as translate:
+            self.assertTrue(descriptions.normalize_description(stock, raw='Makes chips.'))
+            self.assertEqual((stock.description, stock.description_lang, stock.description_zh),
+                             ('Makes chips.', 'en', '製造晶片。'))
+            # 原文未變時沿用既有譯文
+            self.assertFalse(descriptions.normalize_description(stock, raw='Makes chips.'))
+        translate.assert_called_once_with('Makes chips.')
+
+    def test_failed_translation_stays_pending(self):
+        stock = Stock(ticker='DESC', description='')
+        with mock.patch.object(descriptions, 'translate', return_value='') as translate:
+            self.assertTrue(descriptions.normalize_description(stock, raw='Makes chips.'))
+        self.assertEqual((stock.description, stock.description_lang, stock.description_zh),
+                         ('Makes chips.', '', ''))
+        with mock.patch.object(descriptions, 'translate', return_value='製造晶片。') as translate:
+            self.assertTrue(descriptions.normalize_description(stock))
+        translate.assert_called_once_with('Makes chips.')
+        self.assertEqual((stock.description_lang, stock.description_zh), ('en', '製造晶片。'))
+
+    def test_no_translate_leaves_pending(self):
+        stock = Stock(ticker='DESC', description='Makes chips.\nMakes chips.')
+        with mock.patch.object(descriptions, 'translate') as translate:
+            descriptions.normalize_description(stock, translate_missing=False)
+        translate.assert_not_called()
+        self.assertEqual((stock.description, stock.description_lang, stock.description_zh),
+                         ('Makes chips.', '', ''))
+
+    def test_backfill_retries_missing_translation(self):
+        from io import StringIO
+        from django.core.management import call_command
+
+        Stock.objects.create(ticker='DONE', description='Done.', description_lang='en', description_zh='完成。')
+        # 修正前翻譯失敗的資料：已標記語言但沒有譯文
+        Stock.objects.create(ticker='FAILED', description='Failed.', description_lang='en', description_zh='')
+        Stock.objects.create(ticker='PENDING', description='Pending.')
+        out = StringIO()
+        with mock.patch.object(descriptions, 'translate', return_value='譯文') as translate:
+            call_command('normalize_descriptions', stdout=out)
+        self.assertEqual(sorted(call.args[0] for call in translate.call_args_list), ['Failed.', 'Pending.'])
+        self.assertIn('Normalized 2 stock descriptions.', out.getvalue())
+        self.assertEqual(Stock.objects.get(ticker='FAILED').description_zh, '譯文')
+        self.assertEqual(Stock.objects.get(ticker='PENDING').description_lang, 'en')
+
+
+class ChartApiTests(TestCase):
+    def setUp(self):
+        self.stock = Stock.objects.create(ticker='AAPL', market='US')
+        # 約 4.7 年的日 K：5y 區間內超過預設的 800 點
+        self.bars = make_bars(1200, start=timezone.localdate() - timedelta(days=1700))
+        RelationalBackend().write_prices(self.stock, self.bars)
+        self.client.force_login(get_user_model().objects.create_user('viewer', password='pw'))
+
+    def get_chart(self, **params):
+        return self.client.get(reverse('chart_data_api', args=[self.stock.ticker]), params)
+
+    def test_candles_over_cap_fall_back_to_weekly(self):
+        body = self.get_chart(range='5y').json()
+        self.assertEqual(body['resolution'], 'W')
+        self.assertEqual(body['total_points'], 1200)
+        self.assertLessEqual(body['points'], 800)
+        self.assertEqual(len(body['data'][0]), 6)
+
+        body = self.get_chart(range='5y', max_points=2000).json()
+        self.assertEqual(body['resolution'], 'D')
+        self.assertEqual(body['points'], 1200)
+        self.assertEqual(body['data'][-1][2], float(self.bars['close'][-1]))
+
+    def test_line_and_range(self):
+        body = self.get_chart(range='5y', type='line', max_points=100).json()
+        self.assertEqual(body['points'], 100)
+        self.assertEqual(body['data'][-1], [str(self.bars['date'][-1]), float(self.bars['close'][-1])])
+
+        body = self.get_chart(range='1m').json()
+        self.assertEqual(body['resolution'], 'D')
+        self.assertLessEqual(body['points'], 23)
+
+    def test_invalid_parameters(self):
+        for params in ({'range': '10y'}, {'resolution': 'H'}, {'type': 'bar'},
+                       {'max_points': 'many'}, {'indicators': 'sma7'}):
+            self.assertEqual(self.get_chart(**params).status_code, 400, params)
+
+    def test_detail_api_keeps_daily_bars(self):
+        with mock.patch('stocks.views.yf'), \
+                mock.patch('stocks.data_sources.get_us_key_metrics_yfinance', return_value=None), \
+                mock.patch('stocks.data_sources.get_us_financials_sec_edgar', return_value=None), \
+                mock.patch('stocks.data_sources.get_us_metrics_alpha_vantage', return_value=None):
+            body = self.client.get(reverse('stock_detail_api', args=[self.stock.ticker])).json()
+        self.assertEqual(len(body['historical_data']), 1200)
+        self.assertEqual(body['historical_data'][-1][0], str(self.bars['date'][-1]))
+        self.assertEqual(body['current_price'], float(self.bars['close'][-1]))
+        self.assertEqual(body['prev_close'], float(self.bars['close'][-2]))
+
+
+class ChartIndicatorTests(TestCase):
+    def setUp(self):
+        self.stock = Stock.objects.create(ticker='AAPL', market='US')
+        self.bars = make_bars(300, start=timezone.localdate() - timedelta(days=500))
+        RelationalBackend().write_prices(self.stock, self.bars)
+
+    def test_no_stored_indicators_returns_none(self):
+        chart = get_chart_data(self.stock, range_key='2y', indicators=['sma5', 'rsi14'])
+        self.assertEqual(chart['resolution'], 'D')
+        self.assertIsNone(chart['indicators'])
+
+        indicators.update_indicators(self.stock)
+        chart = get_chart_data(self.stock, range_key='2y', indicators=['sma5', 'rsi14'])
+        expected, _ = indicators.compute_indicators(self.bars)
+        self.assertEqual(len(chart['indicators']['sma5']), 300)
+        self.assertAlmostEqual(chart['indicators']['sma5'][-1], expected['sma5'][-1], places=6)
+        self.assertIsNone(chart['indicators']['rsi14'][0])
+
+    def test_aggregated_candles_use_indicators_of_the_shown_resolution(self):
+        indicators.update_indicators(self.stock)
+        chart = get_chart_data(self.stock, range_key='2y', max_points=100, indicators=['sma5', 'sma20'])
+        self.assertEqual(chart['resolution'], 'W')
+        weekly, _ = indicators.compute_indicators(resample_ohlc(self.bars, 'W'))
+        self.assertEqual(len(chart['indicators']['sma5']), chart['points'])
+        np.testing.assert_allclose(
+            np.array(chart['indicators']['sma20'], dtype=np.float64), weekly['sma20'], atol=1e-6)
+        # 與週末當日的日線 MA20 不同
+        daily, _ = indicators.compute_indicators(self.bars)
+        self.assertNotAlmostEqual(chart['indicators']['sma20'][-1], daily['sma20'][-1], places=2)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, QUOTE_CACHE_TTL=60)
+class QuoteCacheTests(TestCase):
+    def setUp(self):
+        from . import quotes
+        self.quotes = quotes
+        quotes._cache().clear()
+        self.stock = Stock.objects.create(ticker='AAPL', market='US', last_price=Decimal('90.00'),
+                                          change=Decimal('-1.00'), change_percent=Decimal('-1.10'))
+        self.other = Stock.objects.create(ticker='MSFT', market='US')
+
+    def test_hit_skips_upstream(self):
+        self.quotes._store(self.stock, 101.0, 100.0)
+        with mock.patch.object(self.quotes, 'fetch_quote') as fetch:
+            quote = self.quotes.get_quote(self.stock)
+        fetch.assert_not_called()
+        self.assertEqual((quote['price'], quote['change_percent'], quote['stale']), (101.0, 1.0, False))
+
+    def test_miss_refreshes_and_persists(self):
+        with mock.patch.object(self.quotes, 'fetch_quote', return_value=(110.0, 100.0)) as fetch:
+            quote = self.quotes.get_quote(self.stock)
+            self.quotes.get_quote(self.stock)
+        fetch.assert_called_once_with('AAPL')
+        self.assertEqual((quote['price'], quote['change'], quote['stale']), (110.0, 10.0, False))
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.last_price, Decimal('110.00'))
+        self.assertIsNone(self.quotes._cache().get(self.quotes._lock_key('AAPL')))
+
+    def test_expired_quote_served_stale_while_lock_is_held(self):
+        self.quotes._store(self.stock, 101.0, 100.0)
+        key = self.quotes._quote_key('AAPL')
+        cache = self.quotes._cache()
+        cache.set(key, {**cache.get(key), 'fetched_at': time.time() - 600})
+        cache.add(self.quotes._lock_key('AAPL'), 1)
+        with mock.patch.object(self.quotes, 'fetch_quote') as fetch:
+            quote = self.quotes.get_quote(self.stock)
+        fetch.assert_not_called()
+        self.assertEqual((quote['price'], quote['stale']), (101.0, True))
+
+        # 沒有任何快取時沿用資料庫中的報價（_store 已寫回最後一次的報價）
+        cache.delete(key)
+        with mock.patch.object(self.quotes, 'fetch_quote') as fetch:
+            quote = self.quotes.get_quote(self.stock)
+        fetch.assert_not_called()
+        self.assertEqual((quote['price'], quote['stale']), (Decimal('101.00'), True))
+
+    def test_upstream_error_releases_lock(self):
+        with mock.patch.object(self.quotes, 'fetch_quote', side_effect=RuntimeError('down')):
+            quote = self.quotes.get_quote(self.stock)
+        self.assertTrue(quote['stale'])
+        self.assertIsNone(self.quotes._cache().get(self.quotes._lock_key('AAPL')))
+
+    def test_batch_skips_tickers_locked_by_another_poller(self):
+        self.quotes._cache().add(self.quotes._lock_key('AAPL'), 1)
+        fetch = mock.Mock(return_value={'MSFT': (202.0, 200.0)})
+        with mock.patch.object(self.quotes, 'fetch_quotes', fetch):
+            result = self.quotes.get_quotes([self.stock, self.other])
+        fetch.assert_called_once_with(['MSFT'])
+        self.assertEqual((result['MSFT']['price'], result['MSFT']['stale']), (202.0, False))
+        self.assertEqual((result['AAPL']['price'], result['AAPL']['stale']), (Decimal('90.00'), True))
+        # 另一個輪詢者的鎖不被釋放
+        self.assertIsNotNone(self.quotes._cache().get(self.quotes._lock_key('AAPL')))
+
+    def test_latest_price_view_uses_cache(self):
+        self.client.force_login(get_user_model().objects.create_user('viewer', password='pw'))
+        self.quotes._store(self.stock, 101.0, 100.0)
+        with mock.patch.object(self.quotes, 'fetch_quote') as fetch:
+            body = self.client.get(reverse('get_latest_price', args=['AAPL'])).json()
+        fetch.assert_not_called()
+        self.assertEqual((body['price'], body['change'], body['stale']), (101.0, 1.0, False))
+
+        with mock.patch.object(self.quotes, 'fetch_quote', return_value=(50.0, 40.0)):
+            body = self.client.get(reverse('get_latest_price', args=['MSFT'])).json()
+        self.assertEqual((body['price'], body['change_percent'], body['stale']), (50.0, 25.0, False))
+
+
+class StockSummaryTests(TestCase):
+    def setUp(self):
+        self.stock = Stock.objects.create(ticker='AAPL', market='US')
+        self.bars = make_bars(300, start=date(2024, 1, 1))
+
+    def test_created_and_refreshed_after_price_write(self):
+        from .models import StockSummary
+        from .utils import build_sparkline_path, update_stock_summary
+
+        self.assertIsNone(update_stock_summary(self.stock))
+        RelationalBackend().write_prices(self.stock, {key: arr[:299] for key, arr in self.bars.items()})
+        summary = update_stock_summary(self.stock)
+        self.assertEqual(summary.last_date, self.bars['date'][298].item())
+        self.assertEqual(summary.recent_closes, self.bars['close'][279:299].tolist())
+        self.assertEqual(summary.sparkline_svg, build_sparkline_path(summary.recent_closes))
+        # 最新 K 棒未變動時略過
+        self.assertIsNone(update_stock_summary(self.stock))
+
+        RelationalBackend().write_prices(self.stock, self.bars)
+        summary = update_stock_summary(self.stock)
+        self.assertEqual(StockSummary.objects.count(), 1)
+        self.assertEqual(summary.last_date, self.bars['date'][-1].item())
+        self.assertEqual(float(summary.last_close), self.bars['close'][-1])
+        self.assertEqual(summary.recent_closes, self.bars['close'][-20:].tolist())
+        year = self.bars['date'] >= self.bars['date'][-1] - np.timedelta64(364, 'D')
+        self.assertEqual(float(summary.high_52w), round(self.bars['high'][year].max(), 2))
+        self.assertEqual(float(summary.low_52w), round(self.bars['low'][year].min(), 2))
+        self.assertEqual(summary.last_volume, self.bars['volume'][-1])
+        self.assertEqual(summary.avg_volume_20, int(self.bars['volume'][-20:].mean()))
+        self.assertIsNotNone(update_stock_summary(self.stock, force=True))
+
+    def test_dashboard_renders_from_summary(self):
+        from .utils import update_stock_summary
+
+        RelationalBackend().write_prices(self.stock, self.bars)
+        summary = update_stock_summary(self.stock)
+        # 漲跌為 0 時不畫 Sparkline
+        Stock.objects.filter(pk=self.stock.pk).update(change=Decimal('1.00'))
+        user = get_user_model().objects.create_user('viewer', password='pw')
+        Watchlist.objects.create(user=user, stock=self.stock)
+        self.client.force_login(user)
+        with mock.patch('stocks.views.get_recent_closes', return_value={}) as recent:
+            response = self.client.get(reverse('dashboard'))
+        # 有摘要的股票不再查詢收盤價
+        self.assertEqual(list(recent.call_args.args[0]), [])
+        self.assertContains(response, f'd="{summary.sparkline_svg}"')
+        self.assertEqual(json.loads(response.context['loading_stocks_json']), [])
+
+
+class RecentClosesTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('viewer', password='pw')
+        self.client.force_login(self.user)
+        self.bars = make_bars(40)
+
+    def add_stocks(self, tickers):
+        for i, ticker in enumerate(tickers):
+            stock = Stock.objects.create(ticker=ticker, market='US', change=Decimal('1.00'))
+            RelationalBackend().write_prices(stock, {**self.bars, 'close': self.bars['close'] + i})
+            Watchlist.objects.create(user=self.user, stock=stock)
+
+    def test_returns_last_closes_per_stock(self):
+        self.add_stocks(['AAA', 'BBB'])
+        short = Stock.objects.create(ticker='NEW', market='US')
+        RelationalBackend().write_prices(short, {key: arr[:3] for key, arr in self.bars.items()})
+        ids = {s.ticker: s.pk for s in Stock.objects.all()}
+
+        closes = get_recent_closes(ids.values(), window=20)
+        self.assertEqual(closes[ids['AAA']], self.bars['close'][-20:].tolist())
+        self.assertEqual(closes[ids['BBB']], (self.bars['close'][-20:] + 1).tolist())
+        self.assertEqual(closes[ids['NEW']], self.bars['close'][:3].tolist())
+        self.assertEqual(get_recent_closes([]), {})
+
+    def test_dashboard_query_count_is_constant(self):
+        def dashboard_queries():
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(reverse('dashboard'))
+            self.assertEqual(response.status_code, 200)
+            return len(ctx.captured_queries)
+
+        self.add_stocks(['AAA', 'BBB'])
+        two = dashboard_queries()
+        self.add_stocks(['CCC', 'DDD', 'EEE', 'FFF'])
+        with self.assertNumQueries(two):
+            response = self.client.get(reverse('dashboard'))
+        self.assertEqual(dashboard_queries(), two)
+
+        from .utils import build_sparkline_path
+        sparklines = {item.stock.ticker: item.sparkline_svg for item in response.context['watchlist']}
+        self.assertEqual(len(sparklines), 6)
+        self.assertEqual(sparklines['CCC'], build_sparkline_path((self.bars['close'][-20:]).tolist()))
+
+
+class ColumnarStoreTests(TestCase):
+    def setUp(self):
+        from . import columnar
+        self.columnar = columnar
+        self.root = tempfile.mkdtemp()
+        overrides = override_settings(COLUMNAR_STORE_ENABLED=True, COLUMNAR_STORE_DIR=self.root)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.stock = Stock.objects.create(ticker='2330.TW', market='TW')
+        self.bars = make_bars(120)
+        timeseries.write_prices(self.stock, self.bars)
+
+    def assert_arrays_equal(self, actual, expected):
+        for name in self.columnar.COLUMNS:
+            np.testing.assert_array_equal(actual[name], expected[name], err_msg=name)
+
+    def test_round_trip_matches_orm(self):
+        self.assertEqual(self.columnar.sync_ticker(self.stock), 120)
+        orm = charting.load_price_arrays(self.stock, use_columnar=False)
+        stored = self.columnar.read_ticker('2330.TW')
+        self.assertIsInstance(stored['close'], np.memmap)
+        self.assert_arrays_equal(stored, orm)
+        self.assert_arrays_equal(charting.load_price_arrays(self.stock), orm)
+
+        start, end = self.bars['date'][10].item(), self.bars['date'][30].item()
+        window = self.columnar.read_range('2330.TW', start=start, end=end)
+        expected = {k: v[10:31] for k, v in orm.items()}
+        self.assert_arrays_equal(window, expected)
+        self.assert_arrays_equal(charting.load_price_arrays(self.stock, start=start), {k: v[10:] for k, v in orm.items()})
+
+    def test_missing_files_fall_back_to_orm(self):
+        self.assertIsNone(self.columnar.read_range('2330.TW'))
+        self.assertEqual(len(charting.load_price_arrays(self.stock)['close']), 120)
+
+    def test_price_write_invalidates_files(self):
+        self.columnar.sync_ticker(self.stock)
+        more = make_bars(121)
+        timeseries.write_prices(self.stock, {k: v[-1:] for k, v in more.items()})
+        # 重新同步前不讀取過期的欄位檔
+        self.assertIsNone(self.columnar.read_ticker('2330.TW'))
+        arrays = charting.load_price_arrays(self.stock)
+        self.assertEqual(len(arrays['close']), 121)
+        self.columnar.sync_ticker(self.stock)
+        self.assert_arrays_equal(self.columnar.read_ticker('2330.TW'), arrays)
+
+    def test_readers_fall_back_during_directory_swap(self):
+        self.columnar.sync_ticker(self.stock)
+        timeseries.write_prices(self.stock, {k: v[-1:] for k, v in make_bars(121).items()})
+        self.columnar.sync_ticker(self.stock)
+        rename = os.rename
+        seen = []
+
+        def swapping_rename(src, dst):
+            rename(src, dst)
+            if dst.endswith('.old'):
+                # 舊目錄已移走、新目錄尚未就位
+                seen.append(self.columnar.read_ticker('2330.TW'))
+                seen.append(len(charting.load_price_arrays(self.stock)['close']))
+
+        arrays = charting.load_price_arrays(self.stock, use_columnar=False)
+        with mock.patch.object(self.columnar.os, 'rename', swapping_rename):
+            self.columnar.write_ticker('2330.TW', arrays, self.root)
+        self.assertEqual(seen, [None, 121])
+        self.assert_arrays_equal(self.columnar.read_ticker('2330.TW'), arrays)
+        self.assertEqual(os.listdir(self.root), ['2330.TW'])
+
+
+class PartitioningTests(TestCase):
+    def test_requires_postgres(self):
+        from django.core.management import CommandError, call_command
+        from . import partitioning
+
+        if connection.vendor == 'postgresql':
+            self.skipTest('PostgreSQL is available')
+        self.assertIsNone(partitioning.current_scheme())
+        with self.assertRaises(ValueError):
+            partitioning.partition_prices('year')
+        with self.assertRaises(CommandError):
+            call_command('partition_prices', '--status')
+
+
+@skipUnless(connection.vendor == 'postgresql', 'StockPrice partitioning requires PostgreSQL')
+class PostgresPartitioningTests(TestCase):
+    def setUp(self):
+        self.stock = Stock.objects.create(ticker='AAPL', market='US')
+        timeseries.write_prices(self.stock, make_bars(300, start=date(2023, 6, 1)))
+        self.ids = list(StockPrice.objects.order_by('id').values_list('id', flat=True))
+
+    def column_identity(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT attidentity FROM pg_attribute "
+                           "WHERE attrelid = 'stocks_stockprice'::regclass AND attname = 'id'")
+            return cursor.fetchone()[0]
+
+    def assert_table_intact(self):
+        from . import partitioning
+
+        self.assertEqual(list(StockPrice.objects.order_by('id').values_list('id', flat=True)), self.ids)
+        self.assertEqual(self.column_identity(), 'd')
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_get_serial_sequence('stocks_stockprice', 'id')")
+            self.assertEqual(cursor.fetchone()[0], f'public.{partitioning.SEQUENCE}')
+        # 新列接續既有編號，(stock, date) 的 upsert 仍然有效
+        new = StockPrice.objects.create(stock=self.stock, date=date(2026, 1, 5), open=1, high=1, low=1, close=1, volume=1)
+        self.assertGreater(new.id, max(self.ids))
+        timeseries.write_prices(self.stock, make_bars(1, start=date(2026, 1, 5)))
+        self.assertEqual(StockPrice.objects.filter(stock=self.stock, date=date(2026, 1, 5)).count(), 1)
+
+    def test_year_partitioning_round_trip(self):
+        from . import partitioning
+
+        self.assertEqual(self.column_identity(), 'd')
+        self.assertTrue(partitioning.partition_prices('year', connection=connection))
+        self.assertEqual(partitioning.current_scheme(), 'year')
+        names = [row[0] for row in partitioning.partition_stats()]
+        self.assertIn('stocks_stockprice_y2023', names)
+        self.assertIn(partitioning.DEFAULT_PARTITION, names)
+        self.assertFalse(partitioning.partition_prices('year', connection=connection))
+        self.assert_table_intact()
+
+        self.assertTrue(partitioning.unpartition_prices(connection=connection))
+        self.assertIsNone(partitioning.current_scheme())
+        self.ids.append(StockPrice.objects.get(date=date(2026, 1, 5)).id)
+        self.assertEqual(StockPrice.objects.count(), len(self.ids))
+        self.assertEqual(self.column_identity(), 'd')
+
+    def test_hash_partitioning(self):
+        from . import partitioning
+
+        partitioning.partition_prices('hash', hash_partitions=4, connection=connection)
+        self.assertEqual(partitioning.current_scheme(), 'hash')
+        self.assertEqual(len(partitioning.partition_stats()), 4)
+        self.assert_table_intact()
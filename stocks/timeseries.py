@@ -0,0 +1,313 @@
+"""
+時間序列儲存後端
+價格與技術指標的寫入都經過此模組，支援兩種實作：
+- RelationalBackend：現有的 StockPrice / TechnicalIndicator 資料表（永遠寫入，為系統主資料）
+- InfluxDBBackend：以 line protocol 批次寫入 InfluxDB，並以 aggregateWindow 做區間聚合查詢
+
+TIMESERIES_BACKEND = 'influxdb' 時，寫入會同步鏡像到 InfluxDB，週/月 K 等聚合查詢也改由 InfluxDB 處理，
+減輕 OLTP 資料庫的負擔
+"""
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+PRICE_MEASUREMENT = 'stock_price'
+INDICATOR_MEASUREMENT = 'technical_indicator'
+PRICE_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+# 聚合視窗內各欄位的彙總方式
+PRICE_AGGREGATES = (('open', 'first'), ('high', 'max'), ('low', 'min'), ('close', 'last'), ('volume', 'sum'))
+# resolution -> (every, offset)；Flux 的週視窗以 1970-01-01（週四）為界，偏移 4 天改由週一開始
+WINDOWS = {'W': ('1w', '4d'), 'M': ('1mo', '0s')}
+
+
+class RelationalBackend:
+    """現有關聯式資料表（StockPrice / TechnicalIndicator）"""
+    name = 'relational'
+
+    def write_prices(self, stock, arrays):
+        """批次 upsert 日 K（取代逐筆 update_or_create）"""
+        from .models import StockPrice
+
+        rows = [
+            StockPrice(stock=stock, date=d, open=o, high=h, low=l, close=c, volume=v)
+            for d, o, h, l, c, v in zip(
+                arrays['date'].tolist(), arrays['open'].tolist(), arrays['high'].tolist(),
+                arrays['low'].tolist(), arrays['close'].tolist(), arrays['volume'].tolist(),
+            )
+        ]
+        with transaction.atomic():
+            StockPrice.objects.bulk_create(
+                rows,
+                batch_size=500,
+                update_conflicts=True,
+                unique_fields=['stock', 'date'],
+                update_fields=['open', 'high', 'low', 'close', 'volume'],
+            )
+        return len(rows)
+
+    def write_indicators(self, stock, dates, values, replace=False):
+        """寫入技術指標；replace=True 時先刪除該股票的既有指標"""
+        from .indicators import INDICATOR_FIELDS
+        from .models import TechnicalIndicator
+
+        rows = []
+        for i, date in enumerate(dates.tolist()):
+            fields = {}
+            for field in INDICATOR_FIELDS:
+                v = float(values[field][i])
+                fields[field] = None if math.isnan(v) else round(v, 6)
+            rows.append(TechnicalIndicator(stock=stock, date=date, **fields))
+
+        with transaction.atomic():
+            if replace:
+                TechnicalIndicator.objects.filter(stock=stock).delete()
+                TechnicalIndicator.objects.bulk_create(rows, batch_size=500)
+            else:
+                TechnicalIndicator.objects.bulk_create(
+                    rows,
+                    batch_size=500,
+                    update_conflicts=True,
+                    unique_fields=['stock', 'date'],
+                    update_fields=INDICATOR_FIELDS,
+                )
+        return len(rows)
+
+    def read_prices(self, stock, start=None, end=None):
+        from .charting import load_price_arrays
+
+        arrays = load_price_arrays(stock, start=start)
+        if end is not None:
+            hi = int(np.searchsorted(arrays['date'], np.datetime64(end, 'D'), side='right'))
+            arrays = {k: v[:hi] for k, v in arrays.items()}
+        return arrays
+
+    def aggregate_prices(self, stock, resolution, start=None, end=None):
+        from .charting import resample_ohlc
+
+        return resample_ohlc(self.read_prices(stock, start, end), resolution)
+
+
+# ============================================================
+# InfluxDB
+# ============================================================
+
+def _escape_tag(value):
+    return str(value).replace('\\', '\\\\').replace(',', '\\,').replace('=', '\\=').replace(' ', '\\ ')
+
+
+def _escape_string(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+def _date_to_epoch(date):
+    return int(datetime(date.year, date.month, date.day, tzinfo=dt_timezone.utc).timestamp())
+
+
+def to_line_protocol(measurement, tags, fields, timestamp):
+    """
+    組成單行 line protocol（秒精度）；NaN/None 欄位略過，全部為空時回傳 None
+
+    Example:
+        stock_price,ticker=AAPL,market=US open=1.5,volume=100i 1700000000
+    """
+    field_parts = []
+    for key, value in fields.items():
+        if value is None:
+            continue
+        if isinstance(value, (bool, np.bool_)):
+            field_parts.append(f"{key}={'true' if value else 'false'}")
+        elif isinstance(value, (int, np.integer)):
+            field_parts.append(f"{key}={int(value)}i")
+        elif isinstance(value, (float, np.floating)):
+            if math.isnan(value) or math.isinf(value):
+                continue
+            field_parts.append(f"{key}={float(value)!r}")
+        else:
+            field_parts.append(f'{key}="{_escape_string(value)}"')
+    if not field_parts:
+        return None
+    tag_part = ''.join(f",{_escape_tag(k)}={_escape_tag(v)}" for k, v in sorted(tags.items()) if v not in (None, ''))
+    return f"{_escape_tag(measurement)}{tag_part} {','.join(field_parts)} {timestamp}"
+
+
+class InfluxDBClientTransport:
+    """influxdb-client 的薄封裝；測試時可替換為任何具有 write_lines/query 的物件"""
+
+    def __init__(self, url, token, org, bucket, timeout=10_000):
+        from influxdb_client import InfluxDBClient
+        from influxdb_client.client.write_api import SYNCHRONOUS
+
+        self.bucket = bucket
+        self.org = org
+        self._client = InfluxDBClient(url=url, token=token, org=org, timeout=timeout)
+        self._write_api = self._client.write_api(write_options=SYNCHRONOUS)
+        self._query_api = self._client.query_api()
+
+    def write_lines(self, lines):
+        from influxdb_client import WritePrecision
+
+        self._write_api.write(bucket=self.bucket, org=self.org, record=lines, write_precision=WritePrecision.S)
+
+    def query(self, flux):
+        tables = self._query_api.query(flux, org=self.org)
+        return [record.values for table in tables for record in table.records]
+
+
+class InfluxDBBackend:
+    """以 line protocol 批次寫入、以 Flux 視窗聚合查詢的 InfluxDB 後端"""
+    name = 'influxdb'
+
+    def __init__(self, transport=None, bucket=None, batch_size=None):
+        self.bucket = bucket or getattr(settings, 'INFLUXDB_BUCKET', 'stocks')
+        self.batch_size = batch_size or getattr(settings, 'INFLUXDB_BATCH_SIZE', 5000)
+        self._transport = transport
+
+    @property
+    def transport(self):
+        if self._transport is None:
+            self._transport = InfluxDBClientTransport(
+                url=settings.INFLUXDB_URL,
+                token=settings.INFLUXDB_TOKEN,
+                org=settings.INFLUXDB_ORG,
+                bucket=self.bucket,
+            )
+        return self._transport
+
+    def _write(self, lines):
+        lines = [line for line in lines if line]
+        for i in range(0, len(lines), self.batch_size):
+            self.transport.write_lines(lines[i:i + self.batch_size])
+        return len(lines)
+
+    def write_prices(self, stock, arrays):
+        tags = {'ticker': stock.ticker, 'market': stock.market}
+        lines = [
+            to_line_protocol(PRICE_MEASUREMENT, tags,
+                             {'open': o, 'high': h, 'low': l, 'close': c, 'volume': v},
+                             _date_to_epoch(d))
+            for d, o, h, l, c, v in zip(
+                arrays['date'].tolist(), arrays['open'].tolist(), arrays['high'].tolist(),
+                arrays['low'].tolist(), arrays['close'].tolist(), arrays['volume'].tolist(),
+            )
+        ]
+        return self._write(lines)
+
+    def write_indicators(self, stock, dates, values, replace=False):
+        # 相同時間戳的點會被覆寫，replace 不需額外刪除
+        from .indicators import INDICATOR_FIELDS
+
+        tags = {'ticker': stock.ticker, 'market': stock.market}
+        lines = [
+            to_line_protocol(INDICATOR_MEASUREMENT, tags,
+                             {field: float(values[field][i]) for field in INDICATOR_FIELDS},
+                             _date_to_epoch(date))
+            for i, date in enumerate(dates.tolist())
+        ]
+        return self._write(lines)
+
+    def _range_clause(self, start=None, end=None):
+        start_str = f"{start.isoformat()}T00:00:00Z" if start else '1970-01-01T00:00:00Z'
+        stop_str = f"{(end + timedelta(days=1)).isoformat()}T00:00:00Z" if end else 'now()'
+        return f"range(start: {start_str}, stop: {stop_str})"
+
+    def price_query(self, ticker, start=None, end=None, resolution=None):
+        """組成價格查詢的 Flux；有 resolution 時以 aggregateWindow 在 InfluxDB 端聚合"""
+        base = (
+            f'from(bucket: "{self.bucket}")\n'
+            f'  |> {self._range_clause(start, end)}\n'
+            f'  |> filter(fn: (r) => r._measurement == "{PRICE_MEASUREMENT}" and r.ticker == "{_escape_string(ticker)}")'
+        )
+        tail = '  |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")\n  |> sort(columns: ["_time"])'
+        if resolution not in WINDOWS:
+            return f"{base}\n{tail}"
+
+        every, offset = WINDOWS[resolution]
+        streams = ',\n'.join(
+            f'  data |> filter(fn: (r) => r._field == "{field}")'
+            f' |> aggregateWindow(every: {every}, offset: {offset}, fn: {fn}, timeSrc: "_start", createEmpty: false)'
+            for field, fn in PRICE_AGGREGATES
+        )
+        return f"data = {base}\nunion(tables: [\n{streams}\n])\n{tail}"
+
+    def _records_to_arrays(self, records):
+        from .charting import empty_arrays
+
+        records = [r for r in records if r.get('close') is not None]
+        if not records:
+            return empty_arrays()
+        records.sort(key=lambda r: r['_time'])
+        return {
+            'date': np.array([r['_time'].date() for r in records], dtype='datetime64[D]'),
+            'open': np.array([r.get('open') for r in records], dtype=np.float64),
+            'high': np.array([r.get('high') for r in records], dtype=np.float64),
+            'low': np.array([r.get('low') for r in records], dtype=np.float64),
+            'close': np.array([r.get('close') for r in records], dtype=np.float64),
+            'volume': np.array([r.get('volume') or 0 for r in records], dtype=np.int64),
+        }
+
+    def read_prices(self, stock, start=None, end=None):
+        return self._records_to_arrays(self.transport.query(self.price_query(stock.ticker, start, end)))
+
+    def aggregate_prices(self, stock, resolution, start=None, end=None):
+        if resolution not in WINDOWS:
+            return self.read_prices(stock, start, end)
+        flux = self.price_query(stock.ticker, start, end, resolution=resolution)
+        return self._records_to_arrays(self.transport.query(flux))
+
+
+# ============================================================
+# 後端選擇與寫入入口
+# ============================================================
+
+_relational = RelationalBackend()
+_influx = None
+
+
+def _influx_backend():
+    global _influx
+    if _influx is None:
+        _influx = InfluxDBBackend()
+    return _influx
+
+
+def get_backend():
+    """回傳處理區間/聚合查詢的後端（依 TIMESERIES_BACKEND）"""
+    if getattr(settings, 'TIMESERIES_BACKEND', 'relational') == 'influxdb':
+        return _influx_backend()
+    return _relational
+
+
+def _mirrors():
+    return [get_backend()] if get_backend() is not _relational else []
+
+
+def write_prices(stock, arrays):
+    """
+    寫入日 K：關聯式資料表為主，另鏡像至設定的時間序列後端（鏡像失敗不影響主資料）
+    欄位式價格檔在此失效（刪除），重新同步前讀取端改用 ORM，不會讀到過期的價格
+    """
+    from . import columnar
+
+    written = _relational.write_prices(stock, arrays)
+    if columnar.is_enabled():
+        columnar.delete_ticker(stock.ticker)
+    for backend in _mirrors():
+        try:
+            backend.write_prices(stock, arrays)
+        except Exception as e:
+            print(f"[TimeSeries] {backend.name} 寫入價格失敗 ({stock.ticker}): {e}")
+    return written
+
+
+def write_indicators(stock, dates, values, replace=False):
+    """寫入技術指標：關聯式資料表為主，另鏡像至設定的時間序列後端"""
+    written = _relational.write_indicators(stock, dates, values, replace=replace)
+    for backend in _mirrors():
+        try:
+            backend.write_indicators(stock, dates, values, replace=replace)
+        except Exception as e:
+            print(f"[TimeSeries] {backend.name} 寫入指標失敗 ({stock.ticker}): {e}")
+    return written
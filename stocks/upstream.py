@@ -0,0 +1,116 @@
+"""
+上游 HTTP 傳輸層
+所有外部資料來源最後都經過 requests 的 HTTPAdapter.send（FinMind、TWSE、SEC、Alpha Vantage、RSS、翻譯）
+或 curl_cffi 的 Session.request（yfinance）；install() 在這兩處加上一層薄包裝：
+
+- 觀測：每個請求結束後以 (source, host, elapsed, ok) 通知已註冊的觀察者（抓取紀錄、metrics）
+- 傳輸替換：set_transport() 可把實際送出請求的函式換成其他實作（HTTP cassette 的錄製 / 重播）
+"""
+import threading
+import time
+from urllib.parse import urlsplit
+
+# 主機（後綴比對）對應的資料來源名稱
+SOURCES = (
+    ('yahoo.com', 'yahoo'),
+    ('finmindtrade.com', 'finmind'),
+    ('twse.com.tw', 'twse'),
+    ('sec.gov', 'sec'),
+    ('alphavantage.co', 'alpha_vantage'),
+    ('news.google.com', 'google_rss'),
+    ('translate.google.com', 'google_translate'),
+    ('translate.googleapis.com', 'google_translate'),
+)
+
+_lock = threading.Lock()
+_observers = []
+# 原始實作與目前使用的傳輸函式：{'requests': HTTPAdapter.send, 'curl': curl Session.request}
+_originals = {}
+_transports = {}
+
+
+def source_for(url_or_host):
+    """URL 或主機名稱對應的資料來源（未知主機回傳主機名稱本身）"""
+    host = urlsplit(url_or_host).netloc if '://' in url_or_host else url_or_host
+    host = host.split(':')[0].lower()
+    for suffix, source in SOURCES:
+        if host == suffix or host.endswith('.' + suffix):
+            return source
+    return host or 'unknown'
+
+
+def add_observer(callback):
+    """註冊觀察者 callback(source, host, elapsed_seconds, ok)；重複註冊同一函式不會重複通知"""
+    with _lock:
+        if callback not in _observers:
+            _observers.append(callback)
+
+
+def remove_observer(callback):
+    with _lock:
+        if callback in _observers:
+            _observers.remove(callback)
+
+
+def _notify(url, elapsed, ok):
+    if not _observers:
+        return
+    host = urlsplit(url).netloc.lower()
+    source = source_for(host)
+    for callback in list(_observers):
+        try:
+            callback(source, host, elapsed, ok)
+        except Exception as e:
+            print(f"[Upstream] observer error: {e}")
+
+
+def original(name):
+    """未經替換的傳輸函式（'requests' 或 'curl'）"""
+    return _originals[name]
+
+
+def set_transport(requests=None, curl=None):
+    """替換實際送出請求的函式；省略的參數恢復為原始實作"""
+    install()
+    _transports['requests'] = requests or _originals['requests']
+    if 'curl' in _originals:
+        _transports['curl'] = curl or _originals['curl']
+
+
+def _requests_send(adapter, request, **kwargs):
+    started = time.perf_counter()
+    ok = False
+    try:
+        response = _transports['requests'](adapter, request, **kwargs)
+        ok = response.status_code < 400
+        return response
+    finally:
+        _notify(request.url, time.perf_counter() - started, ok)
+
+
+def _curl_request(session, method, url, *args, **kwargs):
+    started = time.perf_counter()
+    ok = False
+    try:
+        response = _transports['curl'](session, method, url, *args, **kwargs)
+        ok = response.status_code < 400
+        return response
+    finally:
+        _notify(url, time.perf_counter() - started, ok)
+
+
+def install():
+    """安裝傳輸層包裝（可重複呼叫）"""
+    from requests.adapters import HTTPAdapter
+
+    with _lock:
+        if 'requests' not in _originals:
+            _originals['requests'] = _transports['requests'] = HTTPAdapter.send
+            HTTPAdapter.send = _requests_send
+        try:
+            from curl_cffi.requests import Session as CurlSession
+        except ImportError:
+            return
+        if 'curl' not in _originals:
+            _originals['curl'] = _transports['curl'] = CurlSession.request
+            CurlSession.request = _curl_request
@@ -7,6 +7,11 @@ urlpatterns = [
     path('refresh/all/', views.refresh_all_stocks, name='refresh_all_stocks'),
     path('api/stock/<str:ticker>/', views.stock_detail_api, name='stock_detail_api'),
     path('stock/<str:ticker>/', views.stock_detail, name='stock_detail'),
+    path('api/chart/<str:ticker>/', views.chart_data_api, name='chart_data_api'),
     path('api/price/<str:ticker>/', views.get_latest_price, name='get_latest_price'),
+    path('api/quotes/', views.batch_quotes_api, name='batch_quotes_api'),
+    path('api/stream/quotes/', views.quote_stream, name='quote_stream'),
     path('api/check-loading-status/', views.check_loading_status, name='check_loading_status'),
+    path('admin/fetch-runs/', views.fetch_runs_report, name='fetch_runs_report'),
+    path('admin/profiles/<str:name>', views.profile_artifact, name='profile_artifact'),
 ]
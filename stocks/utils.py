@@ -48,3 +48,125 @@ def verify_ticker(ticker, market):
     except Exception as e:
         print(f"Error verifying ticker {formatted_ticker}: {e}")
         return False, formatted_ticker, None
+
+
+SPARKLINE_POINTS = 20
+FLAT_SPARKLINE = "M 0 20 L 100 20"
+
+
+def get_recent_closes(stock_ids, window=SPARKLINE_POINTS):
+    """
+    以單一視窗查詢取得多支股票最近 N 筆收盤價（避免每支股票各查一次完整歷史）
+
+    Args:
+        stock_ids (iterable): Stock 主鍵
+        window (int): 每支股票取最近幾筆
+
+    Returns:
+        dict: {stock_id: [close, ...]}，依日期由舊到新排列
+    """
+    from django.db.models import F, Window
+    from django.db.models.functions import RowNumber
+    from .models import StockPrice
+
+    stock_ids = list(stock_ids)
+    if not stock_ids:
+        return {}
+
+    rows = (
+        StockPrice.objects.filter(stock_id__in=stock_ids)
+        .annotate(row_number=Window(
+            expression=RowNumber(),
+            partition_by=[F('stock_id')],
+            order_by=F('date').desc(),
+        ))
+        .filter(row_number__lte=window)
+        .order_by('stock_id', 'date')
+        .values_list('stock_id', 'close')
+    )
+
+    closes = {}
+    for stock_id, close in rows:
+        closes.setdefault(stock_id, []).append(float(close))
+    return closes
+
+
+def build_sparkline_path(closes, width=100, height=40):
+    """
+    產生 Sparkline 的 SVG path（100x40，上下各留 5px 邊界）
+
+    Args:
+        closes (list): 依時間排序的收盤價
+
+    Returns:
+        str: SVG path 指令字串；資料不足時回傳水平線
+    """
+    if len(closes) < 2:
+        return FLAT_SPARKLINE
+
+    min_price = min(closes)
+    max_price = max(closes)
+    price_range = max_price - min_price if max_price != min_price else 1
+    step_x = width / (len(closes) - 1)
+
+    path_cmds = []
+    for i, price in enumerate(closes):
+        x = i * step_x
+        # Invert Y because SVG 0 is top
+        y = height - ((price - min_price) / price_range * height)
+        # Add spacing margin (5px)
+        y = 5 + (y * 0.8)
+
+        cmd = "M" if i == 0 else "L"
+        path_cmds.append(f"{cmd} {x:.1f} {y:.1f}")
+
+    return " ".join(path_cmds)
+
+
+def update_stock_summary(stock, force=False):
+    """
+    重新計算並儲存股票的儀表板摘要（最近收盤價、Sparkline、52 週高低、成交量）
+    最新 K 棒與既有摘要相同時直接略過，只有新 K 棒進來才會重算
+
+    Args:
+        stock (Stock): 股票
+        force (bool): 忽略最新 K 棒比對，強制重算
+
+    Returns:
+        StockSummary 或 None（無價格資料或無需更新）
+    """
+    from datetime import timedelta
+    from .models import StockPrice, StockSummary
+
+    bars = StockPrice.objects.filter(stock=stock).latest_bars(1)
+    if not bars:
+        return None
+    latest = {'date': bars[0].date, 'close': bars[0].close}
+
+    summary = StockSummary.objects.filter(stock=stock).first()
+    if (not force and summary is not None
+            and summary.last_date == latest['date'] and summary.last_close == latest['close']):
+        return None
+
+    # 一次取出 52 週資料，其餘統計皆由此計算
+    year_rows = list(
+        StockPrice.objects.filter(stock=stock).between(start=latest['date'] - timedelta(days=364), end=latest['date'])
+        .order_by('date')
+        .values_list('close', 'high', 'low', 'volume')
+    )
+    recent = year_rows[-SPARKLINE_POINTS:]
+    recent_closes = [float(row[0]) for row in recent]
+    recent_volumes = [row[3] for row in recent if row[3] is not None]
+
+    defaults = {
+        'last_date': latest['date'],
+        'last_close': latest['close'],
+        'recent_closes': recent_closes,
+        'sparkline_svg': build_sparkline_path(recent_closes),
+        'high_52w': max(row[1] for row in year_rows),
+        'low_52w': min(row[2] for row in year_rows),
+        'last_volume': recent[-1][3],
+        'avg_volume_20': int(sum(recent_volumes) / len(recent_volumes)) if recent_volumes else None,
+    }
+    summary, _ = StockSummary.objects.update_or_create(stock=stock, defaults=defaults)
+    return summary
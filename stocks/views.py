@@ -1,12 +1,65 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
 from django.core.paginator import Paginator
 from .models import Stock, Watchlist, StockPrice
-from .tasks import fetch_stock_data
-from .utils import verify_ticker
+from .tasks import fetch_stock_data, schedule_sentiment_warmup, schedule_intraday_updates
+from .utils import verify_ticker, get_recent_closes, build_sparkline_path, FLAT_SPARKLINE
+from .market_calendar import is_market_open, next_market_open
+from .charting import (
+    RANGE_DAYS, RESOLUTIONS, CHART_TYPES, DEFAULT_MAX_POINTS, MAX_POINTS_LIMIT, get_chart_data
+)
+from .indicators import INDICATOR_FIELDS
+from .intraday import get_intraday_series
+from .quotes import get_quote, get_quotes, format_quote_time
 import json
 
+def _watchlist_page(request):
+    """
+    依 per_page / sort_by / sort_order / page 參數取得使用者追蹤清單的當前頁（儀表板與批次報價 API 共用）
+
+    Returns:
+        tuple: (page_obj, per_page, sort_by, sort_order)
+    """
+    # === 分頁數量與排序參數處理 ===
+    per_page = request.GET.get('per_page', '10')
+    try:
+        per_page = int(per_page)
+        if per_page not in [10, 20, 50]:
+            per_page = 10
+    except ValueError:
+        per_page = 10
+    
+    sort_by = request.GET.get('sort_by', 'id')
+    sort_order = request.GET.get('sort_order', 'desc')
+    
+    # 定義可排序欄位映射
+    sort_field_mapping = {
+        'ticker': 'stock__ticker',
+        'name': 'stock__name',
+        'change_percent': 'stock__change_percent',
+        'last_price': 'stock__last_price',
+        'id': 'id'
+    }
+    
+    order_field = sort_field_mapping.get(sort_by, 'id')
+    if sort_order == 'desc':
+        order_field = f'-{order_field}'
+    
+    user_watchlist_qs = (
+        Watchlist.objects.filter(user=request.user)
+        .select_related('stock', 'stock__summary')
+        .order_by(order_field)
+    )
+
+    # Pagination - 使用動態 per_page
+    paginator = Paginator(user_watchlist_qs, per_page)
+    page_number = request.GET.get('page')
+    page_obj = paginator.get_page(page_number)
+    return page_obj, per_page, sort_by, sort_order
+
+
 @login_required
 def dashboard(request):
     if request.method == 'POST':
@@ -58,98 +111,42 @@ def dashboard(request):
 
         return redirect('dashboard')
 
-    # === 分頁數量與排序參數處理 ===
-    per_page = request.GET.get('per_page', '10')
-    try:
-        per_page = int(per_page)
-        if per_page not in [10, 20, 50]:
-            per_page = 10
-    except ValueError:
-        per_page = 10
-    
-    sort_by = request.GET.get('sort_by', 'id')
-    sort_order = request.GET.get('sort_order', 'desc')
-    
-    # 定義可排序欄位映射
-    sort_field_mapping = {
-        'ticker': 'stock__ticker',
-        'name': 'stock__name',
-        'change_percent': 'stock__change_percent',
-        'last_price': 'stock__last_price',
-        'id': 'id'
-    }
-    
-    order_field = sort_field_mapping.get(sort_by, 'id')
-    if sort_order == 'desc':
-        order_field = f'-{order_field}'
-    
-    user_watchlist_qs = Watchlist.objects.filter(user=request.user).select_related('stock').order_by(order_field)
-
-    # Pagination - 使用動態 per_page
-    paginator = Paginator(user_watchlist_qs, per_page)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj, per_page, sort_by, sort_order = _watchlist_page(request)
 
     # --- REAL DATA FETCHING for current page ---
-    stock_data_for_chart = {}
+    # Sparkline 直接取自 StockSummary（由資料抓取流程預先計算並隨 watchlist 查詢一併 join）
+    # 尚未建立摘要的股票才以單一視窗查詢補取最近收盤價
+    # 完整 K 線資料改由詳細頁/圖表 API 按需載入，不再嵌入儀表板 HTML
+    page_items = list(page_obj)
     loading_stocks = set()  # Track stocks that are still loading
-    
-    for item in page_obj:
-        # Calculate Trading Status
-        item.stock.is_trading = is_market_open(item.stock.market)
-
-        # Fetch prices from DB (limit to last 365 days or reasonable amount for sparkline/chart)
-        prices_qs = StockPrice.objects.filter(stock=item.stock).order_by('date')
-
-        prices_list = []
-        for price in prices_qs:
-            prices_list.append({
-                'date': price.date.strftime('%Y-%m-%d'),
-                'open': float(price.open),
-                'high': float(price.high),
-                'low': float(price.low),
-                'close': float(price.close),
-            })
+    market_status = {}
+
+    missing_summary = [item for item in page_items if not hasattr(item.stock, 'summary')]
+    recent_closes = get_recent_closes(item.stock_id for item in missing_summary)
+
+    for item in page_items:
+        # Calculate Trading Status (once per market per request)
+        market = item.stock.market
+        if market not in market_status:
+            market_status[market] = is_market_open(market)
+        item.stock.is_trading = market_status[market]
+
+        if hasattr(item.stock, 'summary'):
+            item.sparkline_svg = item.stock.summary.sparkline_svg
+            continue
 
-        if prices_list:
-             stock_data_for_chart[item.stock.ticker] = prices_list
-             
-             # Generate Sparkline SVG Path (Server-side)
-             # Use last 20 points for trend
-             recent_closes = [p['close'] for p in prices_list[-20:]]
-             if len(recent_closes) > 1:
-                 min_price = min(recent_closes)
-                 max_price = max(recent_closes)
-                 price_range = max_price - min_price if max_price != min_price else 1
-                 
-                 # SVG Dimensions: 100x40
-                 width = 100
-                 height = 40
-                 step_x = width / (len(recent_closes) - 1)
-                 
-                 path_cmds = []
-                 for i, price in enumerate(recent_closes):
-                     x = i * step_x
-                     # Invert Y because SVG 0 is top
-                     y = height - ((price - min_price) / price_range * height)
-                     # Add spacing margin (5px)
-                     y = 5 + (y * 0.8) 
-                     
-                     cmd = "M" if i == 0 else "L"
-                     path_cmds.append(f"{cmd} {x:.1f} {y:.1f}")
-                 
-                 item.sparkline_svg = " ".join(path_cmds)
-             else:
-                 item.sparkline_svg = "M 0 20 L 100 20" # Flat line if not enough data
+        closes = recent_closes.get(item.stock_id)
+        if closes:
+            item.sparkline_svg = build_sparkline_path(closes)
         else:
             # Stock has no price data yet - mark as loading
             loading_stocks.add(item.stock.ticker)
-            item.sparkline_svg = "M 0 20 L 100 20"
+            item.sparkline_svg = FLAT_SPARKLINE
 
     context = {
         'watchlist': page_obj, # Pass page_obj as watchlist for iteration
-        'stock_data_json': json.dumps(stock_data_for_chart),
         'loading_stocks_json': json.dumps(list(loading_stocks)),
+        'any_trading': any(market_status.values()),
         # 分頁與排序參數
         'per_page': per_page,
         'sort_by': sort_by,
@@ -181,10 +178,14 @@ def refresh_all_stocks(request):
         # Check models.py: stock = models.ForeignKey(..., related_name='watchers')
         user_stocks = Stock.objects.filter(watchers__user=request.user).distinct()
         count = user_stocks.count()
+
+        # 在每小時的新聞更新前預先載入情緒模型
+        schedule_sentiment_warmup(repeat=3600)
+        schedule_intraday_updates()
         
         for stock in user_stocks:
-            # Schedule to run immediately (0) and repeat every hour (3600 seconds)
-            fetch_stock_data(stock.ticker, schedule=0, repeat=3600)
+            # Schedule to run immediately (0) and repeat every hour (3600 seconds)；休市日的定期更新會略過
+            fetch_stock_data(stock.ticker, trading_days_only=True, schedule=0, repeat=3600)
 
         messages.success(request, f'已開始更新您的 {count} 支追蹤股票，並設定為每小時自動更新。')
     
@@ -194,71 +195,28 @@ import yfinance as yf
 import pandas as pd
 import numpy as np
 from datetime import datetime
-import pytz
-from deep_translator import GoogleTranslator
 from django.http import JsonResponse
 import feedparser
 import time
 import requests
 
-# Helper for Market Open Status
-def is_market_open(market):
-    now = datetime.now(pytz.utc)
-    
-    if market == 'US':
-        # US: 09:30 - 16:00 ET (UTC-5 or UTC-4)
-        tz = pytz.timezone('US/Eastern')
-        now_local = now.astimezone(tz)
-        if now_local.weekday() >= 5: return False # Weekend
-        start = now_local.replace(hour=9, minute=30, second=0, microsecond=0)
-        end = now_local.replace(hour=16, minute=0, second=0, microsecond=0)
-        return start <= now_local <= end
-    elif market == 'TW':
-        # TW: 09:00 - 13:30 MST (UTC+8)
-        tz = pytz.timezone('Asia/Taipei')
-        now_local = now.astimezone(tz)
-        if now_local.weekday() >= 5: return False
-        start = now_local.replace(hour=9, minute=0, second=0, microsecond=0)
-        end = now_local.replace(hour=13, minute=30, second=0, microsecond=0)
-        return start <= now_local <= end
-    return False
-
 @login_required
 def stock_detail(request, ticker):
     stock = get_object_or_404(Stock, ticker=ticker)
     
     # Fast render: Basic DB data
-    latest_price = stock.prices.order_by('-date').first()
-    recent_prices = stock.prices.order_by('-date')[:5]
-    
-    # --- Emergency Fix: Clean Dirty DB Description on Load ---
-    if stock.description:
-        def is_chinese(text):
-            return any('\u4e00' <= char <= '\u9fff' for char in text)
-
-        raw_desc = stock.description
-        paragraphs = [p.strip() for p in raw_desc.split('\n') if p.strip()]
-        
-        # Check if we have mixed content (Dirty)
-        has_chinese = any(is_chinese(p) for p in paragraphs)
-        if has_chinese:
-             # Filter out non-Chinese paragraphs to remove the English duplication
-             cn_paragraphs = [p for p in paragraphs if is_chinese(p)]
-             clean_desc = "\n\n".join(cn_paragraphs)
-             
-             # If we actually changed something (length reduced), Update DB
-             if len(clean_desc) < len(raw_desc):
-                  stock.description = clean_desc
-                  stock.save()
-                  print(f"cleaned description for {stock.ticker}")
-    # ---------------------------------------------------------
+    recent_prices = stock.prices.latest_bars(5)
+    latest_price = recent_prices[0] if recent_prices else None
 
+    # 下次開盤時間以市場當地時間顯示
+    next_open = next_market_open(stock.market)
     context = {
         'stock': stock,
         'latest_price': latest_price, # Restore this
         'recent_prices': recent_prices, # For the table
         'page_title': f"{stock.ticker} - 詳細資訊",
-        'is_trading': is_market_open(stock.market)
+        'is_trading': is_market_open(stock.market),
+        'next_open': next_open.strftime('%m/%d %H:%M') if next_open else None,
     }
     return render(request, 'stock_detail.html', context)
 
@@ -272,37 +230,32 @@ def stock_detail_api(request, ticker):
     # 1. Fetch Data from Yahoo Finance
     yf_ticker = yf.Ticker(stock.ticker)
     
-    # Intraday (1d, 5m)
-    hist_intraday = yf_ticker.history(period="1d", interval="5m")
-    intraday_data = []
-    if not hist_intraday.empty:
-        # localized timestamps to string
-        for index, row in hist_intraday.iterrows():
-             close_val = row['Close']
-             if pd.isna(close_val): 
-                 close_val = None
-             
-             intraday_data.append([
-                 row.name.strftime('%H:%M'),
-                 close_val
-             ])
+    # Intraday (latest session, 5m) - 由背景任務預先寫入 IntradayBar，不在每次瀏覽時呼叫 Yahoo
+    intraday_data = get_intraday_series(stock)
 
     # Historical (5y) - Used for Candle + RSI
-    hist_5y = yf_ticker.history(period="5y")
-    stock_data_list = []
-    if not hist_5y.empty:
-        for index, item in hist_5y.iterrows():
-            def san(val):
-                return None if pd.isna(val) else val
-
-            stock_data_list.append([
-                item.name.strftime('%Y-%m-%d'),
-                san(item['Open']),
-                san(item['Close']),
-                san(item['Low']),
-                san(item['High']),
-                san(item['Volume'])
-            ])
+    # 優先使用資料庫中的日 K；新加入尚未抓完的股票才向 Yahoo 取資料
+    # 詳細頁固定顯示日 K：5 年的交易日數少於區間曆日數，以曆日數作為點數上限就不會被聚合成週 K
+    chart = get_chart_data(stock, range_key='5y', resolution='D', max_points=RANGE_DAYS['5y'],
+                           indicators=['sma5', 'sma20', 'rsi14'])
+    stock_data_list = chart['data']
+    # 前一交易日收盤價直接取最近兩根日 K，不依賴圖表序列
+    recent_bars = stock.prices.latest_bars(2)
+    if not stock_data_list:
+        hist_5y = yf_ticker.history(period="5y")
+        if not hist_5y.empty:
+            for index, item in hist_5y.iterrows():
+                def san(val):
+                    return None if pd.isna(val) else val
+
+                stock_data_list.append([
+                    item.name.strftime('%Y-%m-%d'),
+                    san(item['Open']),
+                    san(item['Close']),
+                    san(item['Low']),
+                    san(item['High']),
+                    san(item['Volume'])
+                ])
 
     # 2. News Handling - 從 DB 讀取
     from .models import StockNews
@@ -332,51 +285,8 @@ def stock_detail_api(request, ticker):
     # (移除原本的即時抓取與情緒分析代碼)
 
 
-    # 3. Description Handling (Robust Cleaning)
-    description_zh = "暫無描述"
-    
-    # helper to check if text is chinese
-    def is_chinese(text):
-        for char in text:
-            if '\u4e00' <= char <= '\u9fff':
-                return True
-        return False
-
-    try:
-        # Prefer fresh YF data if available
-        raw_desc = None
-        try:
-            info = yf_ticker.info
-            raw_desc = info.get('longBusinessSummary') or info.get('description')
-        except:
-            pass
-        
-        if not raw_desc:
-            raw_desc = stock.description
-
-        if raw_desc:
-             # Strategy: Split by newlines. If we have Chinese paragraphs, use them. 
-             # If strictly English, translate.
-             
-             paragraphs = [p.strip() for p in raw_desc.split('\n') if p.strip()]
-             cn_paragraphs = [p for p in paragraphs if is_chinese(p)]
-             
-             if cn_paragraphs:
-                 # We have Chinese parts. Assume these are the translations.
-                 # Filter out strictly English parts to avoid duplication.
-                 description_zh = "\n\n".join(cn_paragraphs)
-             else:
-                 # No Chinese found. Needs translation.
-                 translator = GoogleTranslator(source='auto', target='zh-TW')
-                 limit = 4999
-                 if len(raw_desc) > limit:
-                      description_zh = translator.translate(raw_desc[:limit])
-                 else:
-                      description_zh = translator.translate(raw_desc)
-
-    except Exception as e:
-        print(f"Error handling description: {e}")
-        description_zh = stock.description if stock.description else "暫無描述"
+    # 3. Description - 資料抓取時已正規化並翻譯（stocks/descriptions.py），此處只讀取
+    description_zh = stock.description_zh or stock.description or "暫無描述"
 
     # 4. 三大法人資料（僅台股）
     institutional_data = None  # None 表示此市場不支援
@@ -469,81 +379,221 @@ def stock_detail_api(request, ticker):
     return JsonResponse({
         'intraday_data': intraday_data,
         'historical_data': stock_data_list,
+        'indicators': chart.get('indicators') if chart['data'] else None,
         'news': news_list,
         'description': description_zh,
         'current_price': stock_data_list[-1][2] if stock_data_list else 0,
-        'prev_close': stock_data_list[-2][2] if len(stock_data_list) > 1 else 0,
+        'prev_close': (float(recent_bars[1].close) if len(recent_bars) > 1
+                       else stock_data_list[-2][2] if len(stock_data_list) > 1 else 0),
         'institutional_investors': institutional_data,
         'financial_data': financial_data,
     })
 
+@login_required
+def chart_data_api(request, ticker):
+    """
+    按需提供圖表資料（伺服器端降採樣）
+
+    Query params:
+        range: 1m, 3m, 6m, 1y, 2y, 5y, max（預設 1y）
+        resolution: D, W, M（預設 D）
+        type: candle 或 line（預設 candle）
+        max_points: 回傳點數上限（預設 800，最多 5000）；K 線超過上限時改用較粗的週期，
+            實際週期見回應中的 resolution
+        indicators: 逗號分隔的技術指標欄位，例如 sma20,rsi14,macd
+    """
+    stock = get_object_or_404(Stock, ticker=ticker)
+
+    range_key = request.GET.get('range', '1y').lower()
+    resolution = request.GET.get('resolution', 'D').upper()
+    chart_type = request.GET.get('type', 'candle').lower()
+    try:
+        max_points = int(request.GET.get('max_points', DEFAULT_MAX_POINTS))
+    except ValueError:
+        return JsonResponse({'error': 'max_points must be an integer'}, status=400)
+
+    if range_key not in RANGE_DAYS:
+        return JsonResponse({'error': f'range must be one of {list(RANGE_DAYS)}'}, status=400)
+    if resolution not in RESOLUTIONS:
+        return JsonResponse({'error': f'resolution must be one of {list(RESOLUTIONS)}'}, status=400)
+    if chart_type not in CHART_TYPES:
+        return JsonResponse({'error': f'type must be one of {list(CHART_TYPES)}'}, status=400)
+    max_points = max(3, min(max_points, MAX_POINTS_LIMIT))
+
+    indicators = [f.strip() for f in request.GET.get('indicators', '').split(',') if f.strip()]
+    unknown = [f for f in indicators if f not in INDICATOR_FIELDS]
+    if unknown:
+        return JsonResponse({'error': f'unknown indicators {unknown}; choose from {INDICATOR_FIELDS}'}, status=400)
+
+    chart = get_chart_data(stock, range_key=range_key, resolution=resolution,
+                           max_points=max_points, chart_type=chart_type, indicators=indicators)
+    return JsonResponse({
+        'ticker': stock.ticker,
+        'range': range_key,
+        'resolution': resolution,
+        'type': chart_type,
+        'max_points': max_points,
+        **chart,
+    })
+
 @login_required
 def get_latest_price(request, ticker):
     try:
         stock = Stock.objects.get(ticker=ticker)
-        
-        # Try to get real-time info from yfinance directly for "Watching" status
-        # Note: This might be slow if called frequently.
-        # Ideally, use the DB values updated by background task, 
-        # BUT user asked for "Real-time" view on detail page.
-        # Let's try to fetch live just for this single call.
-        yf_ticker = yf.Ticker(stock.ticker)
-        info = yf_ticker.info
-        current_price = info.get('currentPrice') or info.get('regularMarketPrice')
-        previous_close = info.get('regularMarketPreviousClose')
-
-        if current_price and previous_close:
-             change = current_price - previous_close
-             change_pct = (change / previous_close) * 100
-             
-             # Optionally update DB
-             stock.last_price = current_price
-             stock.change = change
-             stock.change_percent = change_pct
-             stock.save()
-
-             return JsonResponse({
-                 'price': current_price,
-                 'change': round(change, 2),
-                 'change_percent': round(change_pct, 2),
-                 'timestamp': datetime.now().strftime('%H:%M:%S')
-             })
-        
-        # Fallback to DB
+
+        # 報價由跨 worker 共用的快取提供：新鮮期內不呼叫上游，過期後每支股票只由一個請求更新
+        quote = get_quote(stock)
         return JsonResponse({
-             'price': stock.last_price,
-             'change': stock.change,
-             'change_percent': stock.change_percent,
-             'timestamp': datetime.now().strftime('%H:%M:%S')
+            'price': quote['price'],
+            'change': quote['change'],
+            'change_percent': quote['change_percent'],
+            'timestamp': format_quote_time(quote),
+            'stale': quote['stale'],
         })
 
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
 @login_required
-def check_loading_status(request):
+def batch_quotes_api(request):
+    """
+    Batch quotes for ?tickers=AAPL,2330.TW or for the current watchlist page
+    (?page=N&per_page=&sort_by=&sort_order=, same parameters as the dashboard).
+    Cache misses are refreshed with one multi-symbol upstream request.
+    """
+    from django.conf import settings
+
+    raw = request.GET.get('tickers', '')
+    if raw:
+        tickers = list(dict.fromkeys(t.strip() for t in raw.split(',') if t.strip()))
+        max_tickers = getattr(settings, 'QUOTE_BATCH_MAX_TICKERS', 50)
+        if len(tickers) > max_tickers:
+            return JsonResponse({'error': f'At most {max_tickers} tickers per request'}, status=400)
+        stocks = list(Stock.objects.filter(ticker__in=tickers))
+    else:
+        page_obj, _, _, _ = _watchlist_page(request)
+        stocks = [item.stock for item in page_obj]
+
+    quotes = get_quotes(stocks)
+    return JsonResponse({
+        'quotes': {
+            ticker: {
+                'price': quote['price'],
+                'change': quote['change'],
+                'change_percent': quote['change_percent'],
+                'timestamp': format_quote_time(quote),
+                'stale': quote['stale'],
+            }
+            for ticker, quote in quotes.items()
+        },
+    })
+
+@login_required
+def quote_stream(request):
+    """
+    SSE endpoint: pushes quote updates for ?tickers=AAPL,2330.TW while the connection is open.
+    Only available when served via ASGI (the async event stream is consumed on the server's event loop);
+    under WSGI the client falls back to polling get_latest_price.
+    """
+    from django.conf import settings
+    from django.core.handlers.asgi import ASGIRequest
+    from django.http import StreamingHttpResponse
+    from .streaming import QuoteEventStream
+
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'error': 'Streaming requires the ASGI server'}, status=503)
+
+    tickers = list(dict.fromkeys(t.strip() for t in request.GET.get('tickers', '').split(',') if t.strip()))
+    if not tickers:
+        return JsonResponse({'error': 'tickers is required'}, status=400)
+    max_tickers = getattr(settings, 'QUOTE_STREAM_MAX_TICKERS', 50)
+    if len(tickers) > max_tickers:
+        return JsonResponse({'error': f'At most {max_tickers} tickers per stream'}, status=400)
+
+    response = StreamingHttpResponse(QuoteEventStream(tickers), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # 關閉 nginx 緩衝，事件才會即時送達
+    return response
+
+@login_required
+async def check_loading_status(request):
     """
     API endpoint to check if stocks have finished loading their data.
-    Returns which stocks now have price data available.
+    Long-poll: with {"wait": N} the request blocks (up to LOADING_WAIT_TIMEOUT seconds)
+    until the ingestion task signals completion for any listed ticker.
+    Async so that a waiting request does not hold a worker thread under ASGI.
     """
     import json
-    
+    from django.conf import settings
+    from .loading import wait_for_ready
+
     if request.method == 'POST':
         try:
             body = json.loads(request.body)
-            tickers = body.get('tickers', [])
-            
-            ready = []
-            for ticker in tickers:
-                try:
-                    stock = Stock.objects.get(ticker=ticker)
-                    if stock.last_price is not None or stock.prices.exists():
-                        ready.append(ticker)
-                except Stock.DoesNotExist:
-                    pass
-            
-            return JsonResponse({'ready': ready, 'pending': [t for t in tickers if t not in ready]})
+            tickers = list(dict.fromkeys(body.get('tickers', [])))
+            wait = min(float(body.get('wait', 0)), getattr(settings, 'LOADING_WAIT_TIMEOUT', 25))
+
+            ready, failed = await wait_for_ready(tickers, timeout=max(wait, 0))
+            done = set(ready) | set(failed)
+            return JsonResponse({
+                'ready': ready,
+                'failed': failed,
+                'pending': [t for t in tickers if t not in done],
+            })
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=400)
-    
+
     return JsonResponse({'error': 'POST required'}, status=405)
+
+@staff_member_required
+def fetch_runs_report(request):
+    """
+    Staff view: slowest tickers and ingestion stages over the last ?hours= (default 24),
+    from the FetchRun history written by fetch_stock_data_sync.
+    """
+    from .fetch_runs import report
+
+    try:
+        hours = min(max(int(request.GET.get('hours', 24)), 1), 24 * 7)
+    except ValueError:
+        hours = 24
+    return render(request, 'fetch_runs.html', {'report': report(hours=hours), 'hours': hours})
+
+def metrics_endpoint(request):
+    """
+    Prometheus scrape endpoint (/metrics): web and worker metrics merged from METRICS_DIR.
+    Denied by default: allowed with "Authorization: Bearer <METRICS_TOKEN>", for staff users,
+    or from addresses listed in METRICS_ALLOWED_IPS.
+    """
+    from django.conf import settings
+    from django.http import HttpResponse
+    from django.utils.crypto import constant_time_compare
+    from . import metrics
+
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    allowed = (
+        (token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'))
+        or request.user.is_staff
+        or request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', ())
+    )
+    if not allowed:
+        return JsonResponse({'error': 'Unauthorized'}, status=401)
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@staff_member_required
+def profile_artifact(request, name):
+    """
+    Staff view: download a stored request profile (<id>.folded collapsed stacks or <id>.json details).
+    The id is reported in the X-Profile response header of a profiled request.
+    """
+    from django.conf import settings
+    from django.http import FileResponse, Http404
+    from pathlib import Path
+    from .profiling import ARTIFACT_NAME_RE
+
+    directory = Path(getattr(settings, 'PROFILER_DIR', 'profiles'))
+    path = directory / name if ARTIFACT_NAME_RE.match(name) else None
+    if path is None or not path.exists():
+        raise Http404('Profile not found')
+    content_type = 'application/json' if name.endswith('.json') else 'text/plain; charset=utf-8'
+    return FileResponse(open(path, 'rb'), content_type=content_type, as_attachment=name.endswith('.folded'))